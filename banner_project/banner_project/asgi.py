@@ -11,6 +11,8 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'banner_project.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'banner_project.settings.prod')
+# Под ASGI страницы баннеров обслуживают асинхронные вьюхи (banners/async_views.py)
+os.environ.setdefault('BANNER_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
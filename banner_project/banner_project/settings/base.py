@@ -46,6 +46,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым — чтобы total в Server-Timing покрывал весь запрос
+    'banners.profiling.ProfilingMiddleware',
+    'banners.metrics.MetricsMiddleware',
+    # До сессий: чтение сессии и пользователя тоже идёт с реплики
+    'banners.db_router.DatabaseRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,7 +87,7 @@ WSGI_APPLICATION = 'banner_project.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('BANNER_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
     }
     # 'default': {
     #     'ENGINE': 'djongo',
@@ -93,6 +98,46 @@ DATABASES = {
     # }
 }
 
+# Реплика для чтения страниц (см. banners/db_router.py). Локально это второй
+# файл SQLite, который обновляет `manage.py sync_sqlite_replica`; без
+# BANNER_SQLITE_REPLICA_PATH чтение с реплики выключено
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': os.environ.get('BANNER_SQLITE_REPLICA_PATH', DATABASES['default']['NAME']),
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_ROUTERS = ['banners.db_router.ReplicaRouter']
+BANNER_DB_ROUTING = {
+    'READ_ALIAS': 'replica' if os.environ.get('BANNER_SQLITE_REPLICA_PATH') else None,
+    # Сколько секунд после записи из POST посетитель читает основную базу
+    'STICKY_SECONDS': 10,
+    'STICKY_COOKIE': 'banner_db_primary',
+    # Чтения этих вьюх идут через свой алиас, если он есть в DATABASES
+    'VIEW_ALIASES': {'banner_redirect': 'redirect', 'banner_redirect_token': 'redirect'},
+    # {имя URL: мс} — statement_timeout сессии default на время вьюхи (только PostgreSQL)
+    'STATEMENT_TIMEOUTS': {},
+}
+
+# Профиль SQLite для нескольких воркеров (включается в prod.py). PRAGMA
+# выполняются на каждом новом соединении: WAL — читатели не ждут писателя,
+# synchronous=NORMAL — без fsync на каждый коммит (в WAL это безопасно для
+# целостности), mmap — чтение без копирования через page cache.
+# IMMEDIATE берёт блокировку записи в начале транзакции: иначе два читателя,
+# одновременно начавшие писать, получают "database is locked" сразу, не
+# дожидаясь busy_timeout.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+SQLITE_SERVING_OPTIONS = {
+    'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -132,4 +177,95 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
-STATIC_ROOT = BASE_DIR / 'staticfiles'
\ No newline at end of file
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Счётчики просмотров/кликов баннеров (см. banners/counters.py).
+# В dev и тестах пишем сразу, в проде — буферизуем.
+BANNER_COUNTERS = {
+    'MODE': 'sync',
+    'FLUSH_INTERVAL': 5.0,
+    'MAX_PENDING': 1000,
+    # 'counters' — сразу в поля views/clicks, 'events' — в журнал событий,
+    # который сворачивает `manage.py rollup_banner_events`
+    'STORE': 'counters',
+    # Свёртка не трогает события моложе стольких секунд — их транзакции могут быть ещё открыты
+    'SETTLE_SECONDS': 10.0,
+}
+
+# Выбор заголовка/картинки баннера (см. banners/creatives.py, banners/bandits.py).
+# Политики: 'legacy', 'thompson', 'ucb1'. OWNER_POLICIES — {owner_id: политика}.
+BANNER_SELECTION = {
+    'DEFAULT_POLICY': 'legacy',
+    'OWNER_POLICIES': {},
+    'STATS_TTL': 60.0,
+    # Бандиты учат на CreativeStats за столько последних дней; None — за всё время
+    'STATS_WINDOW_DAYS': None,
+}
+
+# Битовый индекс тегов баннеров (см. banners/tag_index.py)
+BANNER_TAG_INDEX = {
+    'INCREMENTAL': True,
+    'MAX_CHANGES': 5000,
+    'REBUILD_INTERVAL': 600.0,
+}
+
+# Лента главной страницы (см. banners/feed.py)
+BANNER_FEED = {
+    'PAGE_SIZE': 30,
+    'REBUILD_INTERVAL': 300.0,
+}
+
+# Уменьшенные копии картинок баннеров (см. banners/renditions.py): строятся
+# после загрузки пулом из WORKERS процессов; 0 — в текущем процессе
+BANNER_RENDITIONS = {
+    'ENABLED': True,
+    'WIDTHS': (320, 640, 1280),
+    'FORMATS': ('avif', 'webp'),
+    'QUALITY': {'avif': 60, 'webp': 80},
+    'UPLOAD_TO': 'banner_renditions/',
+    'WORKERS': 2,
+    'MAX_PENDING': 100,
+}
+
+# Кэш оболочек страниц статей в памяти воркера (см. banners/render_cache.py)
+BANNER_RENDER_CACHE = {
+    'ENABLED': True,
+    'MAX_BYTES': 32 * 1024 * 1024,
+}
+
+# Подпись «N минут назад» у баннеров (см. banners/timers.py):
+# 'cookie' — хэш от id посетителя без записи в сессию, 'session' — как раньше
+BANNER_TIMERS = {
+    'MODE': 'cookie',
+    'COOKIE_NAME': 'banner_visitor',
+    'COOKIE_MAX_AGE': 365 * 24 * 3600,
+}
+
+# Профилирование запросов по фазам (см. banners/profiling.py): заголовок
+# Server-Timing и выборочный JSON-лог в логгер banners.profiling
+BANNER_PROFILING = {
+    'ENABLED': os.environ.get('BANNER_PROFILING') == '1',
+    'SAMPLE_RATE': 0.01,
+    'SERVER_TIMING': True,
+    'PHASE_NAMES': {},
+}
+
+# Метрики Prometheus на /internal/metrics/ (см. banners/metrics.py).
+# 'local' — метрики одного процесса, 'file' — снимки всех воркеров в DIRECTORY
+BANNER_METRICS = {
+    'MODE': 'local',
+    'DIRECTORY': os.environ.get('BANNER_METRICS_DIR', '/var/tmp/banner_project_metrics'),
+    'WRITE_INTERVAL': 1.0,
+    'ALLOWED_IPS': ['127.0.0.1', '::1'],
+    'TOKEN': os.environ.get('BANNER_METRICS_TOKEN', ''),
+}
+
+# Токены ссылок /go/<token>/ (см. banners/click_tokens.py): через MAX_AGE
+# секунд переход ещё работает, но клик не засчитывается
+BANNER_CLICK_TOKENS = {
+    'MAX_AGE': 24 * 3600,
+}
+
+# Асинхронные версии страниц (banners/async_views.py) для запуска под ASGI.
+# asgi.py включает их сам, под WSGI остаются синхронные.
+BANNER_ASYNC_VIEWS = os.environ.get('BANNER_ASYNC_VIEWS') == '1'
@@ -1,5 +1,44 @@
 from .base import *
+from .postgres import postgres_databases, serving_statement_timeouts
 
 
 ALLOWED_HOSTS = ['publicationinfo.online']
-CSRF_TRUSTED_ORIGINS = ['https://publicationinfo.online']
\ No newline at end of file
+CSRF_TRUSTED_ORIGINS = ['https://publicationinfo.online']
+
+if os.environ.get('BANNER_DATABASE_URL'):
+    # PostgreSQL: постоянные соединения или пул, таймауты запросов и
+    # отдельный алиас для переходов (см. settings/postgres.py)
+    DATABASES = postgres_databases(os.environ)
+    if 'replica' in DATABASES:
+        BANNER_DB_ROUTING = {**BANNER_DB_ROUTING, 'READ_ALIAS': 'replica'}
+    else:
+        # Реплики нет — страницы читают основную базу, но с таймаутом страниц
+        BANNER_DB_ROUTING = {**BANNER_DB_ROUTING, 'STATEMENT_TIMEOUTS': serving_statement_timeouts(os.environ)}
+else:
+    # SQLite с WAL и busy_timeout; счётчики пишет только фоновый поток
+    # каждого воркера (MODE buffered, см. banners/counters.py)
+    DATABASES = {
+        **DATABASES,
+        'default': {**DATABASES['default'], 'OPTIONS': SQLITE_SERVING_OPTIONS},
+        'replica': {**DATABASES['replica'], 'OPTIONS': SQLITE_SERVING_OPTIONS},
+    }
+
+BANNER_COUNTERS = {
+    **BANNER_COUNTERS,
+    'MODE': 'buffered',
+}
+
+# Общий для всех воркеров gunicorn кэш: через него расходятся версии
+# in-memory индексов (banners/invalidation.py)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('BANNER_CACHE_DIR', '/var/tmp/banner_project_cache'),
+    }
+}
+
+# Несколько воркеров gunicorn — метрики складываются из их снимков на диске
+BANNER_METRICS = {
+    **BANNER_METRICS,
+    'MODE': 'file',
+}
@@ -11,6 +11,7 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'banner_project.settings')
+# Как и asgi.py: точки входа сервера по умолчанию берут продовые настройки
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'banner_project.settings.prod')
 
 application = get_wsgi_application()
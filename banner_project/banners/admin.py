@@ -1,10 +1,19 @@
 from django import forms
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin as DefaultUserAdmin
 from django.contrib.auth.models import Group
 from django.contrib.auth.admin import GroupAdmin as DefaultGroupAdmin
+from django.core.exceptions import PermissionDenied
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
 from django.forms import ModelForm
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
+from . import catalog_io
 from .models import (
     Banner, Article, BannerImage, BannerTitle,
     Tag, WrittenArticle, Language
@@ -83,14 +92,43 @@ class GroupAdmin(DefaultGroupAdmin):
 # ------------------------------------------------
 # 3) Inline для Banner
 # ------------------------------------------------
-class BannerImageInline(admin.TabularInline):
-    model = BannerImage
+def _count(model):
+    """Подзапрос с числом креативов баннера — без JOIN, который размножил бы строки."""
+    counts = model.objects.filter(banner=OuterRef('pk')).order_by().values('banner').annotate(n=Count('pk'))
+    return Coalesce(Subquery(counts.values('n'), output_field=IntegerField()), 0)
+
+
+class CreativeInline(admin.TabularInline):
     extra = 1
 
+    def get_queryset(self, request):
+        # __str__ креатива, который выводится в строке, обращается к баннеру
+        return super().get_queryset(request).select_related('banner')
+
 
-class BannerTitleInline(admin.TabularInline):
+class BannerImageInline(CreativeInline):
+    model = BannerImage
+
+
+class BannerTitleInline(CreativeInline):
     model = BannerTitle
-    extra = 1
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if db_field.name == 'language':
+            # Без этого каждая строка inline заново читает список языков
+            if not hasattr(request, '_language_choices'):
+                request._language_choices = list(formfield.choices)
+            formfield.choices = request._language_choices
+        return formfield
+
+
+CATALOG_CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson'}
+
+
+class CatalogImportForm(forms.Form):
+    file = forms.FileField(label='Файл')
+    format = forms.ChoiceField(label='Формат', choices=[(fmt, fmt.upper()) for fmt in catalog_io.FORMATS])
 
 
 # ------------------------------------------------
@@ -100,20 +138,60 @@ class BannerTitleInline(admin.TabularInline):
 class BannerAdmin(OwnedAdmin):
     exclude = ('verticals',)
     inlines = [BannerTitleInline, BannerImageInline]
-    list_display = ('title', 'description', 'get_tags', 'owner')
-    filter_horizontal = ('tags',)
-    actions = ['create_sample_banner']
+    list_display = ('title', 'description', 'get_tags', 'titles_count', 'images_count', 'owner')
+    list_select_related = ('owner',)
+    search_fields = ('title',)
+    # Теги и владельцы подгружаются поиском, а не списком на всю базу
+    autocomplete_fields = ('tags', 'owner')
+    actions = ['create_sample_banner', 'export_catalog_csv', 'export_catalog_jsonl']
+    # Больше креативов — вместо inline-форм ссылки на их постраничные списки
+    inline_limit = 50
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            titles_count=_count(BannerTitle),
+            images_count=_count(BannerImage),
+        ).prefetch_related(Prefetch('tags', queryset=Tag.objects.order_by('name')))
 
     def get_fields(self, request, obj=None):
-        fields = ['title', 'description', 'link_url', 'tags', 'clicks', 'views']
+        fields = ['title', 'description', 'link_url', 'tags', 'selection_policy', 'weight', 'clicks', 'views']
+        if self._creatives_over_limit(obj):
+            fields.append('creatives')
         if request.user.is_superuser:
             fields.append('owner')
         return fields
 
     def get_readonly_fields(self, request, obj=None):
+        fields = ('creatives',)
         if not request.user.is_superuser:
-            return ('clicks', 'views')
-        return ()
+            fields += ('clicks', 'views')
+        return fields
+
+    def get_inlines(self, request, obj):
+        if self._creatives_over_limit(obj):
+            return []
+        return super().get_inlines(request, obj)
+
+    def _creatives_over_limit(self, obj):
+        # Счётчики приходят аннотацией из get_queryset, лишних запросов нет
+        return obj is not None and max(getattr(obj, 'titles_count', 0),
+                                       getattr(obj, 'images_count', 0)) > self.inline_limit
+
+    @admin.display(description='Креативы')
+    def creatives(self, obj):
+        return format_html(
+            '<a href="{}?banner__id__exact={}">Заголовки ({})</a> · <a href="{}?banner__id__exact={}">Картинки ({})</a>',
+            reverse('admin:banners_bannertitle_changelist'), obj.pk, obj.titles_count,
+            reverse('admin:banners_bannerimage_changelist'), obj.pk, obj.images_count,
+        )
+
+    @admin.display(description='Заголовков', ordering='titles_count')
+    def titles_count(self, obj):
+        return obj.titles_count
+
+    @admin.display(description='Картинок', ordering='images_count')
+    def images_count(self, obj):
+        return obj.images_count
 
     def get_tags(self, obj):
         return ", ".join([tag.name for tag in obj.tags.all()])
@@ -156,6 +234,78 @@ class BannerAdmin(OwnedAdmin):
 
     create_sample_banner.short_description = "Создать пример баннера"
 
+    def _export(self, queryset, fmt):
+        # Аннотации и prefetch списка выгрузке не нужны
+        lines = catalog_io.export_lines(fmt, queryset.prefetch_related(None))
+        response = StreamingHttpResponse(lines, content_type=CATALOG_CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="banners.{fmt}"'
+        return response
+
+    @admin.action(description='Выгрузить в CSV')
+    def export_catalog_csv(self, request, queryset):
+        return self._export(queryset, 'csv')
+
+    @admin.action(description='Выгрузить в JSONL')
+    def export_catalog_jsonl(self, request, queryset):
+        return self._export(queryset, 'jsonl')
+
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_catalog_view), name='banners_banner_import'),
+        ] + super().get_urls()
+
+    def import_catalog_view(self, request):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = CatalogImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            fmt = form.cleaned_data['format']
+            # staff импортирует только себе; superuser — владельцам из файла
+            owner = None if request.user.is_superuser else request.user
+            try:
+                total = catalog_io.import_catalog(catalog_io.read_records(upload, fmt), owner=owner)
+            except ValueError as exc:
+                self.message_user(request, f'Импорт остановлен: {exc}', level=messages.ERROR)
+            else:
+                self.message_user(request, f'Импортировано баннеров: {total}')
+                return redirect('admin:banners_banner_changelist')
+        context = dict(self.admin_site.each_context(request), form=form, opts=self.model._meta,
+                       title='Импорт баннеров')
+        return TemplateResponse(request, 'admin/banners/banner/import_catalog.html', context)
+
+
+# ------------------------------------------------
+# 4a) Креативы отдельными списками — для баннеров, не влезающих в inline
+# ------------------------------------------------
+class CreativeAdmin(admin.ModelAdmin):
+    autocomplete_fields = ('banner',)
+    list_per_page = 50
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request).select_related('banner')
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(banner__owner=request.user)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'banner' and not request.user.is_superuser:
+            kwargs['queryset'] = Banner.objects.filter(owner=request.user)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+@admin.register(BannerTitle)
+class BannerTitleAdmin(CreativeAdmin):
+    list_display = ('text', 'banner', 'language', 'clicks', 'views')
+    list_select_related = ('banner', 'language')
+    readonly_fields = ('clicks', 'views')
+
+
+@admin.register(BannerImage)
+class BannerImageAdmin(CreativeAdmin):
+    list_display = ('image', 'banner', 'clicks', 'views', 'created_at')
+    readonly_fields = ('clicks', 'views')
+
 
 # ------------------------------------------------
 # 5) Админка для Article
@@ -189,21 +339,23 @@ class WrittenArticleForm(ModelForm):
         model = WrittenArticle
         fields = ['title', 'language', 'description', 'slug', 'content', 'tags', 'owner']
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.fields['tags'].queryset = Tag.objects.all()
-
 
 @admin.register(WrittenArticle)
 class WrittenArticleAdmin(OwnedAdmin):
     form = WrittenArticleForm
     list_display = ('title', 'slug', 'created_at', 'owner')
     prepopulated_fields = {"slug": ("title",)}
-    filter_horizontal = ('tags',)
+    autocomplete_fields = ('tags', 'owner')
 
     def get_list_filter(self, request):
         return ('owner',) if request.user.is_superuser else ()
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Проблемы разметки слотов не мешают сохранению, но о них стоит знать
+        for problem in getattr(obj, 'layout_problems', ()):
+            self.message_user(request, f"Слоты баннеров: {problem}", level=messages.WARNING)
+
 
 # ------------------------------------------------
 # 7) Простые модели без owner-фильтрации
@@ -213,6 +365,9 @@ class TagAdmin(OwnedAdmin):
     list_display = ('name', 'owner')
     # по умолчанию без фильтров
     list_filter = ()
+    # Источник автодополнения тегов; get_queryset ограничивает его тегами владельца
+    search_fields = ('name',)
+    ordering = ('name',)
 
     def get_fields(self, request, obj=None):
         fields = ['name']
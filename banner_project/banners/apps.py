@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class BannersConfig(AppConfig):
     name = 'banners'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        # Метрика отставания свёртки журнала регистрируется при импорте
+        from . import rollup  # noqa: F401
@@ -0,0 +1,160 @@
+# banners/async_views.py
+"""
+Асинхронные версии горячих страниц для запуска под ASGI (uvicorn).
+
+Логика выбора баннеров общая с ``banners/views.py`` — здесь только ввод-вывод:
+асинхронный ORM при промахе кэша оболочек, асинхронная сессия и запись
+счётчиков через ``counters.arecord_*``, которые не держат event loop на
+синхронной записи в базу. Включаются настройкой ``BANNER_ASYNC_VIEWS``
+(см. ``banners/urls.py``).
+"""
+import random
+
+from asgiref.sync import sync_to_async
+from django.core import signing
+from django.http import Http404, HttpResponseRedirect, JsonResponse
+from django.shortcuts import aget_object_or_404, redirect, render
+
+from . import counters, profiling, render_cache, serving, timers, views
+from .click_tokens import read_token
+from .creatives import resolve_creatives
+from .feed import feed_page
+from .models import Article, Banner, BannerImage, BannerTitle, Tag, WrittenArticle
+from .query_budget import query_budget
+
+homepage_feed_page = sync_to_async(feed_page)
+
+
+# Бюджеты запросов те же, что у синхронных вьюх (см. banners/views.py)
+@query_budget(queries=3)
+async def homepage(request):
+    items, next_cursor = await homepage_feed_page()
+    return render(request, 'banners/homepage.html', {
+        'banner_items': items,
+        'next_cursor': next_cursor,
+    })
+
+
+@query_budget(queries=3)
+async def homepage_feed(request):
+    items, next_cursor = await homepage_feed_page(request.GET.get('cursor'))
+    return JsonResponse({'items': items, 'next_cursor': next_cursor})
+
+
+async def _aget_creatives(title_id, image_id):
+    title = await aget_object_or_404(BannerTitle, id=title_id) if title_id else None
+    image = await aget_object_or_404(BannerImage, id=image_id) if image_id else None
+    return title, image
+
+
+async def _aget_click_target(banner_id, title_id, image_id):
+    title, image = await _aget_creatives(title_id, image_id)
+    if banner_id:
+        banner_id = (await aget_object_or_404(Banner, id=banner_id)).id
+    else:
+        banner_id = (title or image).banner_id
+    return banner_id, title.id if title else None, image.id if image else None
+
+
+@query_budget(queries=3)
+async def banner_redirect(request):
+    # Совместимость со старыми ссылками /go/?banner_id=…: проверяем объекты в базе
+    banner = await aget_object_or_404(Banner, id=request.GET.get('banner_id'))
+    title, image = await _aget_creatives(request.GET.get('banner_title_id'), request.GET.get('banner_image_id'))
+    await counters.arecord_click(banner.id, title.id if title else None, image.id if image else None)
+    return redirect(banner.link_url)
+
+
+@query_budget(queries=0)
+async def banner_redirect_token(request, token):
+    # Всё нужное лежит в подписанном токене — в базу не ходим
+    try:
+        banner_id, title_id, image_id, destination = read_token(token)
+    except signing.BadSignature:
+        raise Http404('Некорректная ссылка')
+    if banner_id:
+        await counters.arecord_click(banner_id, title_id, image_id)
+    return HttpResponseRedirect(destination)
+
+
+async def banner_metrics(request):
+    # Отставание журнала событий читается из базы
+    return await sync_to_async(views.banner_metrics)(request)
+
+
+@query_budget(queries=1)
+async def get_tags_by_verticals(request):
+    vertical_ids = request.GET.getlist('verticals')
+    tags = Tag.objects.filter(verticals__id__in=vertical_ids).distinct().values_list('id', flat=True)
+    return JsonResponse({'selected_tags': [tag_id async for tag_id in tags]})
+
+
+async def _abuild_article_shell(slug):
+    article = await aget_object_or_404(Article, slug=slug)
+    article_tag_ids = {tag_id async for tag_id in article.tags.values_list('id', flat=True)}
+    # Индекс тегов строится синхронно и обычно уже лежит в памяти воркера
+    matched_ids, random_ids, pool_ids = await sync_to_async(views._article_pool)(article, article_tag_ids)
+    banners = await Banner.objects.ain_bulk(pool_ids)
+    return views._article_shell(article, matched_ids, random_ids, banners)
+
+
+@query_budget(queries=8)
+async def article_with_banners(request, slug):
+    with profiling.phase('shell'):
+        shell = await render_cache.aget_or_build('article', slug, _abuild_article_shell)
+    with profiling.phase('candidates'):
+        final_banners = views._pick_article_banners(shell)
+    with profiling.phase('creatives'):
+        creatives = await sync_to_async(resolve_creatives)(final_banners)
+        banners_with_variants, impressions = views._article_items(final_banners, creatives)
+    with profiling.phase('counters'):
+        for impression in impressions:
+            await counters.arecord_impression(*impression)
+
+    # Старые ссылки с кликом прямо на страницу статьи
+    click_ids = (
+        request.GET.get('banner_id'),
+        request.GET.get('banner_title_id'),
+        request.GET.get('banner_image_id'),
+    )
+    if any(click_ids):
+        await counters.arecord_click(*await _aget_click_target(*click_ids))
+
+    with profiling.phase('render'):
+        return render(request, 'banners/article_with_banners.html', {
+            'article': shell['article'],
+            'banners': banners_with_variants,
+        })
+
+
+async def _abuild_written_article_shell(slug):
+    article = await aget_object_or_404(WrittenArticle.objects.select_related('language'), slug=slug)
+    article_tag_ids = [tag_id async for tag_id in article.tags.values_list('id', flat=True)]
+    rows = [row async for row in serving.owner_rows(article.owner_id)]
+    matched_banners, random_banners = serving.partition(rows, article_tag_ids)
+    return views._written_shell(article, matched_banners, random_banners)
+
+
+@query_budget(queries=6)
+async def written_article_with_banners(request, slug):
+    with profiling.phase('shell'):
+        shell = await render_cache.aget_or_build('written_article', slug, _abuild_written_article_shell)
+    with profiling.phase('candidates'):
+        final_banners = views._mix_written_banners(shell)
+    with profiling.phase('timers'):
+        minutes = await timers.abanner_minutes(request, final_banners)
+
+    random.shuffle(final_banners)
+
+    with profiling.phase('creatives'):
+        creatives = await sync_to_async(resolve_creatives)(final_banners, shell['article'].language)
+    with profiling.phase('layout'):
+        content, remaining_banners, impressions = views._written_page(shell, final_banners, minutes, creatives)
+    with profiling.phase('counters'):
+        for impression in impressions:
+            await counters.arecord_impression(*impression)
+
+    with profiling.phase('render'):
+        response = render(request, 'banners/written_article_with_banners.html',
+                          views._written_context(shell, content, remaining_banners))
+    return timers.remember_visitor(request, response)
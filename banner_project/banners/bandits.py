@@ -0,0 +1,127 @@
+# banners/bandits.py
+"""
+Политики выбора креатива (многорукие бандиты) над массивами NumPy.
+
+Все варианты (руки) всех баннеров страницы передаются одним плоским
+массивом ``clicks``/``views`` и массивом длин групп ``lengths`` — по группе на
+баннер. Политика за один векторный вызов возвращает для каждой группы
+номер выбранной руки внутри группы.
+
+Модуль не зависит от Django: статистику и конфигурацию ему передаёт
+``banners/creatives.py``.
+"""
+import numpy as np
+
+
+class Groups:
+    """Разметка плоского массива рук на непустые группы подряд идущих элементов."""
+
+    def __init__(self, lengths):
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        if (self.lengths <= 0).any():
+            raise ValueError('Пустые группы нужно отфильтровать до выбора')
+        self.starts = np.concatenate(([0], np.cumsum(self.lengths)[:-1]))
+        # номер группы для каждой руки
+        self.owner = np.repeat(np.arange(len(self.lengths)), self.lengths)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def sum(self, values):
+        return np.add.reduceat(values, self.starts)
+
+    def max(self, values):
+        return np.maximum.reduceat(values, self.starts)
+
+    def argmax(self, scores):
+        """Индекс максимума внутри каждой группы (первый при равенстве)."""
+        is_max = scores >= self.max(scores)[self.owner]
+        hits = np.flatnonzero(is_max)
+        first = hits[np.searchsorted(self.owner[hits], np.arange(len(self)))]
+        return first - self.starts
+
+
+def ctr(clicks, views):
+    clicks = np.asarray(clicks, dtype=np.float64)
+    views = np.asarray(views, dtype=np.float64)
+    return np.divide(clicks, views, out=np.zeros_like(clicks), where=views > 0)
+
+
+class Policy:
+    name = None
+
+    def scores(self, clicks, views, groups, kind, rng):
+        raise NotImplementedError
+
+    def choose(self, clicks, views, lengths, kind='title', rng=None):
+        """
+        ``clicks``/``views`` — плоские массивы рук, ``lengths`` — размеры групп
+        (все > 0). ``kind`` — ``'title'`` или ``'image'``. Возвращает массив
+        индексов выбранной руки внутри каждой группы.
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        groups = Groups(lengths)
+        clicks = np.asarray(clicks, dtype=np.float64)
+        views = np.asarray(views, dtype=np.float64)
+        return groups.argmax(self.scores(clicks, views, groups, kind, rng))
+
+
+class LegacyPolicy(Policy):
+    """
+    Прежняя логика ``Banner.get_best_or_random_*``: заголовки выбираются
+    случайно, пока у всех меньше 15 кликов, картинки — пока ни у одной нет
+    просмотров; потом всегда берётся лучший CTR.
+    """
+    name = 'legacy'
+    min_title_clicks = 15
+
+    def scores(self, clicks, views, groups, kind, rng):
+        if kind == 'title':
+            explore = groups.max(clicks) < self.min_title_clicks
+        else:
+            explore = groups.max(views) == 0
+        return np.where(explore[groups.owner], rng.random(len(clicks)), ctr(clicks, views))
+
+
+class ThompsonSampling(Policy):
+    """Сэмплирование Томпсона с бета-априорным распределением CTR."""
+    name = 'thompson'
+
+    def __init__(self, alpha=1.0, beta=1.0):
+        self.alpha = alpha
+        self.beta = beta
+
+    def scores(self, clicks, views, groups, kind, rng):
+        failures = np.maximum(views - clicks, 0)
+        return rng.beta(clicks + self.alpha, failures + self.beta)
+
+
+class UCB1(Policy):
+    """UCB1: CTR плюс бонус за неуверенность; не показанные руки — первыми."""
+    name = 'ucb1'
+
+    def __init__(self, exploration=1.0):
+        self.exploration = exploration
+
+    def scores(self, clicks, views, groups, kind, rng):
+        total = groups.sum(views)[groups.owner]
+        shown = views > 0
+        bonus = np.sqrt(
+            2 * np.log(np.maximum(total, 1)) / np.where(shown, views, 1)
+        )
+        scores = ctr(clicks, views) + self.exploration * bonus
+        # Непоказанные руки пробуем первыми, между собой — в случайном порядке
+        return np.where(shown, scores, 1e9 + rng.random(len(clicks)))
+
+
+POLICIES = {
+    policy.name: policy
+    for policy in (LegacyPolicy(), ThompsonSampling(), UCB1())
+}
+
+
+def get_policy(name):
+    try:
+        return POLICIES[name]
+    except KeyError:
+        raise ValueError(f'Неизвестная политика выбора креатива: {name!r}') from None
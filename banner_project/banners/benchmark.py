@@ -0,0 +1,180 @@
+# banners/benchmark.py
+"""
+Замер страниц баннеров в процессе (``manage.py benchmark_banner_views``).
+
+Запросы идут через тестовый ``Client`` — весь стек middleware и URL-ов, без
+сети. На каждый запрос считаются время, число SQL-запросов и число
+записанных строк (по ``rowcount`` INSERT/UPDATE/DELETE через
+``connection.execute_wrapper``). Отложенная запись счётчиков (режим
+``buffered``) сбрасывается после каждого запроса и считается отдельно.
+Результат — словарь, который команда печатает как JSON, чтобы прогоны
+можно было сравнивать diff-ом.
+"""
+import math
+import platform
+import random
+import time
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from . import counters
+from .click_tokens import click_url
+from .models import Article, Banner, BannerImage, BannerTitle, WrittenArticle
+from .query_budget import WRITE_STATEMENTS
+
+# Сколько разных объектов каждого вида брать в ротацию
+SAMPLE_SIZE = 200
+
+
+class QueryRecorder:
+    """``execute_wrapper``: считает запросы и записанные строки."""
+
+    def __init__(self):
+        self.queries = 0
+        self.rows_written = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        self.queries += 1
+        if sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+            rowcount = context['cursor'].rowcount
+            if rowcount and rowcount > 0:
+                self.rows_written += rowcount
+        return result
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _sample_ids(queryset, rng):
+    ids = list(queryset.values_list('id', flat=True))
+    return _sample(ids, rng)
+
+
+def _sample(values, rng):
+    return rng.sample(values, min(SAMPLE_SIZE, len(values)))
+
+
+def _click_urls(rng):
+    banners = Banner.objects.in_bulk(_sample_ids(Banner.objects.all(), rng))
+    titles = {t.banner_id: t for t in BannerTitle.objects.filter(banner_id__in=banners)}
+    images = {i.banner_id: i for i in BannerImage.objects.filter(banner_id__in=banners)}
+    return [click_url(banner, titles.get(banner.id), images.get(banner.id)) for banner in banners.values()]
+
+
+def build_scenarios(rng, prefix=None):
+    """``{имя: [url, ...]}`` — по каким адресам ходить для каждой страницы."""
+    articles = Article.objects.all()
+    written = WrittenArticle.objects.all()
+    if prefix:
+        articles = articles.filter(slug__startswith=f'{prefix}-')
+        written = written.filter(slug__startswith=f'{prefix}-')
+
+    return {
+        'homepage': [reverse('home_page')],
+        'article_with_banners': [
+            reverse('article_with_banners', args=[slug])
+            for slug in _sample(list(articles.values_list('slug', flat=True)), rng)
+        ],
+        'written_article_with_banners': [
+            reverse('written_article_with_banners', args=[slug])
+            for slug in _sample(list(written.values_list('slug', flat=True)), rng)
+        ],
+        'banner_redirect_token': _click_urls(rng),
+        'banner_redirect': [
+            reverse('banner_redirect') + f'?banner_id={banner_id}'
+            for banner_id in _sample_ids(Banner.objects.all(), rng)
+        ],
+    }
+
+
+def _measure(client, urls, requests, warmup, rng):
+    latencies = []
+    queries = []
+    rows = []
+    deferred_rows = 0
+    errors = 0
+    for n in range(warmup + requests):
+        url = rng.choice(urls)
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            started = time.perf_counter()
+            response = client.get(url)
+            elapsed = time.perf_counter() - started
+        flushed = QueryRecorder()
+        with connection.execute_wrapper(flushed):
+            counters.flush()
+        if n < warmup:
+            continue
+        if response.status_code >= 400:
+            errors += 1
+        latencies.append(elapsed * 1000)
+        queries.append(recorder.queries)
+        rows.append(recorder.rows_written)
+        deferred_rows += flushed.rows_written
+
+    return {
+        'requests': requests,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.5), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'queries_per_request': round(sum(queries) / len(queries), 2),
+        'max_queries': max(queries),
+        'rows_written_per_request': round(sum(rows) / len(rows), 2),
+        'deferred_rows_written': deferred_rows,
+    }
+
+
+def run_benchmark(requests=200, warmup=20, seed=0, views=None, prefix=None, counters_mode=None):
+    """Гоняет выбранные страницы и возвращает отчёт-словарь."""
+    rng = random.Random(seed)
+    scenarios = build_scenarios(rng, prefix)
+    if views:
+        scenarios = {name: scenarios[name] for name in views}
+
+    overrides = {'ALLOWED_HOSTS': ['testserver', *settings.ALLOWED_HOSTS]}
+    if counters_mode:
+        overrides['BANNER_COUNTERS'] = dict(counters.get_config(), MODE=counters_mode)
+
+    results = {}
+    with override_settings(**overrides):
+        # Cookie посетителя/сессия живут между запросами, как у настоящего браузера
+        client = Client()
+        for name, urls in scenarios.items():
+            if not urls:
+                results[name] = {'skipped': 'нет объектов для этой страницы'}
+                continue
+            results[name] = _measure(client, urls, requests, warmup, rng)
+        mode = counters.get_config()['MODE']
+
+    return {
+        'meta': {
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'seed': seed,
+            'requests': requests,
+            'warmup': warmup,
+            'prefix': prefix,
+            'counters_mode': mode,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'catalog': {
+                'banners': Banner.objects.count(),
+                'titles': BannerTitle.objects.count(),
+                'images': BannerImage.objects.count(),
+                'articles': Article.objects.count(),
+                'written_articles': WrittenArticle.objects.count(),
+            },
+        },
+        'views': results,
+    }
@@ -0,0 +1,365 @@
+# banners/catalog_io.py
+"""
+Потоковый импорт и экспорт каталога баннеров (CSV и JSONL).
+
+Запись каталога — баннер вместе с тегами, заголовками (с кодом языка) и
+путями картинок::
+
+    {"title": ..., "description": ..., "link_url": ..., "owner": "username",
+     "selection_policy": "", "tags": ["sport"], "images": ["banner_images/a.png"],
+     "titles": [{"text": ..., "language": "ru"}]}
+
+В CSV списки пишутся через ``|``, а заголовки раскладываются по колонкам
+``titles`` (без языка) и ``titles:<код>``. Пути картинок — относительные,
+внутри ``banner_images/``. С ``owner`` импорт берёт только теги этого
+владельца: имя чужого тега останавливает импорт.
+
+Импорт читает записи пачками по ``chunk_size``: каждая пачка — одна
+транзакция с многострочными INSERT баннеров, креативов, строк связи с тегами
+и строк выдачи, поэтому память не растёт с размером файла, а число запросов
+на пачку почти не зависит от её размера. Сигналы при этом не шлются — кэши
+сбрасываются один раз в конце. Экспорт так
+же идёт пачками по id и отдаётся генератором строк.
+"""
+import csv
+import io
+import json
+import posixpath
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from .models import SELECTION_POLICY_CHOICES, Banner, BannerImage, BannerServingRow, BannerTitle, Language, Tag
+from .synthetic import _invalidate
+
+CHUNK_SIZE = 1000
+
+FORMATS = ('csv', 'jsonl')
+
+CSV_FIELDS = ['title', 'description', 'link_url', 'owner', 'selection_policy', 'weight', 'tags', 'images']
+LIST_SEPARATOR = '|'
+TITLES_COLUMN = 'titles'
+IMAGE_DIR = BannerImage._meta.get_field('image').upload_to
+
+POLICIES = {value for value, _ in SELECTION_POLICY_CHOICES} | {''}
+
+# Колонки, которые пишет импорт; значения остальных полей Django подставил бы сам
+BANNER_FIELDS = ['title', 'description', 'link_url', 'owner', 'selection_policy', 'weight', 'clicks', 'views',
+                 'created_at', 'updated_at']
+TITLE_FIELDS = ['banner', 'text', 'language', 'clicks', 'views']
+IMAGE_FIELDS = ['banner', 'image', 'clicks', 'views', 'created_at', 'renditions']
+SERVING_FIELDS = ['banner', 'owner', 'tag_ids', 'updated_at']
+# Значения этих типов нужно готовить под драйвер базы
+PREPARED_TYPES = {'DateTimeField', 'JSONField'}
+
+
+class CatalogFormatError(ValueError):
+    def __init__(self, line, message):
+        super().__init__(f'строка {line}: {message}')
+        self.line = line
+
+
+def _split(value):
+    return [part.strip() for part in (value or '').split(LIST_SEPARATOR) if part.strip()]
+
+
+def _record(line, data):
+    """Приводит разобранную строку файла к записи каталога и проверяет обязательные поля."""
+    if not isinstance(data, dict):
+        raise CatalogFormatError(line, 'ожидался объект')
+    record = {
+        'title': (data.get('title') or '').strip(),
+        'description': data.get('description') or '',
+        'link_url': (data.get('link_url') or '').strip(),
+        'owner': data.get('owner') or None,
+        'selection_policy': data.get('selection_policy') or '',
+        'weight': data.get('weight'),
+        'tags': [str(tag) for tag in data.get('tags') or ()],
+        'images': [str(image) for image in data.get('images') or ()],
+        'titles': [],
+    }
+    for title in data.get('titles') or ():
+        if isinstance(title, str):
+            title = {'text': title}
+        if title.get('text'):
+            record['titles'].append({'text': title['text'], 'language': title.get('language') or None})
+    if not record['title'] or not record['link_url']:
+        raise CatalogFormatError(line, 'нужны title и link_url')
+    for image in record['images']:
+        # Путь уходит в хранилище как есть — не выпускаем его из каталога картинок
+        if not image.startswith(IMAGE_DIR) or posixpath.normpath(image) != image or '\\' in image:
+            raise CatalogFormatError(line, f'картинка вне {IMAGE_DIR}: {image!r}')
+    if record['selection_policy'] not in POLICIES:
+        raise CatalogFormatError(line, f'неизвестная selection_policy {record["selection_policy"]!r}')
+    if record['weight'] in (None, ''):
+        record['weight'] = 1
+    elif not str(record['weight']).isdigit():
+        raise CatalogFormatError(line, f'weight — целое число от 0, получено {record["weight"]!r}')
+    record['weight'] = int(record['weight'])
+    return record
+
+
+def read_jsonl(lines):
+    for line, text in enumerate(lines, start=1):
+        if isinstance(text, bytes):
+            text = text.decode('utf-8')
+        if not text.strip():
+            continue
+        try:
+            data = json.loads(text)
+        except ValueError as exc:
+            raise CatalogFormatError(line, f'некорректный JSON: {exc}') from None
+        yield _record(line, data)
+
+
+def read_csv(lines):
+    lines = (text.decode('utf-8') if isinstance(text, bytes) else text for text in lines)
+    reader = csv.DictReader(lines)
+    for row in reader:
+        data = {field: row.get(field) for field in CSV_FIELDS}
+        data['tags'] = _split(data['tags'])
+        data['images'] = _split(data['images'])
+        data['titles'] = [
+            {'text': text, 'language': column.partition(':')[2] or None}
+            for column, value in row.items()
+            if column and column.split(':')[0] == TITLES_COLUMN
+            for text in _split(value)
+        ]
+        yield _record(reader.line_num, data)
+
+
+def read_records(lines, fmt):
+    return read_csv(lines) if fmt == 'csv' else read_jsonl(lines)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class _Lookups:
+    """
+    Теги, языки и владельцы, создаваемые по мере надобности; кэш живёт один
+    импорт. С ``owner`` теги ищутся и создаются только среди его тегов.
+    """
+
+    def __init__(self, owner=None):
+        self.owner = owner
+        self.tags = {}
+        self.languages = {}
+        self.owners = {}
+
+    def _load(self, cache, queryset, field, names, create):
+        missing = set(names) - cache.keys()
+        if not missing:
+            return
+        cache.update(queryset.filter(**{f'{field}__in': missing}).values_list(field, 'id'))
+        missing -= cache.keys()
+        if missing and create is not None:
+            queryset.model.objects.bulk_create([create(name) for name in sorted(missing)], ignore_conflicts=True)
+            cache.update(queryset.filter(**{f'{field}__in': missing}).values_list(field, 'id'))
+
+    def resolve(self, records):
+        owners = {record['owner'] for record in records if record['owner']} if self.owner is None else ()
+        self._load(self.owners, get_user_model().objects.all(), 'username', owners, None)
+        unknown = set(owners) - self.owners.keys()
+        if unknown:
+            raise ValueError(f'неизвестные владельцы: {", ".join(sorted(unknown))}')
+
+        # Новый тег достаётся владельцу первого баннера, который его принёс
+        tag_owners = {}
+        for record in records:
+            for tag in record['tags']:
+                tag_owners.setdefault(tag, self.owner_id(record))
+        tags = Tag.objects.all() if self.owner is None else Tag.objects.filter(owner=self.owner)
+        self._load(self.tags, tags, 'name', tag_owners,
+                   lambda name: Tag(name=name, owner_id=tag_owners[name]))
+        # Имена тегов уникальны: занятое другим владельцем не создалось и не нашлось
+        foreign = tag_owners.keys() - self.tags.keys()
+        if foreign:
+            raise ValueError(f'теги других владельцев: {", ".join(sorted(foreign))}')
+        self._load(self.languages, Language.objects.all(), 'code',
+                   {title['language'] for record in records for title in record['titles'] if title['language']},
+                   lambda code: Language(code=code, name=code))
+
+    def owner_id(self, record):
+        if self.owner is not None:
+            return self.owner.pk
+        return self.owners.get(record['owner'])
+
+
+def _preparer(field):
+    if field.get_internal_type() == 'JSONField':
+        # Полный get_db_prep_save на каждом списке тегов в разы дороже самой сериализации
+        return lambda value: connection.ops.adapt_json_value(value, field.encoder)
+    return lambda value: field.get_db_prep_save(value, connection)
+
+
+def _insert(model, fields, rows, returning=False):
+    """
+    Вставляет ``rows`` — кортежи значений ``fields`` — без создания экземпляров
+    моделей: на сотнях тысяч строк ``bulk_create`` тратит основное время на
+    ``Model.__init__`` и подготовку каждого значения. Значения по умолчанию
+    Django сам не подставит, поэтому ``fields`` — все NOT NULL колонки.
+    Возвращает id вставленных строк в порядке ``rows``, если ``returning``.
+    """
+    if not rows:
+        return []
+    if returning and not connection.features.can_return_rows_from_bulk_insert:
+        attnames = [model._meta.get_field(name).attname for name in fields]
+        objs = model.objects.bulk_create([model(**dict(zip(attnames, row))) for row in rows], batch_size=CHUNK_SIZE)
+        return [obj.pk for obj in objs]
+
+    opts = model._meta
+    model_fields = [opts.get_field(name) for name in fields]
+    prepared = [i for i, field in enumerate(model_fields) if field.get_internal_type() in PREPARED_TYPES]
+    if prepared:
+        rows = [list(row) for row in rows]
+        for i in prepared:
+            prepare = _preparer(model_fields[i])
+            # Момент вставки один на пачку — готовим его один раз
+            memo = {}
+            for row in rows:
+                value = row[i]
+                try:
+                    row[i] = memo[value]
+                except KeyError:
+                    row[i] = memo[value] = prepare(value)
+                except TypeError:
+                    row[i] = prepare(value)
+
+    quote = connection.ops.quote_name
+    head = f'INSERT INTO {quote(opts.db_table)} ({", ".join(quote(field.column) for field in model_fields)}) VALUES '
+    values = f'({", ".join(["%s"] * len(fields))})'
+    with connection.cursor() as cursor:
+        if not returning:
+            cursor.executemany(head + values, rows)
+            return []
+        ids = []
+        batch = connection.ops.bulk_batch_size(model_fields, rows)
+        for start in range(0, len(rows), batch):
+            chunk = rows[start:start + batch]
+            cursor.execute(head + ', '.join([values] * len(chunk)) + f' RETURNING {quote(opts.pk.column)}',
+                           [value for row in chunk for value in row])
+            ids.extend(row[0] for row in cursor.fetchall())
+        return ids
+
+
+def _import_chunk(records, lookups):
+    lookups.resolve(records)
+    moment = now()
+    banner_ids = _insert(Banner, BANNER_FIELDS, [
+        (record['title'], record['description'], record['link_url'], lookups.owner_id(record),
+         record['selection_policy'], record.get('weight', 1), 0, 0, moment, moment)
+        for record in records
+    ], returning=True)
+    tag_ids = [sorted({lookups.tags[tag] for tag in record['tags']}) for record in records]
+    _insert(Banner.tags.through, ['banner', 'tag'], [
+        (banner_id, tag_id) for banner_id, tags in zip(banner_ids, tag_ids) for tag_id in tags
+    ])
+
+    _insert(BannerTitle, TITLE_FIELDS, [
+        (banner_id, title['text'], lookups.languages.get(title['language']), 0, 0)
+        for banner_id, record in zip(banner_ids, records) for title in record['titles']
+    ])
+    _insert(BannerImage, IMAGE_FIELDS, [
+        (banner_id, image, 0, 0, moment, {})
+        for banner_id, record in zip(banner_ids, records) for image in record['images']
+    ])
+
+    # Строки выдачи — как их посчитал бы serving.refresh
+    _insert(BannerServingRow, SERVING_FIELDS, [
+        (banner_id, lookups.owner_id(record), tags, moment)
+        for banner_id, record, tags in zip(banner_ids, records, tag_ids)
+    ])
+    return len(banner_ids)
+
+
+def import_catalog(records, owner=None, chunk_size=CHUNK_SIZE):
+    """
+    Импортирует записи каталога пачками. ``owner`` — владелец всех баннеров
+    (иначе берётся ``owner`` записи). Возвращает число созданных баннеров;
+    при ошибке уже закоммиченные пачки остаются.
+    """
+    lookups = _Lookups(owner)
+    total = 0
+    try:
+        for chunk in _chunks(records, chunk_size):
+            with transaction.atomic():
+                total += _import_chunk(chunk, lookups)
+    finally:
+        if total:
+            _invalidate()
+    return total
+
+
+def export_records(queryset=None, chunk_size=CHUNK_SIZE):
+    """Записи каталога для баннеров ``queryset`` — пачками по id, по несколько запросов на пачку."""
+    queryset = Banner.objects.all() if queryset is None else queryset
+    last_id = 0
+    while True:
+        banners = list(
+            queryset.filter(id__gt=last_id).order_by('id')
+            .values('id', 'title', 'description', 'link_url', 'owner__username', 'selection_policy', 'weight')[:chunk_size]
+        )
+        if not banners:
+            return
+        ids = [banner['id'] for banner in banners]
+        records = {
+            banner['id']: {
+                'title': banner['title'], 'description': banner['description'], 'link_url': banner['link_url'],
+                'owner': banner['owner__username'], 'selection_policy': banner['selection_policy'],
+                'weight': banner['weight'], 'tags': [], 'images': [], 'titles': [],
+            }
+            for banner in banners
+        }
+        links = Banner.tags.through.objects.filter(banner_id__in=ids).order_by('tag__name')
+        for banner_id, name in links.values_list('banner_id', 'tag__name'):
+            records[banner_id]['tags'].append(name)
+        titles = BannerTitle.objects.filter(banner_id__in=ids).order_by('id')
+        for banner_id, text, code in titles.values_list('banner_id', 'text', 'language__code'):
+            records[banner_id]['titles'].append({'text': text, 'language': code})
+        images = BannerImage.objects.filter(banner_id__in=ids).order_by('id')
+        for banner_id, image in images.values_list('banner_id', 'image'):
+            records[banner_id]['images'].append(image)
+        yield from records.values()
+        last_id = ids[-1]
+
+
+def jsonl_lines(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def csv_lines(records, language_codes=None):
+    """Строки CSV; колонки заголовков — по ``language_codes`` (по умолчанию все языки)."""
+    if language_codes is None:
+        language_codes = list(Language.objects.order_by('code').values_list('code', flat=True))
+    title_columns = [TITLES_COLUMN] + [f'{TITLES_COLUMN}:{code}' for code in language_codes]
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, CSV_FIELDS + title_columns, extrasaction='ignore')
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writeheader()
+    yield flush()
+    for record in records:
+        row = {field: record[field] for field in CSV_FIELDS}
+        row.update(tags=LIST_SEPARATOR.join(record['tags']), images=LIST_SEPARATOR.join(record['images']))
+        for title in record['titles']:
+            column = f'{TITLES_COLUMN}:{title["language"]}' if title['language'] else TITLES_COLUMN
+            row[column] = f'{row[column]}{LIST_SEPARATOR}{title["text"]}' if row.get(column) else title['text']
+        writer.writerow(row)
+        yield flush()
+
+
+def export_lines(fmt, queryset=None, chunk_size=CHUNK_SIZE):
+    records = export_records(queryset, chunk_size)
+    return csv_lines(records) if fmt == 'csv' else jsonl_lines(records)
@@ -0,0 +1,115 @@
+# banners/connection_benchmark.py
+"""
+Цена соединения с базой на запрос (``manage.py benchmark_db_connections``).
+
+Каждый «запрос» повторяет жизненный цикл соединения под gunicorn:
+``request_started`` → чтение, как в переходе ``/go/`` (баннер по id) →
+``request_finished``, где Django закрывает устаревшие соединения. Отдельно
+замеряется подготовка соединения — подключение или проверка живости
+(``CONN_HEALTH_CHECKS``) до первого запроса — и число подключений (для
+пула — выдач соединения из пула).
+
+Профили меняют ``settings_dict`` выбранного алиаса на время прогона:
+
+* ``per-request`` — ``CONN_MAX_AGE = 0``, новое соединение на каждый запрос;
+* ``persistent`` — постоянное соединение с проверкой живости;
+* ``pool`` — пул psycopg (только PostgreSQL с ``psycopg[pool]``).
+"""
+import time
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .benchmark import percentile
+from .models import Banner
+
+POOL_OPTIONS = {'min_size': 1, 'max_size': 4, 'timeout': 10}
+
+PROFILES = {
+    'per-request': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False},
+    'persistent': {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True},
+    'pool': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'pool': POOL_OPTIONS},
+}
+
+
+def available_profiles(alias):
+    names = ['per-request', 'persistent']
+    if connections[alias].vendor == 'postgresql':
+        try:
+            import psycopg_pool  # noqa: F401
+        except ImportError:
+            pass
+        else:
+            names.append('pool')
+    return names
+
+
+def _configure(connection, profile):
+    conf = PROFILES[profile]
+    connection.settings_dict['CONN_MAX_AGE'] = conf['CONN_MAX_AGE']
+    connection.settings_dict['CONN_HEALTH_CHECKS'] = conf['CONN_HEALTH_CHECKS']
+    options = dict(connection.settings_dict.get('OPTIONS', {}))
+    options.pop('pool', None)
+    if 'pool' in conf:
+        options['pool'] = conf['pool']
+    connection.settings_dict['OPTIONS'] = options
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+def run_profile(profile, alias='default', requests=500):
+    connection = connections[alias]
+    original = {key: connection.settings_dict.get(key) for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS', 'OPTIONS')}
+    banner_ids = list(Banner.objects.using(alias).values_list('id', flat=True)[:100]) or [0]
+
+    connects = 0
+
+    def count_connect(sender, connection, **kwargs):
+        nonlocal connects
+        if connection.alias == alias:
+            connects += 1
+
+    connection.close()
+    _configure(connection, profile)
+    connection_created.connect(count_connect)
+    setup, total = [], []
+    try:
+        for i in range(requests):
+            started = time.perf_counter()
+            request_started.send(sender=WSGIHandler, environ={})
+            # Как в первом курсоре запроса: проверка живости, затем подключение
+            connection.close_if_health_check_failed()
+            connection.ensure_connection()
+            ready = time.perf_counter()
+            Banner.objects.using(alias).filter(id=banner_ids[i % len(banner_ids)]).values_list('link_url').first()
+            request_finished.send(sender=WSGIHandler)
+            finished = time.perf_counter()
+            setup.append(ready - started)
+            total.append(finished - started)
+    finally:
+        connection_created.disconnect(count_connect)
+        connection.close()
+        if 'pool' in PROFILES[profile]:
+            connection.close_pool()
+        connection.settings_dict.update(original)
+
+    return {
+        'profile': profile,
+        'alias': alias,
+        'vendor': connection.vendor,
+        'requests': requests,
+        'connects': connects,
+        'setup_ms': {'mean': _ms(sum(setup) / len(setup)), 'p50': _ms(percentile(setup, 0.5)),
+                     'p99': _ms(percentile(setup, 0.99))},
+        'request_ms': {'mean': _ms(sum(total) / len(total)), 'p50': _ms(percentile(total, 0.5)),
+                       'p99': _ms(percentile(total, 0.99))},
+    }
+
+
+def run_benchmark(profiles=None, alias='default', requests=500):
+    profiles = profiles or available_profiles(alias)
+    return [run_profile(profile, alias, requests) for profile in profiles]
@@ -0,0 +1,349 @@
+# banners/counters.py
+"""
+Счётчики просмотров и кликов.
+
+Вместо ``self.save()`` на каждое событие инкременты копятся в памяти процесса,
+склеиваются по ключу (модель, pk, поле) и сбрасываются пачкой UPDATE-ов вида
+``field = field + N`` — по таймеру, по порогу размера буфера и при остановке
+воркера.
+
+Режимы задаются в ``settings.BANNER_COUNTERS['MODE']``:
+
+* ``sync`` — каждый инкремент сразу уходит в базу (удобно в тестах и dev);
+* ``buffered`` — инкременты копятся и сбрасываются фоновым потоком.
+
+В ``buffered`` с фоновым потоком запросы в базу не пишут вовсе: поток —
+единственный писатель счётчиков в процессе, а сбросы из других мест (порог
+без потока, остановка воркера) ждут друг друга на ``_flush_lock``. Для
+SQLite это одна транзакция записи на процесс раз в ``FLUSH_INTERVAL``
+вместо блокировки базы на каждом просмотре.
+
+``settings.BANNER_COUNTERS['STORE']`` выбирает, куда пишутся просмотры и клики
+со страниц:
+
+* ``counters`` — сразу в поля ``views``/``clicks`` и в почасовую/дневную
+  статистику (``banners/stats.py``);
+* ``events`` — в append-only таблицы ``ImpressionEvent``/``ClickEvent``
+  (``bulk_create``), а в счётчики и статистику их сворачивает
+  ``rollup_banner_events``.
+"""
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MODE': 'sync',
+    # Раз в сколько секунд фоновый поток сбрасывает буфер (0 — без потока)
+    'FLUSH_INTERVAL': 5.0,
+    # Сколько разных ключей копим до принудительного сброса
+    'MAX_PENDING': 1000,
+    'STORE': 'counters',
+    # Свёртка журнала берёт только события старше стольких секунд (banners/rollup.py)
+    'SETTLE_SECONDS': 10.0,
+}
+
+
+def get_config():
+    conf = dict(DEFAULTS)
+    conf.update(getattr(settings, 'BANNER_COUNTERS', {}))
+    return conf
+
+
+def apply_increments(pending):
+    """
+    Применяет словарь ``{(label, pk, field): delta}`` к базе.
+
+    Ключи с одинаковыми моделью, полем и дельтой сворачиваются в один
+    ``UPDATE ... WHERE pk IN (...)``, поэтому страница с десятками баннеров
+    стоит несколько запросов, а не по три на баннер.
+    """
+    groups = defaultdict(list)
+    for (label, pk, field), delta in pending.items():
+        if delta:
+            groups[(label, field, delta)].append(pk)
+
+    # Сортируем, чтобы параллельные воркеры брали блокировки в одном порядке
+    for (label, field, delta), pks in sorted(groups.items()):
+        model = apps.get_model(label)
+        model.objects.filter(pk__in=sorted(pks)).update(**{field: F(field) + delta})
+    return len(groups)
+
+
+def apply_hits(hits):
+    """Прибавляет попадания ``{(поле, момент, banner_id, title_id, image_id): n}`` к статистике."""
+    # stats импортирует модели, а модели — этот модуль
+    from .stats import add_hits
+    return add_hits(hits)
+
+
+def apply_events(events):
+    """
+    Вставляет накопленные события: ``{label: [kwargs, ...]}``. ``created_at``
+    — момент вставки, а не попадания в буфер: по нему свёртка ждёт коммита
+    (``SETTLE_SECONDS``), а события после неудачного сброса ждут в буфере долго.
+    """
+    moment = now()
+    for label, rows in sorted(events.items()):
+        model = apps.get_model(label)
+        model.objects.bulk_create([model(**row, created_at=moment) for row in rows], batch_size=500)
+    return sum(len(rows) for rows in events.values())
+
+
+class CounterBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = defaultdict(int)
+        self._events = defaultdict(list)
+        self._hits = defaultdict(int)
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        # Когда в пустой буфер попала первая запись — отсюда задержка сброса
+        self._since = None
+
+    def __len__(self):
+        return len(self._pending) + len(self._hits) + sum(len(rows) for rows in self._events.values())
+
+    def add(self, model, pk, field, amount=1):
+        if pk is None:
+            return
+        key = (model._meta.label, pk, field)
+        conf = get_config()
+        if conf['MODE'] == 'sync':
+            apply_increments({key: amount})
+            metrics.COUNTER_ROWS_WRITTEN.inc()
+            return
+
+        with self._lock:
+            self._pending[key] += amount
+            if self._since is None:
+                self._since = time.monotonic()
+        self._after_add(conf)
+
+    def add_event(self, model, **fields):
+        label = model._meta.label
+        conf = get_config()
+        if conf['MODE'] == 'sync':
+            apply_events({label: [fields]})
+            metrics.COUNTER_ROWS_WRITTEN.inc()
+            return
+
+        with self._lock:
+            self._events[label].append(fields)
+            if self._since is None:
+                self._since = time.monotonic()
+        self._after_add(conf)
+
+    def add_hit(self, field, banner_id, title_id, image_id, amount=1):
+        """Попадание в статистику; момент округляется до часа, чтобы ключи склеивались."""
+        key = (field, now().replace(minute=0, second=0, microsecond=0), banner_id, title_id, image_id)
+        conf = get_config()
+        if conf['MODE'] == 'sync':
+            metrics.COUNTER_ROWS_WRITTEN.inc(apply_hits({key: amount}))
+            return
+
+        with self._lock:
+            self._hits[key] += amount
+            if self._since is None:
+                self._since = time.monotonic()
+        self._after_add(conf)
+
+    def _after_add(self, conf):
+        running = self._ensure_thread(conf)
+        if len(self) >= conf['MAX_PENDING']:
+            if running:
+                # Пишет только фоновый поток — просто будим его
+                self._wake.set()
+            else:
+                self.flush()
+
+    def drain(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            events, self._events = self._events, defaultdict(list)
+            hits, self._hits = self._hits, defaultdict(int)
+            self._since = None
+        return pending, events, hits
+
+    def lag(self):
+        """Сколько секунд ждёт сброса самая старая запись буфера."""
+        since = self._since
+        return time.monotonic() - since if since is not None else 0.0
+
+    def flush(self):
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        since = self._since
+        pending, events, hits = self.drain()
+        if not pending and not events and not hits:
+            return 0
+        try:
+            with metrics.COUNTER_FLUSH_DURATION.time(), transaction.atomic():
+                apply_increments(pending)
+                apply_events(events)
+                stats_rows = apply_hits(hits)
+        except Exception:
+            logger.exception('Не удалось сбросить %d счётчиков, %d событий и %d попаданий, вернём их в буфер',
+                             len(pending), sum(len(rows) for rows in events.values()), len(hits))
+            metrics.COUNTER_FLUSH_ERRORS.inc()
+            with self._lock:
+                if self._since is None or (since is not None and since < self._since):
+                    self._since = since
+                for key, delta in pending.items():
+                    self._pending[key] += delta
+                for label, rows in events.items():
+                    self._events[label][:0] = rows
+                for key, n in hits.items():
+                    self._hits[key] += n
+            return 0
+        written = len(pending) + sum(len(rows) for rows in events.values()) + stats_rows
+        metrics.COUNTER_ROWS_WRITTEN.inc(written)
+        return written
+
+    def thread_running(self):
+        # После fork (gunicorn --preload) поток родителя в дочернем процессе не живёт
+        return self._thread is not None and self._pid == os.getpid() and self._thread.is_alive()
+
+    def _ensure_thread(self, conf):
+        """Запускает фоновый поток, если он нужен. Возвращает True, если поток работает."""
+        interval = conf['FLUSH_INTERVAL']
+        if not interval:
+            return False
+        if self.thread_running():
+            return True
+        with self._lock:
+            if self.thread_running():
+                return True
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, args=(interval,), name='banner-counters', daemon=True
+            )
+            self._thread.start()
+        return True
+
+    def _run(self, interval):
+        while not self._stop.is_set():
+            self._wake.wait(interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            finally:
+                # У фонового потока своё соединение — не держим его открытым между сбросами
+                connection.close()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self.flush()
+
+
+_buffer = CounterBuffer()
+
+# Подписчики на каждый записанный просмотр/клик: fn(field, banner_id, title_id, image_id)
+_listeners = []
+
+
+def get_buffer():
+    return _buffer
+
+
+def increment(model, pk, field, amount=1):
+    _buffer.add(model, pk, field, amount)
+
+
+def flush():
+    return _buffer.flush()
+
+
+def add_listener(fn):
+    if fn not in _listeners:
+        _listeners.append(fn)
+
+
+def _record(event_model, field, banner_id, title_id, image_id):
+    metrics.RECORDED.inc(kind=field)
+    for listener in _listeners:
+        listener(field, banner_id, title_id, image_id)
+    if get_config()['STORE'] == 'events':
+        _buffer.add_event(apps.get_model('banners', event_model),
+                          banner_id=banner_id, title_id=title_id, image_id=image_id)
+        return
+    increment(apps.get_model('banners', 'Banner'), banner_id, field)
+    increment(apps.get_model('banners', 'BannerTitle'), title_id, field)
+    increment(apps.get_model('banners', 'BannerImage'), image_id, field)
+    _buffer.add_hit(field, banner_id, title_id, image_id)
+
+
+def record_impression(banner_id, title_id=None, image_id=None):
+    """Просмотр баннера вместе с показанными заголовком и картинкой."""
+    _record('ImpressionEvent', 'views', banner_id, title_id, image_id)
+
+
+def record_click(banner_id, title_id=None, image_id=None):
+    """Клик по баннеру вместе с заголовком и картинкой, по которым кликнули."""
+    _record('ClickEvent', 'clicks', banner_id, title_id, image_id)
+
+
+# Фоновые задачи async-представлений: держим ссылки, чтобы их не собрал GC
+_background_tasks = set()
+
+
+def spawn(coro):
+    """Запускает корутину «выстрелил и забыл» в текущем event loop."""
+    task = asyncio.get_running_loop().create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def _writes_inline(conf):
+    # В буфер без фонового потока или в режиме sync запись идёт прямо в базу
+    return conf['MODE'] == 'sync' or not conf['FLUSH_INTERVAL']
+
+
+async def _arecord(fn, banner_id, title_id, image_id):
+    if _writes_inline(get_config()):
+        spawn(sync_to_async(fn, thread_sensitive=False)(banner_id, title_id, image_id))
+    else:
+        # Только запись в память — event loop не блокируется
+        fn(banner_id, title_id, image_id)
+
+
+async def arecord_impression(banner_id, title_id=None, image_id=None):
+    await _arecord(record_impression, banner_id, title_id, image_id)
+
+
+async def arecord_click(banner_id, title_id=None, image_id=None):
+    await _arecord(record_click, banner_id, title_id, image_id)
+
+
+metrics.registry.collector(
+    'banner_counter_backlog', 'Счётчики и события в буфере, ещё не записанные в базу', lambda: len(_buffer))
+metrics.registry.collector(
+    'banner_counter_flush_lag_seconds', 'Сколько ждёт сброса самая старая запись буфера',
+    _buffer.lag, aggregate='max')
+
+# atexit вызывает в обратном порядке: последний снимок метрик — после сброса счётчиков
+atexit.register(metrics.registry.write)
+# Воркер gunicorn завершается через sys.exit — успеваем сбросить остаток
+atexit.register(_buffer.stop)
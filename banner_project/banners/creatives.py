@@ -0,0 +1,229 @@
+# banners/creatives.py
+"""
+Выбор креативов (картинка + заголовок) сразу для всей страницы баннеров.
+
+Заголовки и картинки баннеров вместе со статистикой (руки бандита) лежат в
+кэше воркера ``ArmCache``. Статистика берётся из дневных строк
+``CreativeStats`` (``banners/stats.py``) — за последние ``STATS_WINDOW_DAYS``
+дней или за всё время, — а не из горячих счётчиков креативов. Кэш
+сбрасывается при изменении креативов (версия ``creatives``), собственные
+просмотры и клики воркера применяет к себе сразу, а чужие подтягивает одним
+запросом статистики раз в ``STATS_TTL`` секунд.
+Выбор для всей страницы — один векторный вызов политики из
+``banners/bandits.py`` на каждую политику, встретившуюся на странице.
+
+Политика берётся из ``Banner.selection_policy``, затем из
+``settings.BANNER_SELECTION['OWNER_POLICIES'][owner_id]``, затем
+``DEFAULT_POLICY``.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils.timezone import now
+
+from . import counters, invalidation, metrics, stats
+from .bandits import get_policy
+from .models import BannerImage, BannerTitle
+
+VERSION_NAME = 'creatives'
+
+# Без языка: выбираем среди всех заголовков баннера
+ANY_LANGUAGE = object()
+
+# language_id заголовка без языка в массиве языков
+NO_LANGUAGE = -1
+
+DEFAULTS = {
+    'DEFAULT_POLICY': 'legacy',
+    'OWNER_POLICIES': {},
+    'STATS_TTL': 60.0,
+    # Окно статистики для бандитов в днях; None — всё время
+    'STATS_WINDOW_DAYS': None,
+}
+
+
+def get_config():
+    conf = dict(DEFAULTS)
+    conf.update(getattr(settings, 'BANNER_SELECTION', {}))
+    return conf
+
+
+class BannerArms:
+    """Креативы одного баннера и их статистика ``[[clicks, views], ...]``."""
+    __slots__ = ('titles', 'title_languages', 'title_stats', 'images', 'image_stats', 'loaded_at')
+
+    def __init__(self, titles, images, loaded_at, totals=None):
+        totals = totals or {}
+        self.titles = titles
+        self.title_languages = np.array(
+            [t.language_id if t.language_id is not None else NO_LANGUAGE for t in titles], dtype=np.int64
+        )
+        self.title_stats = np.array([totals.get(('title', t.id), (0, 0)) for t in titles],
+                                    dtype=np.int64).reshape(-1, 2)
+        self.images = images
+        self.image_stats = np.array([totals.get(('image', i.id), (0, 0)) for i in images],
+                                    dtype=np.int64).reshape(-1, 2)
+        self.loaded_at = loaded_at
+
+    def title_candidates(self, language):
+        """Индексы заголовков, среди которых выбирать для ``language``."""
+        if language is ANY_LANGUAGE or not len(self.titles):
+            return np.arange(len(self.titles))
+        language_id = language.pk if language is not None else NO_LANGUAGE
+        localized = np.flatnonzero(self.title_languages == language_id)
+        return localized if len(localized) else np.arange(len(self.titles))
+
+
+class ArmCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._arms = {}
+        # id креатива -> (BannerArms, индекс в массиве статистики)
+        self._titles = {}
+        self._images = {}
+        self._version = None
+
+    def get_many(self, banner_ids):
+        version = invalidation.get_version(VERSION_NAME)
+        with self._lock:
+            if version != self._version:
+                self._arms, self._titles, self._images = {}, {}, {}
+                self._version = version
+            arms = self._arms
+
+        missing = [banner_id for banner_id in banner_ids if banner_id not in arms]
+        if missing:
+            self._load(missing)
+
+        deadline = time.monotonic() - get_config()['STATS_TTL']
+        stale = [banner_id for banner_id in banner_ids
+                 if banner_id in arms and arms[banner_id].loaded_at < deadline]
+        if stale:
+            self._refresh_stats(stale)
+
+        arms = self._arms
+        return {banner_id: arms[banner_id] for banner_id in banner_ids if banner_id in arms}
+
+    def _load(self, banner_ids):
+        titles = defaultdict(list)
+        images = defaultdict(list)
+        for title in BannerTitle.objects.filter(banner_id__in=banner_ids).order_by('id'):
+            titles[title.banner_id].append(title)
+        for image in BannerImage.objects.filter(banner_id__in=banner_ids).order_by('id'):
+            images[image.banner_id].append(image)
+        totals = _stats_totals(banner_ids)
+
+        loaded_at = time.monotonic()
+        with self._lock:
+            for banner_id in banner_ids:
+                arms = BannerArms(titles[banner_id], images[banner_id], loaded_at, totals)
+                self._arms[banner_id] = arms
+                for idx, title in enumerate(arms.titles):
+                    self._titles[title.id] = (arms, idx)
+                for idx, image in enumerate(arms.images):
+                    self._images[image.id] = (arms, idx)
+
+    def _refresh_stats(self, banner_ids):
+        loaded_at = time.monotonic()
+        indexes = {'title': (self._titles, 'title_stats'), 'image': (self._images, 'image_stats')}
+        for (kind, creative_id), (clicks, views) in _stats_totals(banner_ids).items():
+            index, attr = indexes[kind]
+            if creative_id in index:
+                arms, idx = index[creative_id]
+                getattr(arms, attr)[idx] = (clicks, views)
+        for banner_id in banner_ids:
+            if banner_id in self._arms:
+                self._arms[banner_id].loaded_at = loaded_at
+
+    def record(self, field, banner_id, title_id, image_id):
+        """Применяет собственный просмотр/клик воркера к закэшированной статистике."""
+        column = 0 if field == 'clicks' else 1
+        for index, creative_id, attr in ((self._titles, title_id, 'title_stats'),
+                                         (self._images, image_id, 'image_stats')):
+            entry = index.get(creative_id)
+            if entry is not None:
+                arms, idx = entry
+                getattr(arms, attr)[idx, column] += 1
+
+    def clear(self):
+        with self._lock:
+            self._arms, self._titles, self._images = {}, {}, {}
+            self._version = None
+
+
+def _stats_totals(banner_ids):
+    days = get_config()['STATS_WINDOW_DAYS']
+    since = now() - timedelta(days=days) if days else None
+    return stats.creative_totals(banner_ids, since)
+
+
+_cache = ArmCache()
+counters.add_listener(_cache.record)
+metrics.registry.collector('banner_arm_cache_banners', 'Баннеров с креативами в кэше воркера',
+                           lambda: len(_cache._arms))
+
+_rng = np.random.default_rng()
+
+
+def get_arm_cache():
+    return _cache
+
+
+def policy_name_for(banner, conf):
+    if banner.selection_policy:
+        return banner.selection_policy
+    owner_policies = conf['OWNER_POLICIES']
+    return owner_policies.get(banner.owner_id, conf['DEFAULT_POLICY'])
+
+
+def _choose(policy, arms_list, candidates, kind, rng):
+    """Выбирает по одной руке в каждой непустой группе. Возвращает индексы или None."""
+    stats_attr = 'title_stats' if kind == 'title' else 'image_stats'
+    chosen = [None] * len(arms_list)
+    groups = [(pos, idx) for pos, idx in enumerate(candidates) if len(idx)]
+    if not groups:
+        return chosen
+
+    stats = np.concatenate([getattr(arms_list[pos], stats_attr)[idx] for pos, idx in groups])
+    picks = policy.choose(stats[:, 0], stats[:, 1], [len(idx) for _, idx in groups], kind=kind, rng=rng)
+    for (pos, idx), pick in zip(groups, picks):
+        chosen[pos] = idx[pick]
+    return chosen
+
+
+def resolve_creatives(banners, language=ANY_LANGUAGE, rng=None):
+    """
+    Возвращает список пар ``(image, title)`` в порядке ``banners``.
+
+    Если передан ``language``, заголовок берётся среди заголовков на этом
+    языке (как ``Banner.get_title_for_language``), а если таких нет — среди
+    всех заголовков баннера.
+    """
+    with metrics.CREATIVE_SELECTION.time():
+        return _resolve_creatives(list(banners), language, rng if rng is not None else _rng)
+
+
+def _resolve_creatives(banners, language, rng):
+    conf = get_config()
+    arms_by_id = _cache.get_many([banner.id for banner in banners])
+
+    by_policy = defaultdict(list)
+    for pos, banner in enumerate(banners):
+        by_policy[policy_name_for(banner, conf)].append(pos)
+
+    pairs = [(None, None)] * len(banners)
+    for name, positions in by_policy.items():
+        policy = get_policy(name)
+        arms_list = [arms_by_id.get(banners[pos].id) or BannerArms([], [], 0) for pos in positions]
+        titles = _choose(policy, arms_list, [a.title_candidates(language) for a in arms_list], 'title', rng)
+        images = _choose(policy, arms_list, [np.arange(len(a.images)) for a in arms_list], 'image', rng)
+        for pos, arms, title_idx, image_idx in zip(positions, arms_list, titles, images):
+            pairs[pos] = (
+                arms.images[image_idx] if image_idx is not None else None,
+                arms.titles[title_idx] if title_idx is not None else None,
+            )
+    return pairs
@@ -0,0 +1,193 @@
+# banners/db_router.py
+"""
+Чтение страниц с реплики, запись — в основную базу.
+
+``ReplicaRouter`` (``DATABASE_ROUTERS``) отправляет чтения на
+``READ_ALIAS`` только внутри запроса, который ``DatabaseRoutingMiddleware``
+признал читающим: безопасный метод (GET/HEAD/OPTIONS) и нет cookie
+``STICKY_COOKIE``. Всё остальное — POST-запросы, команды, фоновые потоки
+счётчиков и копий картинок — читает и пишет основную базу, поэтому вьюхи и
+``OwnedAdmin`` не выбирают базу сами.
+
+Read-your-writes: после записи в запросе его дальнейшие чтения идут в
+основную базу, а ответ на POST с записью ставит cookie на
+``STICKY_SECONDS`` — админка после «Сохранить» видит свои изменения, пока
+реплика догоняет. Чтения внутри ``transaction.atomic()`` тоже идут в
+основную базу.
+
+``VIEW_ALIASES`` (``{имя URL: алиас}``) отдаёт чтения отдельных вьюх своему
+алиасу — например, переходы ``/go/`` читают через ``redirect`` с коротким
+таймаутом запроса (``settings/postgres.py``).
+
+Без ``READ_ALIAS`` (или если такого алиаса нет в ``DATABASES``) роутер
+ничего не меняет; алиасы из ``VIEW_ALIASES``, которых нет в ``DATABASES``,
+пропускаются.
+
+``STATEMENT_TIMEOUTS`` (``{имя URL: мс}``) — для базы без реплики: страницы
+читают ``default``, и на время их вьюх сессии PostgreSQL выставляется
+короткий ``statement_timeout``, а остальные вьюхи возвращают таймаут алиаса.
+SET уходит, только когда сессия в другом состоянии, поэтому поток страниц
+платит за него раз на соединение (и на соединение из пула).
+"""
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+DEFAULTS = {
+    'READ_ALIAS': None,
+    'STICKY_SECONDS': 10,
+    'STICKY_COOKIE': 'banner_db_primary',
+    'VIEW_ALIASES': {},
+    'STATEMENT_TIMEOUTS': {},
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def get_config():
+    conf = dict(DEFAULTS)
+    conf.update(getattr(settings, 'BANNER_DB_ROUTING', {}))
+    return conf
+
+
+def _usable(alias):
+    return alias if alias and alias != DEFAULT_DB_ALIAS and alias in connections.databases else None
+
+
+def read_alias():
+    """Алиас реплики или ``None``, если чтение с реплики выключено."""
+    return _usable(get_config()['READ_ALIAS'])
+
+
+# statement_timeout, выставленный сессии через SET: {соединение драйвера: мс}.
+# Состояние живёт вместе с соединением — и постоянным, и взятым из пула
+_session_timeouts = weakref.WeakKeyDictionary()
+
+
+def apply_statement_timeout(connection, timeout_ms):
+    """
+    Выставляет ``statement_timeout`` сессии PostgreSQL; ``None`` — вернуть
+    таймаут из ``OPTIONS`` алиаса. Ничего не шлёт, если сессия уже такая.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    if connection.connection is None:
+        if timeout_ms is None:
+            return
+        connection.ensure_connection()
+    raw = connection.connection
+    if _session_timeouts.get(raw) == timeout_ms:
+        return
+    with connection.cursor() as cursor:
+        if timeout_ms is None:
+            cursor.execute('RESET statement_timeout')
+        else:
+            cursor.execute(f'SET statement_timeout = {int(timeout_ms)}')
+    if timeout_ms is None:
+        _session_timeouts.pop(raw, None)
+    else:
+        _session_timeouts[raw] = timeout_ms
+
+
+class _Scope:
+    def __init__(self, alias):
+        self.alias = alias
+        self.wrote = False
+
+
+_scope = ContextVar('banner_db_scope', default=None)
+
+
+@contextmanager
+def _scoped(alias):
+    scope = _Scope(alias)
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+
+def replica_reads():
+    """Чтения внутри блока идут на реплику, пока в нём ничего не записано."""
+    return _scoped(read_alias())
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        scope = _scope.get()
+        if scope is None or scope.alias is None or scope.wrote:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return scope.alias
+
+    def db_for_write(self, model, **hints):
+        scope = _scope.get()
+        if scope is not None:
+            scope.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика — та же база с задержкой: объекты с неё и из основной связываются
+        aliases = {DEFAULT_DB_ALIAS, get_config()['READ_ALIAS']}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db == get_config()['READ_ALIAS'] and db != DEFAULT_DB_ALIAS:
+            return False
+        return None
+
+
+class DatabaseRoutingMiddleware:
+    """Открывает для запроса область чтения с реплики и ставит cookie после записи."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def _reads_replica(self, request, conf):
+        return request.method in SAFE_METHODS and conf['STICKY_COOKIE'] not in request.COOKIES
+
+    def _alias(self, request, conf):
+        return read_alias() if self._reads_replica(request, conf) else None
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        conf = get_config()
+        with _scoped(self._alias(request, conf)) as scope:
+            response = self.get_response(request)
+        return self._finish(conf, request, scope, response)
+
+    async def __acall__(self, request):
+        conf = get_config()
+        with _scoped(self._alias(request, conf)) as scope:
+            response = await self.get_response(request)
+        return self._finish(conf, request, scope, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        conf = get_config()
+        scope = _scope.get()
+        view_name = request.resolver_match.view_name
+        alias = _usable(conf['VIEW_ALIASES'].get(view_name))
+        if scope is not None and alias and self._reads_replica(request, conf):
+            scope.alias = alias
+        if conf['STATEMENT_TIMEOUTS']:
+            apply_statement_timeout(connections[DEFAULT_DB_ALIAS], conf['STATEMENT_TIMEOUTS'].get(view_name))
+
+    def _finish(self, conf, request, scope, response):
+        if scope.wrote and request.method not in SAFE_METHODS and read_alias():
+            response.set_cookie(conf['STICKY_COOKIE'], '1', max_age=conf['STICKY_SECONDS'],
+                                httponly=True, samesite='Lax')
+        return response
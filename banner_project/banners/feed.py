@@ -0,0 +1,148 @@
+# banners/feed.py
+"""
+Лента главной страницы: все сочетания баннер × картинка × заголовок, но без
+построения их полного списка.
+
+``FeedIndex`` хранит для каждого баннера его картинки и заголовки и
+накопленные смещения, так что i-е сочетание находится бинарным поиском.
+Порядок ленты — псевдослучайная перестановка ``i -> (a*i + c) mod N`` с
+параметрами из зерна курсора, поэтому страница стоит O(размер страницы)
+независимо от размера каталога.
+
+Индекс живёт в памяти воркера и перестраивается раз в ``REBUILD_INTERVAL``
+секунд или когда меняются баннеры или креативы.
+"""
+import bisect
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+from . import invalidation
+from .click_tokens import make_token
+from .creatives import VERSION_NAME as CREATIVES_VERSION
+from .models import Banner, BannerImage, BannerTitle
+from .tag_index import VERSION_NAME as CATALOG_VERSION
+
+DEFAULTS = {
+    'PAGE_SIZE': 30,
+    'REBUILD_INTERVAL': 300.0,
+}
+
+
+def get_config():
+    conf = dict(DEFAULTS)
+    conf.update(getattr(settings, 'BANNER_FEED', {}))
+    return conf
+
+
+class FeedIndex:
+    def __init__(self, version, banners):
+        # banners: [(banner_id, link_url, [(image_id, url), ...], [(title_id, text), ...]), ...]
+        self.version = version
+        self.built_at = time.monotonic()
+        self.banners = [b for b in banners if b[2] and b[3]]
+        self.offsets = []
+        total = 0
+        for _, _, images, titles in self.banners:
+            self.offsets.append(total)
+            total += len(images) * len(titles)
+        self.total = total
+
+    def __len__(self):
+        return self.total
+
+    def item(self, i):
+        pos = bisect.bisect_right(self.offsets, i) - 1
+        banner_id, link_url, images, titles = self.banners[pos]
+        image_idx, title_idx = divmod(i - self.offsets[pos], len(titles))
+        image_id, image_url = images[image_idx]
+        title_id, title_text = titles[title_idx]
+        return {
+            'image_url': image_url,
+            'title': title_text,
+            'ad_link': reverse('banner_redirect_token', args=[make_token(banner_id, title_id, image_id, link_url)]),
+        }
+
+    @classmethod
+    def build(cls, version):
+        images = defaultdict(list)
+        titles = defaultdict(list)
+        for image_id, banner_id, name in BannerImage.objects.order_by('id').values_list('id', 'banner_id', 'image'):
+            if name:
+                images[banner_id].append((image_id, default_storage.url(name)))
+        for title_id, banner_id, text in BannerTitle.objects.order_by('id').values_list('id', 'banner_id', 'text'):
+            titles[banner_id].append((title_id, text))
+        links = dict(Banner.objects.filter(id__in=images.keys() & titles.keys()).values_list('id', 'link_url'))
+        return cls(version, [
+            (banner_id, links[banner_id], images[banner_id], titles[banner_id])
+            for banner_id in sorted(links)
+        ])
+
+
+class Permutation:
+    """Перестановка ``0..n-1`` вида ``(a*i + c) mod n`` с параметрами из зерна."""
+
+    def __init__(self, n, seed):
+        self.n = n
+        rng = random.Random(seed)
+        self.c = rng.randrange(n) if n else 0
+        a = rng.randrange(1, n) if n > 1 else 1
+        while math.gcd(a, n) != 1:
+            a = a % (n - 1) + 1
+        self.a = a
+
+    def __getitem__(self, i):
+        return (self.a * i + self.c) % self.n
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_feed_index():
+    global _index
+    # Ссылки перехода зашиты в токены, поэтому следим и за самими баннерами
+    version = (invalidation.get_version(CREATIVES_VERSION), invalidation.get_version(CATALOG_VERSION))
+    index = _index
+    deadline = time.monotonic() - get_config()['REBUILD_INTERVAL']
+    if index is not None and index.version == version and index.built_at >= deadline:
+        return index
+    with _lock:
+        if _index is None or _index.version != version or _index.built_at < deadline:
+            _index = FeedIndex.build(version)
+        return _index
+
+
+def encode_cursor(seed, offset):
+    return f"{seed:x}.{offset:x}"
+
+
+def decode_cursor(cursor):
+    try:
+        seed, offset = cursor.split('.')
+        return int(seed, 16), int(offset, 16)
+    except (AttributeError, ValueError):
+        return None
+
+
+def feed_page(cursor=None, size=None):
+    """
+    Возвращает ``(items, next_cursor)``. Без курсора начинает новую ленту со
+    случайным зерном; дойдя до конца перестановки, лента идёт по кругу.
+    """
+    index = get_feed_index()
+    if not len(index):
+        return [], None
+    size = min(size or get_config()['PAGE_SIZE'], len(index))
+
+    state = decode_cursor(cursor) if cursor else None
+    seed, offset = state if state else (random.getrandbits(32), 0)
+    permutation = Permutation(len(index), seed)
+    items = [index.item(permutation[(offset + k) % len(index)]) for k in range(size)]
+    return items, encode_cursor(seed, (offset + size) % len(index))
@@ -0,0 +1,77 @@
+# banners/invalidation.py
+"""
+Версии закэшированных в памяти воркера структур (индексы, кэши рендера).
+
+Каждая структура помнит версию, с которой была построена. Сигналы при
+изменении данных поднимают версию в общем кэше Django, и каждый воркер при
+следующем обращении видит, что его копия устарела, и перестраивает её.
+Чтобы версия поднималась во всех воркерах, в проде ``CACHES['default']``
+должен быть общим (файловый кэш, memcached, redis).
+
+Подъём версии может нести список изменённых id — он ложится в журнал рядом
+с версией, и структура, которая умеет обновляться по частям, берёт из
+журнала только изменения (``changes_since``). Если какой-то записи в журнале
+нет (вытеснена, подъём без списка), структура перестраивается целиком.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+KEY_PREFIX = 'banners:version:'
+CHANGES_PREFIX = 'banners:changes:'
+# Сколько хранить журнал и сколько версий из него готовы склеивать
+CHANGES_TIMEOUT = 3600
+MAX_CHANGES_VERSIONS = 100
+
+
+def get_version(name):
+    key = KEY_PREFIX + name
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, timeout=None)
+        version = cache.get(key, 1)
+    return version
+
+
+def _changes_key(name, version):
+    return f'{CHANGES_PREFIX}{name}:{version}'
+
+
+def _bump(name, changes=None):
+    key = KEY_PREFIX + name
+    try:
+        version = cache.incr(key)
+    except ValueError:
+        # Версию создал кто-то другой или мы — номер неизвестен, журнал не пишем
+        cache.add(key, 2, timeout=None)
+        return
+    if changes is not None:
+        cache.set(_changes_key(name, version), changes, CHANGES_TIMEOUT)
+
+
+def bump_version(name, changes=None):
+    """
+    Поднимает версию сразу и ещё раз после коммита: если другой воркер успел
+    перестроиться по незакоммиченным данным, второй подъём заставит его
+    перестроиться снова. ``changes`` — id изменённых объектов для журнала.
+    """
+    if changes is not None:
+        changes = sorted(set(changes))
+    _bump(name, changes)
+    transaction.on_commit(lambda: _bump(name, changes))
+
+
+def changes_since(name, since, version):
+    """
+    Объединение изменений между версиями ``since`` (не включая) и ``version``.
+    ``None`` — журнал неполон, нужна полная перестройка.
+    """
+    if not since < version <= since + MAX_CHANGES_VERSIONS:
+        return None
+    keys = [_changes_key(name, v) for v in range(since + 1, version + 1)]
+    entries = cache.get_many(keys)
+    if len(entries) != len(keys):
+        return None
+    changed = set()
+    for ids in entries.values():
+        changed.update(ids)
+    return changed
@@ -0,0 +1,77 @@
+# banners/layout.py
+"""
+Разметка слотов ``[BANNER_SLOT_n]`` в тексте ``WrittenArticle``.
+
+Текст разбирается один раз при сохранении статьи в список сегментов:
+строки — статические куски HTML, целые числа — номера слотов. Рендер —
+это один ``''.join`` кусков и HTML баннеров, без повторных проходов по
+всему тексту на каждый слот.
+
+Правила те же, что были у последовательного ``str.replace``: слоты
+заполняются по номерам 1, 2, 3, … до первого пропущенного номера, каждый
+номер — только в первом вхождении. Всё остальное остаётся в тексте как есть
+и попадает в список проблем.
+"""
+import re
+
+SLOT_RE = re.compile(r'\[BANNER_SLOT_([1-9]\d*)\]')
+
+
+def slot_marker(number):
+    return f'[BANNER_SLOT_{number}]'
+
+
+def compile_layout(content):
+    """Возвращает ``(segments, problems)``."""
+    content = content or ''
+    first = {}
+    problems = []
+    for match in SLOT_RE.finditer(content):
+        number = int(match.group(1))
+        if number in first:
+            problems.append(f'Слот {number} встречается больше одного раза, заполнится только первый')
+        else:
+            first[number] = match
+
+    slot_count = 0
+    while slot_count + 1 in first:
+        slot_count += 1
+
+    ignored = sorted(number for number in first if number > slot_count)
+    if ignored:
+        problems.append(
+            f'Нет слота {slot_count + 1}, поэтому слоты {", ".join(map(str, ignored))} не заполнятся'
+        )
+
+    used = sorted((first[number] for number in range(1, slot_count + 1)), key=lambda m: m.start())
+    text_order = [int(m.group(1)) for m in used]
+    if text_order != sorted(text_order):
+        problems.append(
+            'Слоты идут не по порядку: ' + ', '.join(map(str, text_order))
+        )
+
+    segments = []
+    position = 0
+    for match in used:
+        if match.start() > position:
+            segments.append(content[position:match.start()])
+        segments.append(int(match.group(1)))
+        position = match.end()
+    if position < len(content):
+        segments.append(content[position:])
+    return segments, problems
+
+
+def slot_count(segments):
+    return sum(1 for segment in segments if isinstance(segment, int))
+
+
+def render_layout(segments, fragments):
+    """
+    Склеивает сегменты. ``fragments`` — ``{номер слота: html}``; слоты, на
+    которые не хватило баннеров, остаются в тексте маркером, как и раньше.
+    """
+    return ''.join(
+        fragments.get(segment, slot_marker(segment)) if isinstance(segment, int) else segment
+        for segment in segments
+    )
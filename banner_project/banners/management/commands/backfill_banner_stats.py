@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from banners import stats
+
+
+class Command(BaseCommand):
+    help = 'Переносит в дневную статистику счётчики, которых в ней ещё нет (правки в обход конвейера)'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Записано строк статистики: {stats.backfill()}')
@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from banners.benchmark import run_benchmark
+
+VIEWS = (
+    'homepage',
+    'article_with_banners',
+    'written_article_with_banners',
+    'banner_redirect_token',
+    'banner_redirect',
+)
+
+
+class Command(BaseCommand):
+    help = 'Замеряет страницы баннеров (p50/p95, SQL-запросы, записанные строки) и печатает JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на страницу')
+        parser.add_argument('--warmup', type=int, default=20, help='Прогревочных запросов (не считаются)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--views', default=','.join(VIEWS), help='Какие страницы гонять, через запятую')
+        parser.add_argument('--prefix', default=None,
+                            help='Брать только статьи синтетического каталога с этим префиксом')
+        parser.add_argument('--counters-mode', choices=('sync', 'buffered'), default=None,
+                            help='Переопределить BANNER_COUNTERS["MODE"] на время замера')
+        parser.add_argument('--output', default=None, help='Записать JSON в файл вместо stdout')
+
+    def handle(self, *args, **options):
+        views = [name for name in options['views'].split(',') if name]
+        unknown = set(views) - set(VIEWS)
+        if unknown:
+            raise CommandError(f'Неизвестные страницы: {", ".join(sorted(unknown))}')
+        if options['requests'] < 1:
+            raise CommandError('--requests должно быть не меньше 1')
+
+        report = run_benchmark(
+            requests=options['requests'], warmup=options['warmup'], seed=options['seed'],
+            views=views, prefix=options['prefix'], counters_mode=options['counters_mode'],
+        )
+        data = json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(data + '\n')
+        else:
+            self.stdout.write(data)
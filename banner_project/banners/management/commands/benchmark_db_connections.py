@@ -0,0 +1,29 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from banners.connection_benchmark import PROFILES, available_profiles, run_benchmark
+
+
+class Command(BaseCommand):
+    help = ('Замеряет цену соединения с базой на запрос: новое соединение, постоянное '
+            'с проверкой живости и пул (PostgreSQL). Печатает JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Алиас базы из DATABASES')
+        parser.add_argument('--requests', type=int, default=500, help='Сколько запросов на профиль')
+        parser.add_argument('--profiles', default='',
+                            help=f'Профили через запятую из {", ".join(PROFILES)} (по умолчанию все доступные)')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias not in connections.databases:
+            raise CommandError(f'Нет алиаса {alias} в DATABASES')
+        profiles = [name for name in options['profiles'].split(',') if name]
+        unavailable = set(profiles) - set(available_profiles(alias))
+        if unavailable:
+            raise CommandError(f'Профили недоступны для этой базы: {", ".join(sorted(unavailable))}')
+
+        report = run_benchmark(profiles, alias=alias, requests=options['requests'])
+        self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
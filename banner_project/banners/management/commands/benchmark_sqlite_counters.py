@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from banners.write_benchmark import PROFILES, run_benchmark
+
+
+class Command(BaseCommand):
+    help = ('Замеряет запись счётчиков в SQLite несколькими процессами: профиль по умолчанию '
+            'против WAL с одним писателем на процесс. Печатает JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4, help='Сколько процессов-воркеров пишут разом')
+        parser.add_argument('--seconds', type=float, default=5.0, help='Сколько секунд пишет каждый процесс')
+        parser.add_argument('--profiles', default=','.join(PROFILES), help='Какие профили сравнить, через запятую')
+        parser.add_argument('--output', default=None, help='Записать JSON в файл вместо stdout')
+
+    def handle(self, *args, **options):
+        profiles = [name for name in options['profiles'].split(',') if name]
+        unknown = set(profiles) - set(PROFILES)
+        if unknown:
+            raise CommandError(f'Неизвестные профили: {", ".join(sorted(unknown))}')
+
+        report = run_benchmark(profiles, processes=options['processes'], seconds=options['seconds'])
+        data = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(data + '\n')
+        else:
+            self.stdout.write(data)
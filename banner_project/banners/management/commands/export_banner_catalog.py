@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from banners import catalog_io
+from banners.models import Banner
+
+
+class Command(BaseCommand):
+    help = 'Выгружает каталог баннеров в CSV или JSONL (в файл или stdout)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=catalog_io.FORMATS, default='jsonl')
+        parser.add_argument('--output', help='Файл; по умолчанию stdout')
+        parser.add_argument('--owner', help='Только баннеры этого username')
+        parser.add_argument('--chunk-size', type=int, default=catalog_io.CHUNK_SIZE,
+                            help='Сколько баннеров читать за один проход')
+
+    def handle(self, *args, **options):
+        queryset = Banner.objects.all()
+        if options['owner']:
+            queryset = queryset.filter(owner__username=options['owner'])
+        lines = catalog_io.export_lines(options['format'], queryset, options['chunk_size'])
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
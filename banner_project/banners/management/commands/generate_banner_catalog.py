@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from banners.synthetic import DEFAULTS, clear_catalog, generate_catalog
+
+
+class Command(BaseCommand):
+    help = 'Создаёт синтетический каталог баннеров и статей для нагрузочных замеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='synthetic',
+                            help='Префикс имён и slug-ов, по нему каталог можно удалить')
+        parser.add_argument('--seed', type=int, default=0, help='Один seed — один и тот же каталог')
+        parser.add_argument('--clear', action='store_true',
+                            help='Сначала удалить каталог с этим префиксом')
+        parser.add_argument('--languages', default=','.join(DEFAULTS['languages']),
+                            help='Коды языков заголовков через запятую')
+        for name, value in DEFAULTS.items():
+            if isinstance(value, int):
+                parser.add_argument(f'--{name.replace("_", "-")}', type=int, default=value)
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            self.stdout.write(f'Удалено объектов: {clear_catalog(options["prefix"])}')
+
+        sizes = {name: options[name] for name, value in DEFAULTS.items() if isinstance(value, int)}
+        sizes['languages'] = [code for code in options['languages'].split(',') if code]
+        created = generate_catalog(prefix=options['prefix'], seed=options['seed'], **sizes)
+        self.stdout.write(', '.join(f'{name}: {n}' for name, n in created.items()))
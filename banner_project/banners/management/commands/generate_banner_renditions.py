@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from banners import renditions
+from banners.models import BannerImage
+
+
+class Command(BaseCommand):
+    help = 'Строит уменьшенные копии картинок баннеров, которых ещё нет (или для всех с --all)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Перестроить копии всех картинок')
+        parser.add_argument('--workers', type=int, default=renditions.get_config()['WORKERS'],
+                            help='Сколько процессов Pillow запустить (0 — в текущем процессе)')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            image_ids = (BannerImage.objects.exclude(image='').exclude(image__isnull=True)
+                         .order_by('id').values_list('id', flat=True).iterator(chunk_size=1000))
+        else:
+            image_ids = renditions.missing()
+        total = renditions.generate_many(image_ids, workers=options['workers'])
+        self.stdout.write(f'Построены копии для картинок: {total}')
@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from banners import catalog_io
+
+
+class Command(BaseCommand):
+    help = 'Импортирует баннеры с заголовками, картинками и тегами из CSV или JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл каталога; формат определяется по расширению')
+        parser.add_argument('--format', choices=catalog_io.FORMATS,
+                            help='Формат файла, если расширение не .csv/.jsonl')
+        parser.add_argument('--owner', help='Username владельца всех баннеров (иначе — колонка owner)')
+        parser.add_argument('--chunk-size', type=int, default=catalog_io.CHUNK_SIZE,
+                            help='Сколько баннеров создавать в одной транзакции')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if fmt not in catalog_io.FORMATS:
+            raise CommandError(f'Не удалось определить формат {path}, укажите --format')
+
+        owner = None
+        if options['owner']:
+            try:
+                owner = get_user_model().objects.get(username=options['owner'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f'Нет пользователя {options["owner"]}')
+
+        with open(path, encoding='utf-8', newline='') as lines:
+            try:
+                total = catalog_io.import_catalog(catalog_io.read_records(lines, fmt), owner=owner,
+                                                  chunk_size=options['chunk_size'])
+            except ValueError as exc:
+                raise CommandError(f'Импорт остановлен: {exc}')
+        self.stdout.write(f'Импортировано баннеров: {total}')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from banners import serving
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает таблицу выдачи баннеров (теги и активность)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=serving.BATCH_SIZE,
+                            help='Сколько баннеров пересчитывать за один проход')
+
+    def handle(self, *args, **options):
+        total = serving.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(f'Пересчитано строк выдачи: {total}')
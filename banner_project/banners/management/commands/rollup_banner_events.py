@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from banners.rollup import rollup_events
+
+
+class Command(BaseCommand):
+    help = 'Сворачивает журнал просмотров/кликов в счётчики баннеров и дневную статистику'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Сколько событий обрабатывать за одну транзакцию')
+        parser.add_argument('--loop', type=float, default=0,
+                            help='Повторять каждые N секунд (по умолчанию — один проход)')
+
+    def handle(self, *args, **options):
+        while True:
+            totals = rollup_events(batch_size=options['batch_size'])
+            self.stdout.write(', '.join(f'{name}: {n}' for name, n in totals.items()))
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
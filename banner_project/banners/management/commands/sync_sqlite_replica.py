@@ -0,0 +1,38 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from banners.db_router import read_alias
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в файл реплики (READ_ALIAS) через backup API — '
+            'локальная замена репликации для проверки чтения с реплики')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять копирование каждые N секунд (0 — один раз)')
+
+    def handle(self, *args, **options):
+        alias = read_alias()
+        if alias is None:
+            raise CommandError('Чтение с реплики выключено: задайте BANNER_SQLITE_REPLICA_PATH')
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        replica = connections[alias].settings_dict
+        if primary['ENGINE'] != replica['ENGINE'] or not primary['ENGINE'].endswith('sqlite3'):
+            raise CommandError('Команда копирует только SQLite в SQLite')
+        if str(primary['NAME']) == str(replica['NAME']):
+            raise CommandError('Реплика и основная база — один и тот же файл')
+
+        while True:
+            started = time.monotonic()
+            with sqlite3.connect(primary['NAME']) as source, sqlite3.connect(replica['NAME']) as target:
+                source.backup(target)
+            source.close()
+            target.close()
+            self.stdout.write(f'{primary["NAME"]} -> {replica["NAME"]} за {time.monotonic() - started:.2f} с')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,357 @@
+# banners/metrics.py
+"""
+Метрики баннеров в формате Prometheus.
+
+Счётчики и гистограммы живут в памяти воркера (``Registry``). Состояние,
+которое и так есть в модулях (очередь счётчиков, хиты кэша оболочек), не
+дублируется — модули регистрируют функции-«сборщики», которые читаются в
+момент снимка.
+
+Под gunicorn у каждого воркера своя память, поэтому в режиме ``file`` воркер
+не чаще раза в ``WRITE_INTERVAL`` секунд сбрасывает снимок в
+``DIRECTORY/metrics-<pid>.json``, а ``/internal/metrics/`` складывает
+снимки всех воркеров: счётчики суммируются (в том числе от завершившихся
+воркеров — так они не убывают), показатели — только от живых процессов.
+Режим ``local`` отдаёт метрики одного процесса.
+"""
+import hmac
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MODE': 'local',
+    'DIRECTORY': os.path.join(tempfile.gettempdir(), 'banner_project_metrics'),
+    'WRITE_INTERVAL': 1.0,
+    # Кому отдавать /internal/metrics/; TOKEN — дополнительно Authorization: Bearer
+    'ALLOWED_IPS': ('127.0.0.1', '::1'),
+    'TOKEN': '',
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def get_config():
+    conf = dict(DEFAULTS)
+    conf.update(getattr(settings, 'BANNER_METRICS', {}))
+    return conf
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.registry.changed()
+
+    def samples(self):
+        return [[list(key), value] for key, value in self.values.items()]
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # ключ -> [счётчики по корзинам (не накопленные)..., +Inf, сумма]
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        position = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                position = i
+                break
+        with self.registry.lock:
+            row = self.values.get(key)
+            if row is None:
+                row = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[position] += 1
+            row[-1] += value
+        self.registry.changed()
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        return [[list(key), list(row)] for key, row in self.values.items()]
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        # имя -> (тип, описание, fn, как складывать воркеры: 'sum' | 'max' | None — глобальное, метки)
+        self.collectors = {}
+        self._next_write = 0.0
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.metrics.setdefault(name, Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.metrics.setdefault(name, Histogram(self, name, documentation, labelnames, buckets))
+
+    def collector(self, name, documentation, fn, kind='gauge', aggregate='sum', labelnames=()):
+        """
+        Значение, которое читается в момент снимка: ``fn()`` возвращает число
+        или, при ``labelnames``, ``{(значения меток, ...): число}``.
+        ``aggregate=None`` — общее для всех воркеров значение (например, из
+        базы), считается только при отдаче метрик.
+        """
+        self.collectors[name] = (kind, documentation, fn, aggregate, tuple(labelnames))
+
+    def snapshot(self, include_global=False):
+        metrics = {}
+        with self.lock:
+            for metric in self.metrics.values():
+                metrics[metric.name] = {
+                    'type': metric.type,
+                    'help': metric.documentation,
+                    'labels': list(metric.labelnames),
+                    'buckets': list(getattr(metric, 'buckets', ())),
+                    'samples': metric.samples(),
+                }
+        for name, (kind, documentation, fn, aggregate, labelnames) in self.collectors.items():
+            if aggregate is None and not include_global:
+                continue
+            try:
+                value = fn()
+            except Exception:
+                logger.exception('Не удалось собрать метрику %s', name)
+                continue
+            samples = [[list(key), v] for key, v in value.items()] if labelnames else [[[], value]]
+            metrics[name] = {
+                'type': kind, 'help': documentation, 'labels': list(labelnames), 'buckets': [],
+                'samples': samples, 'aggregate': aggregate,
+            }
+        return {'pid': os.getpid(), 'metrics': metrics}
+
+    def changed(self):
+        if time.monotonic() >= self._next_write:
+            self.write()
+
+    def write(self):
+        """В режиме ``file`` сбрасывает снимок воркера на диск."""
+        conf = get_config()
+        self._next_write = time.monotonic() + conf['WRITE_INTERVAL']
+        if conf['MODE'] != 'file':
+            return
+        try:
+            os.makedirs(conf['DIRECTORY'], exist_ok=True)
+            path = os.path.join(conf['DIRECTORY'], f'metrics-{os.getpid()}.json')
+            fd, tmp = tempfile.mkstemp(dir=conf['DIRECTORY'], prefix='.metrics-')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, path)
+        except OSError:
+            logger.exception('Не удалось записать снимок метрик')
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_snapshots(directory):
+    snapshots = []
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return snapshots
+    for name in names:
+        if not (name.startswith('metrics-') and name.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            # Файл мог смениться между listdir и open
+            continue
+    return snapshots
+
+
+def merge(snapshots):
+    """Складывает снимки воркеров в один ``{имя: описание метрики}``."""
+    merged = {}
+    for snapshot in snapshots:
+        alive = _alive(snapshot['pid'])
+        for name, metric in snapshot['metrics'].items():
+            aggregate = metric.get('aggregate')
+            if metric['type'] == 'gauge' and not alive:
+                continue
+            target = merged.setdefault(name, dict(metric, samples={}))
+            for labels, value in metric['samples']:
+                key = tuple(labels)
+                current = target['samples'].get(key)
+                if current is None:
+                    target['samples'][key] = value
+                elif isinstance(value, list):
+                    target['samples'][key] = [a + b for a, b in zip(current, value)]
+                elif aggregate == 'max':
+                    target['samples'][key] = max(current, value)
+                else:
+                    target['samples'][key] = current + value
+    return merged
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value) if value != int(value) else f'{value:.1f}'
+    return str(value)
+
+
+def render(merged):
+    """Текстовый формат Prometheus 0.0.4."""
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        lines.append(f'# HELP {name} {metric["help"]}')
+        lines.append(f'# TYPE {name} {metric["type"]}')
+        for key in sorted(metric['samples']):
+            value = metric['samples'][key]
+            if metric['type'] != 'histogram':
+                lines.append(f'{name}{_format_labels(metric["labels"], key)} {_format_value(value)}')
+                continue
+            cumulative = 0
+            bounds = [str(bound) for bound in metric['buckets']] + ['+Inf']
+            for bound, count in zip(bounds, value[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(metric["labels"], key, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(metric["labels"], key)} {_format_value(value[-1])}')
+            lines.append(f'{name}_count{_format_labels(metric["labels"], key)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def collect():
+    """Метрики всех воркеров (или этого процесса в режиме ``local``) текстом Prometheus."""
+    conf = get_config()
+    if conf['MODE'] == 'file':
+        registry.write()
+        snapshots = _read_snapshots(conf['DIRECTORY'])
+        snapshots.append({'pid': os.getpid(), 'metrics': {
+            name: metric for name, metric in registry.snapshot(include_global=True)['metrics'].items()
+            if metric.get('aggregate', 'sum') is None
+        }})
+    else:
+        snapshots = [registry.snapshot(include_global=True)]
+    return render(merge(snapshots))
+
+
+def allowed(request, conf=None):
+    """Пускаем к метрикам только с адресов из ``ALLOWED_IPS`` и, если задан, с токеном."""
+    conf = conf or get_config()
+    if request.META.get('REMOTE_ADDR') not in conf['ALLOWED_IPS']:
+        return False
+    if conf['TOKEN']:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {conf["TOKEN"]}')
+    return True
+
+
+registry = Registry()
+
+REQUESTS = registry.counter(
+    'banner_http_requests_total', 'Запросы к страницам баннеров', ('view', 'status'))
+REQUEST_DURATION = registry.histogram(
+    'banner_http_request_duration_seconds', 'Время ответа страниц баннеров', ('view',))
+RECORDED = registry.counter(
+    'banner_events_total', 'Записанные просмотры и клики', ('kind',))
+CREATIVE_SELECTION = registry.histogram(
+    'banner_creative_selection_seconds', 'Выбор креативов для страницы (resolve_creatives)')
+COUNTER_FLUSH_DURATION = registry.histogram(
+    'banner_counter_flush_seconds', 'Длительность сброса буфера счётчиков в базу')
+COUNTER_ROWS_WRITTEN = registry.counter(
+    'banner_counter_rows_written_total', 'Записи счётчиков и событий в базу (UPDATE по ключу или строка журнала)')
+COUNTER_FLUSH_ERRORS = registry.counter(
+    'banner_counter_flush_errors_total', 'Неудачные сбросы буфера счётчиков')
+RENDITIONS = registry.counter(
+    'banner_renditions_total', 'Задачи на уменьшенные копии картинок', ('result',))
+
+
+class MetricsMiddleware:
+    """Считает запросы и время ответа для каждого URL из ``banners/urls.py``."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self._view_names = None
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self._observe(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, response, started)
+        return response
+
+    def _observe(self, request, response, started):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return
+        if self._view_names is None:
+            from . import urls
+            self._view_names = {pattern.name for pattern in urls.urlpatterns if pattern.name != 'banner_metrics'}
+        if match.url_name not in self._view_names:
+            return
+        REQUEST_DURATION.observe(time.perf_counter() - started, view=match.url_name)
+        REQUESTS.inc(view=match.url_name, status=response.status_code)
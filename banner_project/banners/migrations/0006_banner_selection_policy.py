@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 13:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banners', '0005_banner_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='banner',
+            name='selection_policy',
+            field=models.CharField(blank=True, choices=[('legacy', 'Рандом, потом лучший CTR'), ('thompson', 'Thompson sampling'), ('ucb1', 'UCB1')], default='', max_length=20),
+        ),
+    ]
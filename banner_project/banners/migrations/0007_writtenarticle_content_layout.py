@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+from banners.layout import compile_layout
+
+
+def compile_existing_layouts(apps, schema_editor):
+    WrittenArticle = apps.get_model('banners', 'WrittenArticle')
+    for article in WrittenArticle.objects.only('id', 'content'):
+        article.content_layout = compile_layout(article.content)[0]
+        article.save(update_fields=['content_layout'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banners', '0006_banner_selection_policy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='writtenarticle',
+            name='content_layout',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(compile_existing_layouts, migrations.RunPython.noop),
+    ]
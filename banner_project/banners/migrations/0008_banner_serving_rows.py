@@ -0,0 +1,59 @@
+# Generated by Django 5.2 on 2026-10-18 14:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_serving_rows(apps, schema_editor):
+    Banner = apps.get_model('banners', 'Banner')
+    BannerServingRow = apps.get_model('banners', 'BannerServingRow')
+
+    def best(creatives):
+        best_ctr, best_id = None, None
+        for creative in creatives:
+            ctr = creative.clicks / creative.views if creative.views > 0 else 0
+            if best_ctr is None or ctr > best_ctr:
+                best_ctr, best_id = ctr, creative.id
+        return best_id
+
+    rows = []
+    for banner in Banner.objects.prefetch_related('tags', 'titles', 'images').order_by('id'):
+        titles = sorted(banner.titles.all(), key=lambda t: t.id)
+        images = sorted(banner.images.all(), key=lambda i: i.id)
+        rows.append(BannerServingRow(
+            banner_id=banner.id,
+            owner_id=banner.owner_id,
+            tag_ids=sorted(tag.id for tag in banner.tags.all()),
+            active=bool(titles or images),
+            best_title_id=best(titles),
+            best_image_id=best(images),
+        ))
+    BannerServingRow.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banners', '0007_writtenarticle_content_layout'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BannerServingRow',
+            fields=[
+                ('banner', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='serving_row', serialize=False, to='banners.banner')),
+                ('tag_ids', models.JSONField(blank=True, default=list)),
+                ('active', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('best_image', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='banners.bannerimage')),
+                ('best_title', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='banners.bannertitle')),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', 'active', 'banner'], name='banners_serving_owner_idx')],
+            },
+        ),
+        migrations.RunPython(fill_serving_rows, migrations.RunPython.noop),
+    ]
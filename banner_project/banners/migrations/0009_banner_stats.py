@@ -0,0 +1,145 @@
+# Generated by Django 5.2 on 2026-10-18 14:12
+
+from datetime import datetime, time, timezone
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_day_stats(apps, schema_editor):
+    """
+    Дневные строки из DailyBannerStats, а остаток горячих счётчиков, которого
+    в ней нет (режим counters, правки в админке), — в день создания баннера
+    или картинки: суммы за всё время совпадают со счётчиками. Почасовых строк
+    для истории нет.
+    """
+    Banner = apps.get_model('banners', 'Banner')
+    BannerTitle = apps.get_model('banners', 'BannerTitle')
+    BannerImage = apps.get_model('banners', 'BannerImage')
+    DailyBannerStats = apps.get_model('banners', 'DailyBannerStats')
+    BannerStats = apps.get_model('banners', 'BannerStats')
+    CreativeStats = apps.get_model('banners', 'CreativeStats')
+
+    def midnight(moment):
+        day = moment.astimezone(timezone.utc).date() if isinstance(moment, datetime) else moment
+        return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+    def add(rows, key, banner_id, views, clicks):
+        row = rows.setdefault(key, {'banner_id': banner_id, 'views': 0, 'clicks': 0})
+        row['views'] += views
+        row['clicks'] += clicks
+
+    banners = {b.id: b for b in Banner.objects.all()}
+    titles = {t.id: t for t in BannerTitle.objects.select_related('language')}
+    images = {i.id: i for i in BannerImage.objects.all()}
+
+    def language_code(title_id):
+        title = titles.get(title_id)
+        return title.language.code if title and title.language else ''
+
+    banner_rows, creative_rows = {}, {}
+    for daily in DailyBannerStats.objects.all():
+        bucket = midnight(daily.day)
+        code = language_code(daily.title_id)
+        add(banner_rows, (bucket, daily.banner_id, code), daily.banner_id, daily.views, daily.clicks)
+        if daily.title_id in titles:
+            add(creative_rows, (bucket, 'title', daily.title_id, code), daily.banner_id, daily.views, daily.clicks)
+        if daily.image_id in images:
+            add(creative_rows, (bucket, 'image', daily.image_id, code), daily.banner_id, daily.views, daily.clicks)
+
+    # Что уже попало в строки из DailyBannerStats, по баннеру и по креативу
+    banner_seen, creative_seen = {}, {}
+    for (_, banner_id, _), row in banner_rows.items():
+        totals = banner_seen.setdefault(banner_id, [0, 0])
+        totals[0] += row['views']
+        totals[1] += row['clicks']
+    for (_, kind, creative_id, _), row in creative_rows.items():
+        totals = creative_seen.setdefault((kind, creative_id), [0, 0])
+        totals[0] += row['views']
+        totals[1] += row['clicks']
+
+    for banner in banners.values():
+        views, clicks = banner_seen.get(banner.id, (0, 0))
+        views, clicks = max(banner.views - views, 0), max(banner.clicks - clicks, 0)
+        if views or clicks:
+            add(banner_rows, (midnight(banner.created_at), banner.id, ''), banner.id, views, clicks)
+    for kind, creatives in (('title', titles), ('image', images)):
+        for creative in creatives.values():
+            views, clicks = creative_seen.get((kind, creative.id), (0, 0))
+            views, clicks = max(creative.views - views, 0), max(creative.clicks - clicks, 0)
+            if not views and not clicks:
+                continue
+            created_at = creative.created_at if kind == 'image' else banners[creative.banner_id].created_at
+            code = language_code(creative.id) if kind == 'title' else ''
+            add(creative_rows, (midnight(created_at), kind, creative.id, code), creative.banner_id, views, clicks)
+
+    BannerStats.objects.bulk_create([
+        BannerStats(period='day', bucket=bucket, language_code=code,
+                    owner_id=banners[banner_id].owner_id, **row)
+        for (bucket, banner_id, code), row in banner_rows.items() if banner_id in banners
+    ], batch_size=1000)
+    CreativeStats.objects.bulk_create([
+        CreativeStats(period='day', bucket=bucket, kind=kind, creative_id=creative_id, language_code=code,
+                      owner_id=banners[row['banner_id']].owner_id, **row)
+        for (bucket, kind, creative_id, code), row in creative_rows.items() if row['banner_id'] in banners
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banners', '0008_banner_serving_rows'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BannerStats',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('period', models.CharField(choices=[('hour', 'Час'), ('day', 'День')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('language_code', models.CharField(blank=True, default='', max_length=10)),
+                ('views', models.BigIntegerField(default=0)),
+                ('clicks', models.BigIntegerField(default=0)),
+                ('banner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='banners.banner')),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CreativeStats',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('period', models.CharField(choices=[('hour', 'Час'), ('day', 'День')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('kind', models.CharField(choices=[('title', 'Заголовок'), ('image', 'Картинка')], max_length=5)),
+                ('creative_id', models.BigIntegerField()),
+                ('language_code', models.CharField(blank=True, default='', max_length=10)),
+                ('views', models.BigIntegerField(default=0)),
+                ('clicks', models.BigIntegerField(default=0)),
+                ('banner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='creative_stats', to='banners.banner')),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='bannerstats',
+            index=models.Index(fields=['owner', 'period', 'bucket'], name='banners_stats_owner_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bannerstats',
+            constraint=models.UniqueConstraint(fields=('period', 'bucket', 'banner', 'language_code'), name='banners_stats_key'),
+        ),
+        migrations.AddIndex(
+            model_name='creativestats',
+            index=models.Index(fields=['banner', 'period', 'bucket'], name='banners_cstats_banner_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='creativestats',
+            constraint=models.UniqueConstraint(fields=('period', 'bucket', 'kind', 'creative_id', 'language_code'), name='banners_creative_stats_key'),
+        ),
+        migrations.RunPython(fill_day_stats, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='DailyBannerStats',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banners', '0009_banner_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bannerimage',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
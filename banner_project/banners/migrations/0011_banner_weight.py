@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 14:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banners', '0010_banner_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='banner',
+            name='weight',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-18 15:06
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banners', '0011_banner_weight'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='bannerservingrow',
+            name='best_image',
+        ),
+        migrations.RemoveField(
+            model_name='bannerservingrow',
+            name='best_title',
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 15:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banners', '0012_remove_serving_best_creatives'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='bannerservingrow',
+            name='banners_serving_owner_idx',
+        ),
+        migrations.RemoveField(
+            model_name='bannerservingrow',
+            name='active',
+        ),
+        migrations.AddIndex(
+            model_name='bannerservingrow',
+            index=models.Index(fields=['owner', 'banner'], name='banners_serving_owner_bn_idx'),
+        ),
+    ]
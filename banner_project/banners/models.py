@@ -1,10 +1,34 @@
 # banners/models.py
 from django.db import models
 from django.conf import settings
+import logging
 import random
 from ckeditor.fields import RichTextField
 from django.utils.timezone import now
 
+from . import counters
+from .layout import compile_layout
+
+logger = logging.getLogger(__name__)
+
+
+def pick_title(titles):
+    """Выбирает заголовок из уже загруженного списка."""
+    if not titles:
+        return None
+    if all(t.clicks < 15 for t in titles):  # мало просмотров — рандом
+        return random.choice(titles)
+    return max(titles, key=lambda t: t.ctr())  # лучший по ctr
+
+
+def pick_image(images):
+    """Выбирает картинку из уже загруженного списка."""
+    if not images:
+        return None
+    if any(img.views > 0 for img in images):
+        return max(images, key=lambda i: i.ctr())
+    return random.choice(images)
+
 
 class Language(models.Model):
     code = models.CharField(max_length=10, unique=True)
@@ -52,7 +76,7 @@ class Article(models.Model):
 
     def increment_clicks(self):
         self.clicks += 1
-        self.save()
+        counters.increment(type(self), self.pk, 'clicks')
 
 
 class WrittenArticle(models.Model):
@@ -70,10 +94,34 @@ class WrittenArticle(models.Model):
                               related_name='written_article',
                               null=True,
                               blank=True)
+    # Текст, разобранный на куски и номера слотов (banners/layout.py)
+    content_layout = models.JSONField(default=list, blank=True, editable=False)
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        self.content_layout, self.layout_problems = compile_layout(self.content)
+        for problem in self.layout_problems:
+            logger.warning('Статья %s: %s', self.slug, problem)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'content' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'content_layout'}
+        super().save(*args, **kwargs)
+
+    def get_layout(self):
+        # Статьи, изменённые в обход save(), разбираем на лету
+        if self.content and not self.content_layout:
+            return compile_layout(self.content)[0]
+        return self.content_layout
+
+
+SELECTION_POLICY_CHOICES = [
+    ('legacy', 'Рандом, потом лучший CTR'),
+    ('thompson', 'Thompson sampling'),
+    ('ucb1', 'UCB1'),
+]
+
 
 class Banner(models.Model):
     title = models.CharField(max_length=200)
@@ -92,44 +140,37 @@ class Banner(models.Model):
                               related_name='banner',
                               null=True,
                               blank=True)
+    # Политика выбора заголовка/картинки (banners/bandits.py); пусто — по владельцу/по умолчанию
+    selection_policy = models.CharField(max_length=20, choices=SELECTION_POLICY_CHOICES, blank=True, default='')
+    # Относительная частота в случайном доборе к статьям (banners/sampling.py); 0 — не добирать
+    weight = models.PositiveIntegerField(default=1)
+
     def __str__(self):
         return self.title
 
     def increment_clicks(self):
         self.clicks += 1
-        self.save()
+        counters.increment(type(self), self.pk, 'clicks')
 
     def increment_views(self):
         self.views += 1
-        self.save()
+        counters.increment(type(self), self.pk, 'views')
 
     def get_random_image(self):
         images = self.images.all()
         return random.choice(images) if images else None
 
     def get_best_or_random_title(self):
-        titles = self.titles.all()
-        if not titles:
-            return None
-        if all(t.clicks < 15 for t in titles):  # мало просмотров — рандом
-            return random.choice(titles)
-        return max(titles, key=lambda t: t.ctr())  # лучший по ctr
+        return pick_title(list(self.titles.all()))
 
     def get_title_for_language(self, language):
-        titles = self.titles.filter(language=language)
-        if titles.exists():
-            if all(t.clicks < 15 for t in titles):
-                return random.choice(titles)
-            return max(titles, key=lambda t: t.ctr())
+        titles = list(self.titles.filter(language=language))
+        if titles:
+            return pick_title(titles)
         return self.get_best_or_random_title()
 
     def get_best_or_random_image(self):
-        images = list(self.images.all())
-        if not images:
-            return None
-        if any(img.views > 0 for img in images):
-            return max(images, key=lambda i: i.ctr())
-        return random.choice(images)
+        return pick_image(list(self.images.all()))
 
 
     @classmethod
@@ -156,11 +197,11 @@ class BannerTitle(models.Model):
 
     def increment_clicks(self):
         self.clicks += 1
-        self.save()
+        counters.increment(type(self), self.pk, 'clicks')
 
     def increment_views(self):
         self.views += 1
-        self.save()
+        counters.increment(type(self), self.pk, 'views')
 
     def __str__(self):
         return f"Title for {self.banner.title}: {self.text}"
@@ -172,17 +213,162 @@ class BannerImage(models.Model):
     clicks = models.IntegerField(default=0)
     views = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Уменьшенные копии (banners/renditions.py): {'source': имя оригинала,
+    # 'sources': [{'type': mime, 'srcset': ...}], 'files': [...]}
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
 
     def ctr(self):
         return self.clicks / self.views if self.views > 0 else 0
 
+    def sources(self):
+        """``[(mime, srcset), ...]`` для ``<picture>``; пусто, пока копии не готовы для текущего файла."""
+        if not self.image or self.renditions.get('source') != self.image.name:
+            return []
+        return [(source['type'], source['srcset']) for source in self.renditions.get('sources', ())]
+
     def increment_clicks(self):
         self.clicks += 1
-        self.save()
+        counters.increment(type(self), self.pk, 'clicks')
 
     def increment_views(self):
         self.views += 1
-        self.save()
+        counters.increment(type(self), self.pk, 'views')
+
+    def __str__(self):
+        return f"Image for {self.banner.title}"
+
+
+class BannerEvent(models.Model):
+    """
+    Узкая append-only запись о событии. Строки только вставляются
+    (``bulk_create``) и потом сворачиваются в счётчики командой
+    ``rollup_banner_events``.
+    """
+    id = models.BigAutoField(primary_key=True)
+    banner = models.ForeignKey(Banner, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    title = models.ForeignKey(BannerTitle, on_delete=models.DO_NOTHING, db_constraint=False,
+                              null=True, blank=True, related_name='+')
+    image = models.ForeignKey(BannerImage, on_delete=models.DO_NOTHING, db_constraint=False,
+                              null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(default=now, db_index=True)
+
+    class Meta:
+        abstract = True
+
+
+class ImpressionEvent(BannerEvent):
+    pass
+
+
+class ClickEvent(BannerEvent):
+    pass
+
+
+STATS_PERIOD_CHOICES = [
+    ('hour', 'Час'),
+    ('day', 'День'),
+]
+
+CREATIVE_KIND_CHOICES = [
+    ('title', 'Заголовок'),
+    ('image', 'Картинка'),
+]
+
+
+class BannerStats(models.Model):
+    """
+    Просмотры и клики баннера за час или день (``bucket`` — начало периода в
+    UTC) в разрезе языка показанного заголовка. Владелец записан рядом, чтобы
+    отчёты по владельцу обходились без join-а. Пишется ``banners/stats.py``.
+    """
+    id = models.BigAutoField(primary_key=True)
+    period = models.CharField(max_length=4, choices=STATS_PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    banner = models.ForeignKey(Banner, on_delete=models.CASCADE, related_name='stats')
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True,
+                              related_name='+')
+    # Код языка заголовка; '' — без языка (NULL в ключе upsert не совпадает сам с собой)
+    language_code = models.CharField(max_length=10, blank=True, default='')
+    views = models.BigIntegerField(default=0)
+    clicks = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'banner', 'language_code'],
+                                    name='banners_stats_key'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', 'period', 'bucket'], name='banners_stats_owner_idx'),
+        ]
+
+    def ctr(self):
+        return self.clicks / self.views if self.views > 0 else 0
+
+    def __str__(self):
+        return f"{self.period} {self.bucket:%Y-%m-%d %H:%M} {self.banner_id}: {self.clicks}/{self.views}"
+
+
+class CreativeStats(models.Model):
+    """
+    То же для отдельного заголовка или картинки. ``creative_id`` без внешнего
+    ключа: история переживает удаление креатива, как и журнал событий.
+    """
+    id = models.BigAutoField(primary_key=True)
+    period = models.CharField(max_length=4, choices=STATS_PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    kind = models.CharField(max_length=5, choices=CREATIVE_KIND_CHOICES)
+    creative_id = models.BigIntegerField()
+    banner = models.ForeignKey(Banner, on_delete=models.CASCADE, related_name='creative_stats')
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True,
+                              related_name='+')
+    language_code = models.CharField(max_length=10, blank=True, default='')
+    views = models.BigIntegerField(default=0)
+    clicks = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'kind', 'creative_id', 'language_code'],
+                                    name='banners_creative_stats_key'),
+        ]
+        indexes = [
+            models.Index(fields=['banner', 'period', 'bucket'], name='banners_cstats_banner_idx'),
+        ]
+
+    def ctr(self):
+        return self.clicks / self.views if self.views > 0 else 0
+
+    def __str__(self):
+        return f"{self.period} {self.bucket:%Y-%m-%d %H:%M} {self.kind} {self.creative_id}: {self.clicks}/{self.views}"
+
+
+class EventRollupCursor(models.Model):
+    """До какого id события уже свёрнуты в счётчики."""
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_id}"
+
+
+class BannerServingRow(models.Model):
+    """
+    Денормализованная строка выдачи баннера для написанных статей: владелец,
+    id тегов. Кандидаты статьи — один проход по индексу ``(owner, banner)``
+    без join-ов через таблицу тегов.
+    Поддерживается сигналами и командой ``rebuild_banner_serving_rows``
+    (см. ``banners/serving.py``).
+    """
+    banner = models.OneToOneField(Banner, on_delete=models.CASCADE, primary_key=True, related_name='serving_row')
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True,
+                              related_name='+')
+    tag_ids = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', 'banner'], name='banners_serving_owner_bn_idx'),
+        ]
 
     def __str__(self):
-        return f"Image for {self.banner.title}"
\ No newline at end of file
+        return f"{self.banner_id} ({self.owner_id}): {self.tag_ids}"
@@ -0,0 +1,198 @@
+# banners/profiling.py
+"""
+Профилирование запросов по фазам.
+
+Представления размечают фазы ``with profiling.phase('creatives'): …``, а
+``ProfilingMiddleware`` собирает длительность каждой фазы, число SQL-запросов
+и время в базе. Результат уходит в заголовок ``Server-Timing`` (видно во
+вкладке Network браузера) и, для доли запросов ``SAMPLE_RATE``, в лог
+``banners.profiling`` одной JSON-строкой.
+
+Выключено по умолчанию (``BANNER_PROFILING['ENABLED']``). Без активного
+профиля ``phase()`` возвращает общий пустой контекст — цена одной проверки
+contextvar.
+
+Соединения с базой у каждого потока свои, а под ASGI ORM работает в потоке
+``sync_to_async``, а не в потоке event loop. Поэтому SQL считает одна
+постоянная обёртка ``_sql_wrapper``: она вешается на соединения того потока,
+где идут запросы, и берёт профиль из contextvar, который asgiref переносит
+в этот поток вместе с контекстом.
+"""
+import json
+import logging
+import random
+import re
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('banners.profiling')
+
+DEFAULTS = {
+    'ENABLED': False,
+    # Доля запросов, которые попадают в лог; Server-Timing — у всех
+    'SAMPLE_RATE': 0.01,
+    'SERVER_TIMING': True,
+    # {имя фазы в коде: имя в отчёте}; пустое имя — фазу не показывать
+    'PHASE_NAMES': {},
+}
+
+_current = ContextVar('banners_profile', default=None)
+_noop = nullcontext()
+
+TOKEN_RE = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def get_config():
+    conf = dict(DEFAULTS)
+    conf.update(getattr(settings, 'BANNER_PROFILING', {}))
+    return conf
+
+
+class _Phase:
+    __slots__ = ('profile', 'name', 'started')
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.profile.stack.append(self.name)
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profile.phases[self.name] += time.perf_counter() - self.started
+        self.profile.stack.pop()
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = defaultdict(float)
+        self.stack = []
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.phase_sql = defaultdict(int)
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def sql_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.sql_count += 1
+            if self.stack:
+                self.phase_sql[self.stack[-1]] += 1
+
+    def report(self, names):
+        """Фазы в порядке первого входа, с учётом переименований из настроек."""
+        phases = {}
+        for name, seconds in self.phases.items():
+            shown = names.get(name, name)
+            if shown:
+                phases[shown] = phases.get(shown, 0.0) + seconds
+        return phases
+
+    def server_timing(self, phases, total):
+        parts = [f'{TOKEN_RE.sub("_", name)};dur={seconds * 1000:.2f}' for name, seconds in phases.items()]
+        parts.append(f'sql;dur={self.sql_time * 1000:.2f};desc="{self.sql_count} queries"')
+        parts.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(parts)
+
+    def log_record(self, request, response, phases, total):
+        match = getattr(request, 'resolver_match', None)
+        return {
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 3),
+            'sql_count': self.sql_count,
+            'sql_ms': round(self.sql_time * 1000, 3),
+            'phases_ms': {name: round(seconds * 1000, 3) for name, seconds in phases.items()},
+            'phase_sql': dict(self.phase_sql),
+        }
+
+
+def _sql_wrapper(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile.sql_wrapper(execute, sql, params, many, context)
+
+
+def _install_sql_wrapper():
+    """Вешает ``_sql_wrapper`` на соединения текущего потока, если его там ещё нет."""
+    for connection in connections.all():
+        if _sql_wrapper not in connection.execute_wrappers:
+            # В начало: execute_wrapper() снимает свои обёртки с конца списка
+            connection.execute_wrappers.insert(0, _sql_wrapper)
+
+
+# Тот же поток, где асинхронные вьюхи выполняют запросы ORM
+_ainstall_sql_wrapper = sync_to_async(_install_sql_wrapper)
+
+
+def phase(name):
+    """Контекст фазы запроса; без профилирования ничего не делает."""
+    profile = _current.get()
+    if profile is None:
+        return _noop
+    return profile.phase(name)
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        conf = get_config()
+        if not conf['ENABLED']:
+            return self.get_response(request)
+
+        _install_sql_wrapper()
+        profile = RequestProfile()
+        token = _current.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(conf, profile, request, response)
+
+    async def __acall__(self, request):
+        conf = get_config()
+        if not conf['ENABLED']:
+            return await self.get_response(request)
+
+        await _ainstall_sql_wrapper()
+        profile = RequestProfile()
+        token = _current.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(conf, profile, request, response)
+
+    def _finish(self, conf, profile, request, response):
+        total = time.perf_counter() - profile.started
+        phases = profile.report(conf['PHASE_NAMES'])
+        if conf['SERVER_TIMING']:
+            response['Server-Timing'] = profile.server_timing(phases, total)
+        if conf['SAMPLE_RATE'] and random.random() < conf['SAMPLE_RATE']:
+            logger.info(json.dumps(profile.log_record(request, response, phases, total), ensure_ascii=False))
+        return response
@@ -0,0 +1,108 @@
+# banners/query_budget.py
+"""
+Бюджеты SQL-запросов для представлений.
+
+Представление объявляет бюджет декоратором ``@query_budget(queries=…, writes=…)``
+— это максимум запросов и записей (INSERT/UPDATE/DELETE) на один запрос
+страницы при продовых настройках, не зависящий от размера каталога. В проде
+декоратор ничего не делает, только вешает атрибут. Тесты
+(``banners/tests/test_query_budgets.py``) проходят по всем URL с бюджетом на
+каталогах разного размера, и если страница выйдет за бюджет (например, N+1 в
+цикле), ``QueryBudgetExceeded`` перечислит лишние запросы по местам вызова.
+"""
+import os
+import traceback
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from . import profiling
+
+QueryBudget = namedtuple('QueryBudget', ['queries', 'writes'])
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+# Служебные команды транзакций в бюджет не входят
+TRANSACTION_STATEMENTS = ('SAVEPOINT', 'RELEASE', 'ROLLBACK', 'BEGIN', 'COMMIT')
+
+SQL_PREVIEW = 300
+
+# Обёртки execute из проекта — не места вызова запросов
+WRAPPER_FILES = {__file__, profiling.__file__}
+
+
+def query_budget(queries, writes=0):
+    """Объявляет бюджет запросов представления."""
+    def decorator(view):
+        view.query_budget = QueryBudget(queries, writes)
+        return view
+    return decorator
+
+
+def get_budget(view):
+    return getattr(view, 'query_budget', None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def _call_site():
+    """Ближайший к запросу кадр из кода проекта (не Django и не библиотек)."""
+    base_dir = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        filename = frame.filename
+        if (filename.startswith(base_dir) and 'site-packages' not in filename
+                and filename not in WRAPPER_FILES):
+            return f'{os.path.relpath(filename, base_dir)}:{frame.lineno} in {frame.name}'
+    return '<вне проекта>'
+
+
+class BudgetRecorder:
+    """``execute_wrapper``: запоминает запросы вместе с местом вызова."""
+
+    def __init__(self):
+        self.captured = []
+
+    def __call__(self, execute, sql, params, many, context):
+        statement = sql.lstrip()[:9].upper()
+        if not statement.startswith(TRANSACTION_STATEMENTS):
+            self.captured.append((sql, _call_site(), statement.startswith(WRITE_STATEMENTS)))
+        return execute(sql, params, many, context)
+
+    @property
+    def queries(self):
+        return len(self.captured)
+
+    @property
+    def writes(self):
+        return sum(1 for _, _, is_write in self.captured if is_write)
+
+    def report(self):
+        """Запросы, сгруппированные по месту вызова, самые частые — первыми."""
+        sites = OrderedDict()
+        for sql, site, _ in self.captured:
+            sites.setdefault(site, []).append(sql)
+        lines = []
+        for site, statements in sorted(sites.items(), key=lambda item: -len(item[1])):
+            lines.append(f'  {site} — {len(statements)}')
+            for sql in OrderedDict.fromkeys(statements):
+                lines.append(f'      {sql[:SQL_PREVIEW]}')
+        return '\n'.join(lines)
+
+    def check(self, budget, label=''):
+        if self.queries <= budget.queries and self.writes <= budget.writes:
+            return
+        raise QueryBudgetExceeded(
+            f'{label or "Код"}: запросов {self.queries} при бюджете {budget.queries}, '
+            f'записей {self.writes} при бюджете {budget.writes}\n{self.report()}'
+        )
+
+
+@contextmanager
+def assert_query_budget(budget, label='', using='default'):
+    recorder = BudgetRecorder()
+    with connections[using].execute_wrapper(recorder):
+        yield recorder
+    recorder.check(budget, label)
@@ -0,0 +1,161 @@
+# banners/render_cache.py
+"""
+Кэш «оболочек» страниц статей в памяти воркера.
+
+Оболочка — всё, что не меняется от запроса к запросу: сама статья, её теги,
+подписи на нужном языке, разметка слотов и пул баннеров-кандидатов. На
+запрос остаётся только выбрать баннеры и собрать слоты.
+
+Ключ — ``(вид страницы, slug)``, запись помнит версию ``render``, которую
+поднимают сигналы при изменении статей, баннеров, тегов и заголовков
+(``banners/signals.py``). Устаревшие записи отбрасываются при обращении,
+а общий объём ограничен ``MAX_BYTES`` с вытеснением давно не читанных (LRU).
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import invalidation, metrics
+
+VERSION_NAME = 'render'
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MAX_BYTES': 32 * 1024 * 1024,
+}
+
+# Грубая оценка памяти на один закэшированный объект модели
+OBJECT_BYTES = 1024
+
+
+def get_config():
+    conf = dict(DEFAULTS)
+    conf.update(getattr(settings, 'BANNER_RENDER_CACHE', {}))
+    return conf
+
+
+def estimate_size(value):
+    """Приблизительный размер оболочки: строки по длине, объекты — константой."""
+    if isinstance(value, str):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sum(estimate_size(v) for v in value.values()) + 64 * len(value)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sum(estimate_size(v) for v in value) + 8 * len(value)
+    if isinstance(value, (int, float, bool)) or value is None:
+        return 28
+    if hasattr(value, '__slots__') and not hasattr(value, '__dict__'):
+        return sum(estimate_size(getattr(value, name, None)) for name in value.__slots__)
+    return OBJECT_BYTES
+
+
+class LRUCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, version, value):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= old[2]
+            self._data[key] = (version, value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, _, evicted) = self._data.popitem(last=False)
+                self.size -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+
+_cache = LRUCache(DEFAULTS['MAX_BYTES'])
+_cache_version = None
+
+
+def get_render_cache():
+    return _cache
+
+
+metrics.registry.collector('banner_render_cache_hits_total', 'Попадания в кэш оболочек страниц',
+                           lambda: _cache.hits, kind='counter')
+metrics.registry.collector('banner_render_cache_misses_total', 'Промахи кэша оболочек страниц',
+                           lambda: _cache.misses, kind='counter')
+metrics.registry.collector('banner_render_cache_bytes', 'Оценка памяти под кэш оболочек', lambda: _cache.size)
+metrics.registry.collector('banner_render_cache_entries', 'Оболочек в кэше', lambda: len(_cache))
+
+
+def _current_version():
+    """Версия ``render`` для поиска в кэше или ``None``, если кэш выключен."""
+    global _cache_version
+    conf = get_config()
+    if not conf['ENABLED']:
+        return None
+
+    version = invalidation.get_version(VERSION_NAME)
+    if version != _cache_version:
+        # Все записи прежней версии уже не пригодятся — освобождаем память сразу
+        _cache.clear()
+        _cache_version = version
+    _cache.max_bytes = conf['MAX_BYTES']
+    return version
+
+
+def get_or_build(kind, slug, builder):
+    """
+    Возвращает оболочку страницы ``kind`` для ``slug``, при промахе строит
+    её вызовом ``builder(slug)``. Исключения билдера (например, ``Http404``)
+    пробрасываются и не кэшируются.
+    """
+    version = _current_version()
+    if version is None:
+        return builder(slug)
+
+    key = (kind, slug)
+    shell = _cache.get(key, version)
+    if shell is None:
+        shell = builder(slug)
+        _cache.set(key, version, shell)
+    return shell
+
+
+async def aget_or_build(kind, slug, builder):
+    """То же для ASGI: ``builder`` — корутина, попадание в кэш не ходит в БД."""
+    version = _current_version()
+    if version is None:
+        return await builder(slug)
+
+    key = (kind, slug)
+    shell = _cache.get(key, version)
+    if shell is None:
+        shell = await builder(slug)
+        _cache.set(key, version, shell)
+    return shell
+
+
+def invalidate():
+    invalidation.bump_version(VERSION_NAME)
@@ -0,0 +1,271 @@
+# banners/renditions.py
+"""
+Уменьшенные копии картинок баннеров (WebP/AVIF нескольких ширин).
+
+После сохранения картинки с новым файлом (сигнал в ``banners/signals.py``)
+копии строятся вне запроса: байты оригинала читаются из хранилища, Pillow
+работает в пуле из ``WORKERS`` процессов (``banners/resize.py``), а готовые
+файлы сохраняются в ``UPLOAD_TO`` и записываются в ``BannerImage.renditions``
+вместе с готовыми строками ``srcset``. Шаблоны выводят ``<picture>`` по этим
+строкам; пока копий нет (или они построены для прежнего файла) — отдаётся
+оригинал. Страница копии никогда не строит.
+
+Картинки лежат и в кэше креативов воркеров: версия ``creatives``
+сдвигается один раз на вызов ``generate``, задачу пула или весь
+``generate_many``, а не на каждую записанную картинку.
+
+Очередь ограничена ``MAX_PENDING``: лишние задачи отбрасываются, их
+догоняет ``manage.py generate_banner_renditions``. ``WORKERS = 0`` строит
+копии в текущем процессе (команда, тесты).
+"""
+import logging
+import posixpath
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils.html import format_html, format_html_join
+
+from . import invalidation, metrics, resize
+from .creatives import VERSION_NAME as CREATIVES_VERSION
+from .models import BannerImage
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'WIDTHS': (320, 640, 1280),
+    # Порядок — порядок <source>: браузер берёт первый знакомый формат
+    'FORMATS': ('avif', 'webp'),
+    'QUALITY': {'avif': 60, 'webp': 80},
+    'UPLOAD_TO': 'banner_renditions/',
+    'WORKERS': 2,
+    'MAX_PENDING': 100,
+}
+
+
+def get_config():
+    conf = dict(DEFAULTS)
+    conf.update(getattr(settings, 'BANNER_RENDITIONS', {}))
+    return conf
+
+
+def _file_name(conf, image_id, source, fmt, width):
+    stem = posixpath.splitext(posixpath.basename(source))[0]
+    return f'{conf["UPLOAD_TO"]}{image_id}/{stem}-{width}w.{fmt}'
+
+
+def _store(image_id, source, results, conf):
+    """Сохраняет файлы копий и записывает их в картинку, если её файл за это время не сменился."""
+    files = []
+    srcsets = {}
+    for fmt, width, _, data in results:
+        name = default_storage.save(_file_name(conf, image_id, source, fmt, width), ContentFile(data))
+        files.append(name)
+        srcsets.setdefault(fmt, []).append(f'{default_storage.url(name)} {width}w')
+    renditions = {
+        'source': source,
+        'sources': [{'type': resize.MIME_TYPES[fmt], 'srcset': ', '.join(srcset)}
+                    for fmt, srcset in srcsets.items()],
+        'files': files,
+    }
+
+    with transaction.atomic():
+        previous = (BannerImage.objects.select_for_update()
+                    .filter(id=image_id, image=source).values_list('renditions', flat=True).first())
+        stored = previous is not None and BannerImage.objects.filter(id=image_id).update(renditions=renditions)
+    if not stored:
+        delete_files(files)
+        return False
+    delete_files(previous.get('files', ()))
+    metrics.RENDITIONS.inc(result='stored')
+    return True
+
+
+def _invalidate_creatives(stored):
+    # Воркеры перечитают картинки с новыми копиями
+    if stored:
+        invalidation.bump_version(CREATIVES_VERSION)
+
+
+def delete_files(names):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except OSError:
+            logger.warning('Не удалось удалить копию %s', name, exc_info=True)
+
+
+def _read(image_id):
+    """``(имя файла, байты)`` оригинала или ``None``, если картинки или файла нет."""
+    image = BannerImage.objects.filter(id=image_id).only('id', 'image').first()
+    if image is None or not image.image:
+        return None
+    try:
+        with default_storage.open(image.image.name, 'rb') as f:
+            return image.image.name, f.read()
+    except OSError:
+        logger.warning('Нет файла картинки %s (%s)', image_id, image.image.name)
+        return None
+
+
+def generate(image_id, conf=None):
+    """Строит копии картинки в текущем процессе. Возвращает ``True``, если записал."""
+    stored = _generate(image_id, conf or get_config())
+    _invalidate_creatives(stored)
+    return stored
+
+
+def _generate(image_id, conf):
+    original = _read(image_id)
+    if original is None:
+        return False
+    source, data = original
+    try:
+        results = resize.render(data, conf['WIDTHS'], conf['FORMATS'], conf['QUALITY'])
+    except Exception:
+        logger.warning('Не удалось построить копии картинки %s', image_id, exc_info=True)
+        return False
+    return _store(image_id, source, results, conf)
+
+
+def _render_async(executor, data, conf):
+    return executor.submit(resize.render, data, conf['WIDTHS'], conf['FORMATS'], conf['QUALITY'])
+
+
+def _executor(workers):
+    # spawn, а не fork: воркер сервера многопоточен и держит соединения с базой
+    return ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'))
+
+
+def missing(image_ids=None):
+    """id картинок, у которых нет копий для текущего файла."""
+    images = BannerImage.objects.exclude(image='').exclude(image__isnull=True).order_by('id')
+    if image_ids is not None:
+        images = images.filter(id__in=image_ids)
+    for image_id, name, stored in images.values_list('id', 'image', 'renditions').iterator(chunk_size=1000):
+        if stored.get('source') != name:
+            yield image_id
+
+
+def generate_many(image_ids, workers=0, conf=None):
+    """
+    Строит копии картинок ``image_ids`` пулом из ``workers`` процессов (0 — в
+    текущем). В работе не больше двух картинок на процесс, чтобы не держать в
+    памяти оригиналы всего каталога. Возвращает число записанных.
+    """
+    conf = conf or get_config()
+    if not workers:
+        stored = sum(_generate(image_id, conf) for image_id in image_ids)
+        _invalidate_creatives(stored)
+        return stored
+
+    stored = 0
+
+    def collect(futures):
+        nonlocal stored
+        for future in futures:
+            image_id, source = in_flight.pop(future)
+            try:
+                stored += _store(image_id, source, future.result(), conf)
+            except Exception:
+                logger.warning('Не удалось построить копии картинки %s', image_id, exc_info=True)
+
+    in_flight = {}
+    with _executor(workers) as executor:
+        for image_id in image_ids:
+            original = _read(image_id)
+            if original is None:
+                continue
+            source, data = original
+            in_flight[_render_async(executor, data, conf)] = (image_id, source)
+            if len(in_flight) >= workers * 2:
+                collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+        collect(list(in_flight))
+    _invalidate_creatives(stored)
+    return stored
+
+
+class _Pool:
+    def __init__(self):
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _get_executor(self, workers):
+        if self._executor is None:
+            self._executor = _executor(workers)
+        return self._executor
+
+    def submit(self, image_id, conf):
+        with self._lock:
+            if self._pending >= conf['MAX_PENDING']:
+                metrics.RENDITIONS.inc(result='dropped')
+                logger.warning('Очередь копий переполнена, картинка %s отложена до generate_banner_renditions',
+                               image_id)
+                return
+            self._pending += 1
+        try:
+            original = _read(image_id)
+            if original is None:
+                self._done()
+                return
+            source, data = original
+            future = _render_async(self._get_executor(conf['WORKERS']), data, conf)
+        except Exception:
+            self._done()
+            raise
+        future.add_done_callback(lambda f: self._finish(f, image_id, source, conf))
+
+    def _finish(self, future, image_id, source, conf):
+        # Колбэк идёт в служебном потоке пула — соединение с базой закрываем за собой
+        try:
+            _invalidate_creatives(_store(image_id, source, future.result(), conf))
+        except Exception:
+            logger.warning('Не удалось построить копии картинки %s', image_id, exc_info=True)
+        finally:
+            connections.close_all()
+            self._done()
+
+    def _done(self):
+        with self._lock:
+            self._pending -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+_pool = _Pool()
+
+
+def schedule(image_id):
+    """Ставит построение копий после коммита текущей транзакции."""
+    conf = get_config()
+    if not conf['ENABLED']:
+        return
+    if conf['WORKERS']:
+        transaction.on_commit(lambda: _pool.submit(image_id, conf))
+    else:
+        transaction.on_commit(lambda: generate(image_id, conf))
+
+
+def picture_html(image, alt, sizes='100vw'):
+    """``<picture>`` с готовыми ``srcset`` копий; без копий — просто оригинал."""
+    if image is None or not image.image:
+        return format_html('<img src="" alt="{}">', alt)
+    img = format_html('<img src="{}" alt="{}">', image.image.url, alt)
+    sources = image.sources()
+    if not sources:
+        return img
+    return format_html(
+        '<picture>{}{}</picture>',
+        format_html_join('', '<source type="{}" srcset="{}" sizes="{}">',
+                         ((mime, srcset, sizes) for mime, srcset in sources)),
+        img,
+    )
@@ -0,0 +1,50 @@
+# banners/resize.py
+"""
+Уменьшенные копии картинки — чистая работа Pillow без Django.
+
+Модуль выполняется в дочерних процессах пула ``banners/renditions.py``
+(контекст ``spawn``), поэтому не импортирует ни настройки, ни модели:
+на вход байты оригинала, на выход байты копий.
+"""
+import io
+
+from PIL import Image, ImageOps, features
+
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg', 'png': 'image/png'}
+
+
+def supported(fmt):
+    return fmt in ('jpeg', 'png') or bool(features.check(fmt))
+
+
+def target_widths(width, widths):
+    """Ширины копий: всё, что уже оригинала, плюс сам оригинал, если он уже самой широкой копии."""
+    result = sorted(w for w in set(widths) if w < width)
+    if width <= max(widths, default=0) or not result:
+        result.append(width)
+    return result
+
+
+def render(data, widths, formats, quality):
+    """
+    Возвращает ``[(format, width, height, bytes), ...]`` для каждой ширины из
+    ``target_widths`` и каждого поддерживаемого формата.
+    """
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+    results = []
+    for width in target_widths(image.width, widths):
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+        for fmt in formats:
+            if not supported(fmt):
+                continue
+            frame = resized.convert('RGB') if fmt == 'jpeg' and resized.mode != 'RGB' else resized
+            output = io.BytesIO()
+            frame.save(output, format=fmt.upper(), quality=quality.get(fmt, 80))
+            results.append((fmt, width, height, output.getvalue()))
+    return results
@@ -0,0 +1,122 @@
+# banners/rollup.py
+"""
+Свёртка журнала событий (``ImpressionEvent``/``ClickEvent``) в счётчики
+``views``/``clicks`` и в почасовую/дневную статистику (``banners/stats.py``).
+
+Для каждой таблицы событий хранится курсор — id последнего свёрнутого
+события, поэтому свёртку можно запускать сколько угодно раз подряд: каждое
+событие учитывается ровно один раз.
+
+Id событий выдаются при вставке, а видны они после коммита: на PostgreSQL
+транзакция с меньшим id может закоммититься позже соседней, и курсор ушёл
+бы дальше неё. Поэтому свёртка берёт только события, вставленные раньше
+чем ``SETTLE_SECONDS`` назад (``created_at`` — момент вставки, см.
+``counters.apply_events``) и останавливает пачку на первом
+слишком свежем id — к следующему проходу все меньшие id уже видны.
+"""
+from collections import defaultdict
+from datetime import timedelta, timezone
+from itertools import takewhile
+
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.functions import TruncHour
+from django.utils.timezone import now
+
+from . import counters, metrics, stats
+from .models import (
+    Banner, BannerTitle, BannerImage,
+    ImpressionEvent, ClickEvent, EventRollupCursor
+)
+
+EVENT_STREAMS = (
+    # (модель событий, поле счётчика, имя курсора)
+    (ImpressionEvent, 'views', 'impressions'),
+    (ClickEvent, 'clicks', 'clicks'),
+)
+
+
+def rollup_events(batch_size=10000):
+    """Сворачивает все новые события. Возвращает ``{имя курсора: число событий}``."""
+    return {
+        name: _rollup_stream(model, field, name, batch_size)
+        for model, field, name in EVENT_STREAMS
+    }
+
+
+def event_backlog():
+    """``{(имя курсора,): событий после курсора}`` — по разнице id, без COUNT по журналу."""
+    cursors = dict(EventRollupCursor.objects.values_list('name', 'last_id'))
+    backlog = {}
+    for model, _, name in EVENT_STREAMS:
+        last_id = model.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        backlog[(name,)] = max(0, last_id - cursors.get(name, 0))
+    return backlog
+
+
+metrics.registry.collector('banner_event_backlog', 'События журнала, ещё не свёрнутые в счётчики',
+                           event_backlog, aggregate=None, labelnames=('stream',))
+
+
+def _rollup_stream(model, field, name, batch_size):
+    settled_before = now() - timedelta(seconds=counters.get_config()['SETTLE_SECONDS'])
+    processed = 0
+    while True:
+        n = _rollup_batch(model, field, name, batch_size, settled_before)
+        if not n:
+            return processed
+        processed += n
+
+
+@transaction.atomic
+def _rollup_batch(model, field, name, batch_size, settled_before):
+    cursor, _ = EventRollupCursor.objects.select_for_update().get_or_create(name=name)
+    events = (
+        model.objects.filter(id__gt=cursor.last_id)
+        .order_by('id')
+        .values_list('id', 'created_at')[:batch_size]
+    )
+    # Дальше первого свежего события не идём: перед ним ещё может закоммититься меньший id
+    ids = [event_id for event_id, _ in takewhile(lambda event: event[1] < settled_before, events)]
+    if not ids:
+        return 0
+
+    rows = (
+        model.objects.filter(id__gt=cursor.last_id, id__lte=ids[-1])
+        .annotate(hour=TruncHour('created_at', tzinfo=timezone.utc))
+        .values('hour', 'banner_id', 'title_id', 'image_id')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    rows = list(rows)
+
+    # События могут ссылаться на уже удалённые баннеры/креативы
+    live_banners = set(Banner.objects.filter(
+        id__in={r['banner_id'] for r in rows}).values_list('id', flat=True))
+    live_titles = set(BannerTitle.objects.filter(
+        id__in={r['title_id'] for r in rows if r['title_id']}).values_list('id', flat=True))
+    live_images = set(BannerImage.objects.filter(
+        id__in={r['image_id'] for r in rows if r['image_id']}).values_list('id', flat=True))
+
+    increments = defaultdict(int)
+    hits = defaultdict(int)
+    for r in rows:
+        if r['banner_id'] not in live_banners:
+            continue
+        title_id = r['title_id'] if r['title_id'] in live_titles else None
+        image_id = r['image_id'] if r['image_id'] in live_images else None
+
+        increments[(Banner._meta.label, r['banner_id'], field)] += r['n']
+        if title_id:
+            increments[(BannerTitle._meta.label, title_id, field)] += r['n']
+        if image_id:
+            increments[(BannerImage._meta.label, image_id, field)] += r['n']
+        hits[(field, r['hour'], r['banner_id'], title_id, image_id)] += r['n']
+
+    counters.apply_increments(increments)
+    stats.add_hits(hits)
+
+    cursor.last_id = ids[-1]
+    cursor.save(update_fields=['last_id', 'updated_at'])
+    return len(ids)
+
@@ -0,0 +1,164 @@
+# banners/sampling.py
+"""
+Случайный добор баннеров к подходящим по тегам — за O(k) на страницу.
+
+Статья показывает все подходящие баннеры плюс часть пула остальных;
+``random_tag_probability`` (0–10) задаёт долю ``p = rtp / 10``. Раньше на
+каждую страницу уходил ``random.random()`` на каждый баннер пула (статьи) или
+``pop(0)`` двух списков (написанные статьи). Здесь сразу разыгрывается,
+сколько баннеров добрать, а затем выбираются только они:
+
+* статья — каждый баннер пула независимо с вероятностью ``p``, то есть
+  ``Binomial(n, p)`` штук;
+* написанная статья — прежний цикл «с вероятностью ``p`` случайный, иначе
+  подходящий» добирает ``NegBinomial(m + 1, p)`` случайных до того, как
+  закончатся ``m`` подходящих (но не больше размера пула).
+
+Оба числа numpy разыгрывает за O(1). Сами баннеры берутся из
+``RandomPool``: при равных весах — выборка без возвращения, при разных
+(``Banner.weight``) — таблица псевдонимов (выбор за O(1)) с отбрасыванием
+повторов. Если нужна заметная доля пула или повторов слишком много —
+взвешенная резервуарная выборка (Efraimidis–Spirakis) одним проходом numpy.
+Пул с таблицей строится один раз вместе с оболочкой страницы
+(``render_cache``).
+
+Все функции принимают ``rng`` (``numpy.random.Generator``) — в тестах с
+seed; по умолчанию используется ``RNG`` модуля.
+"""
+import numpy as np
+
+RNG = np.random.default_rng()
+
+
+def probability(random_tag_probability):
+    """Доля случайного добора из поля статьи (0–10)."""
+    return min(max(random_tag_probability / 10, 0.0), 1.0)
+
+
+def binomial(n, p, rng=None):
+    rng = rng or RNG
+    if n <= 0 or p <= 0:
+        return 0
+    if p >= 1:
+        return n
+    return int(rng.binomial(n, p))
+
+
+def negative_binomial(failures, p, limit, rng=None):
+    """Число успехов (вероятность ``p``) до ``failures``-й неудачи, не больше ``limit``."""
+    rng = rng or RNG
+    if limit <= 0 or p <= 0:
+        return 0
+    if p >= 1:
+        return limit
+    # У numpy наоборот: неудачи до n-го успеха
+    return min(int(rng.negative_binomial(failures, 1 - p)), limit)
+
+
+class AliasTable:
+    """Выбор индекса с вероятностью, пропорциональной весу, за O(1) (метод Воза)."""
+    __slots__ = ('probabilities', 'aliases')
+
+    def __init__(self, weights):
+        n = len(weights)
+        total = sum(weights)
+        scaled = [weight * n / total for weight in weights]
+        probabilities = [1.0] * n
+        aliases = list(range(n))
+        small = [i for i, value in enumerate(scaled) if value < 1.0]
+        large = [i for i, value in enumerate(scaled) if value >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            probabilities[less] = scaled[less]
+            aliases[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Оставшиеся — 1.0 с точностью до округления
+        self.probabilities = np.array(probabilities)
+        self.aliases = np.array(aliases, dtype=np.intp)
+
+    def draw(self, size, rng=None):
+        """``size`` независимых индексов (с повторами)."""
+        rng = rng or RNG
+        columns = rng.integers(0, len(self.probabilities), size)
+        keep = rng.random(size) < self.probabilities[columns]
+        return np.where(keep, columns, self.aliases[columns])
+
+
+class RandomPool:
+    """
+    Пул случайного добора. Элементы с нулевым весом в пул не попадают;
+    ``weights=None`` — все равны.
+    """
+    __slots__ = ('items', 'weights', 'table')
+
+    # Сколько бросков таблицы на один нужный элемент, прежде чем перейти к резервуару
+    DRAWS_PER_ITEM = 4
+    # Выборка больше 1/RESERVOIR_SHARE пула — сразу резервуаром
+    RESERVOIR_SHARE = 20
+
+    def __init__(self, items, weights=None):
+        items = list(items)
+        if weights is not None:
+            weights = list(weights)
+            items = [item for item, weight in zip(items, weights) if weight > 0]
+            weights = [weight for weight in weights if weight > 0]
+            if len(set(weights)) <= 1:
+                weights = None
+        self.items = tuple(items)
+        self.weights = np.array(weights, dtype=np.float64) if weights else None
+        self.table = AliasTable(weights) if weights else None
+
+    def __len__(self):
+        return len(self.items)
+
+    def sample(self, k, rng=None):
+        """``k`` разных элементов; при весах — последовательный выбор пропорционально весу."""
+        rng = rng or RNG
+        k = min(k, len(self.items))
+        if k <= 0:
+            return []
+        if self.table is None:
+            indices = rng.choice(len(self.items), k, replace=False).tolist()
+        elif k * self.RESERVOIR_SHARE > len(self.items):
+            # Нужна заметная доля пула — один векторный проход дешевле бросков с повторами
+            indices = self._reservoir(k, [], rng)
+        else:
+            # Броски по порядку без повторов — тот же последовательный выбор по весам
+            indices = list(dict.fromkeys(self.table.draw(self.DRAWS_PER_ITEM * k, rng).tolist()))[:k]
+            if len(indices) < k:
+                # Тяжёлые элементы уже выбраны, дальше одни повторы — добираем по остальным
+                indices.extend(self._reservoir(k - len(indices), indices, rng))
+        return [self.items[i] for i in indices]
+
+    def _reservoir(self, k, exclude, rng):
+        # Ключ u^(1/w) в логарифмах; k наибольших — выборка без возвращения по весам
+        keys = np.log1p(-rng.random(len(self.weights))) / self.weights
+        keys[exclude] = -np.inf
+        top = np.argpartition(keys, -k)[-k:]
+        return top[np.argsort(keys[top])[::-1]].tolist()
+
+
+def banner_pool(banners):
+    """Пул случайного добора из баннеров с их ``Banner.weight``."""
+    banners = list(banners)
+    return RandomPool(banners, [banner.weight for banner in banners])
+
+
+def article_slate(matched, pool, random_tag_probability, rng=None):
+    """Баннеры статьи: все ``matched`` и ``Binomial(len(pool), p)`` из пула, вперемешку."""
+    rng = rng or RNG
+    slate = list(matched)
+    slate.extend(pool.sample(binomial(len(pool), probability(random_tag_probability), rng), rng))
+    rng.shuffle(slate)
+    return slate
+
+
+def written_slate(matched, pool, random_tag_probability, rng=None):
+    """
+    Баннеры написанной статьи: все ``matched`` и столько случайных, сколько
+    добрал бы прежний цикл. Порядок не перемешан — это делает страница.
+    """
+    rng = rng or RNG
+    count = negative_binomial(len(matched) + 1, probability(random_tag_probability), len(pool), rng)
+    return list(matched) + pool.sample(count, rng)
@@ -0,0 +1,82 @@
+# banners/serving.py
+"""
+Таблица выдачи ``BannerServingRow`` для написанных статей.
+
+На каждый баннер — одна строка: владелец и отсортированные id тегов.
+Кандидаты статьи — все баннеры владельца, как и без таблицы: баннер без
+креативов выводится со своим ``title``. Креативы страница выбирает сама
+(``banners/creatives.py``). Кандидаты берутся одним запросом по индексу
+``(owner, banner)``, а деление на подходящие по тегам и случайные —
+пересечением множеств в памяти.
+
+Строки обновляются сигналами (``banners/signals.py``) при изменении баннера
+и его тегов; после массовых правок в обход ORM таблицу
+пересчитывает команда ``rebuild_banner_serving_rows``.
+"""
+from collections import defaultdict
+
+from .models import Banner, BannerServingRow
+
+BATCH_SIZE = 1000
+
+UPDATE_FIELDS = ['owner', 'tag_ids', 'updated_at']
+
+
+def refresh(banner_ids):
+    """Пересчитывает строки выдачи для баннеров. Возвращает число строк."""
+    owners = dict(Banner.objects.filter(id__in=set(banner_ids)).values_list('id', 'owner_id'))
+    if not owners:
+        return 0
+
+    tags = defaultdict(list)
+    links = Banner.tags.through.objects.filter(banner_id__in=owners).order_by('tag_id')
+    for banner_id, tag_id in links.values_list('banner_id', 'tag_id'):
+        tags[banner_id].append(tag_id)
+
+    rows = [
+        BannerServingRow(
+            banner_id=banner_id,
+            owner_id=owner_id,
+            tag_ids=tags[banner_id],
+        )
+        for banner_id, owner_id in owners.items()
+    ]
+    BannerServingRow.objects.bulk_create(
+        rows, batch_size=BATCH_SIZE,
+        update_conflicts=True, unique_fields=['banner'], update_fields=UPDATE_FIELDS,
+    )
+    return len(rows)
+
+
+def rebuild(batch_size=BATCH_SIZE):
+    """Пересчитывает всю таблицу пачками по ``batch_size`` баннеров."""
+    total = 0
+    last_id = 0
+    while True:
+        ids = list(Banner.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return total
+        total += refresh(ids)
+        last_id = ids[-1]
+
+
+def owner_rows(owner_id):
+    """Строки владельца вместе с баннерами — один проход по индексу."""
+    return (
+        BannerServingRow.objects.filter(owner_id=owner_id)
+        .select_related('banner')
+        .order_by('banner_id')
+    )
+
+
+def partition(rows, tag_ids):
+    """Делит баннеры строк на подходящие по ``tag_ids`` и остальные."""
+    tag_ids = set(tag_ids)
+    matched, rest = [], []
+    for row in rows:
+        (matched if tag_ids.intersection(row.tag_ids) else rest).append(row.banner)
+    return matched, rest
+
+
+def written_candidates(owner_id, tag_ids):
+    return partition(owner_rows(owner_id), tag_ids)
@@ -0,0 +1,107 @@
+# banners/signals.py
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from . import invalidation, render_cache, renditions, serving, tag_index
+from .creatives import VERSION_NAME as CREATIVES_VERSION
+from .models import Article, Banner, BannerImage, BannerTitle, Language, Tag, WrittenArticle
+
+
+def _linked_banner_ids(instance, action, reverse, pk_set):
+    """id баннеров, чьи теги поменялись в ``m2m_changed``; ``None`` — на этом шаге ничего не поменялось."""
+    if not reverse:
+        return [instance.pk] if action in ('post_add', 'post_remove', 'post_clear') else None
+    # tag.banners.add/remove/clear — instance здесь тег
+    if action == 'pre_clear':
+        instance._linked_banner_ids = list(instance.banners.values_list('id', flat=True))
+    elif action == 'post_clear':
+        return getattr(instance, '_linked_banner_ids', [])
+    elif action in ('post_add', 'post_remove'):
+        return pk_set
+    return None
+
+
+@receiver(post_save, sender=Banner)
+@receiver(post_delete, sender=Banner)
+def invalidate_tag_index(sender, instance, **kwargs):
+    tag_index.invalidate([instance.pk])
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tag_banners(sender, instance, **kwargs):
+    # Связи уйдут каскадом без m2m_changed — запоминаем баннеры заранее
+    instance._linked_banner_ids = list(instance.banners.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_index_on_tag_delete(sender, instance, **kwargs):
+    tag_index.invalidate(getattr(instance, '_linked_banner_ids', None))
+
+
+@receiver(m2m_changed, sender=Banner.tags.through)
+def refresh_banner_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    banner_ids = _linked_banner_ids(instance, action, reverse, pk_set)
+    if banner_ids is not None:
+        tag_index.invalidate(banner_ids)
+        serving.refresh(banner_ids)
+
+
+@receiver(post_save, sender=BannerTitle)
+@receiver(post_delete, sender=BannerTitle)
+@receiver(post_save, sender=BannerImage)
+@receiver(post_delete, sender=BannerImage)
+def invalidate_creatives(sender, **kwargs):
+    invalidation.bump_version(CREATIVES_VERSION)
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_delete, sender=Article)
+@receiver(post_save, sender=WrittenArticle)
+@receiver(post_delete, sender=WrittenArticle)
+@receiver(post_save, sender=Banner)
+@receiver(post_delete, sender=Banner)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=BannerTitle)
+@receiver(post_delete, sender=BannerTitle)
+# Как и заголовки: оболочка страницы не переживает правку креативов баннера
+@receiver(post_save, sender=BannerImage)
+@receiver(post_delete, sender=BannerImage)
+@receiver(post_save, sender=Language)
+def invalidate_render_cache(sender, **kwargs):
+    render_cache.invalidate()
+
+
+@receiver(m2m_changed, sender=Article.tags.through)
+@receiver(m2m_changed, sender=WrittenArticle.tags.through)
+@receiver(m2m_changed, sender=Banner.tags.through)
+def invalidate_render_cache_on_links(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        render_cache.invalidate()
+
+
+@receiver(post_save, sender=Banner)
+def refresh_serving_row(sender, instance, **kwargs):
+    serving.refresh([instance.pk])
+
+
+@receiver(post_delete, sender=Tag)
+def refresh_serving_rows_on_tag_delete(sender, instance, origin=None, **kwargs):
+    if origin is not None and not isinstance(origin, Tag) and getattr(origin, 'model', None) is not Tag:
+        return
+    serving.refresh(getattr(instance, '_linked_banner_ids', ()))
+
+
+@receiver(post_save, sender=BannerImage)
+def schedule_renditions(sender, instance, **kwargs):
+    # Копии для этого файла уже есть (в т.ч. пустое сохранение из админки)
+    if instance.image and instance.renditions.get('source') != instance.image.name:
+        renditions.schedule(instance.pk)
+
+
+@receiver(post_delete, sender=BannerImage)
+def delete_renditions(sender, instance, **kwargs):
+    files = instance.renditions.get('files', ())
+    if files:
+        transaction.on_commit(lambda: renditions.delete_files(files))
@@ -1,11 +1,15 @@
 document.addEventListener('DOMContentLoaded', () => {
   const items = window.bannerItems || [];
+  let nextCursor = window.bannerNextCursor || null;
+  let loading = false;
+  // Сколько баннеров не дорисовали, пока ждали следующую страницу
+  let owed = 0;
   let idx = 0;
   const container = document.getElementById('banner-container');
   const anchor = document.getElementById('scroll-anchor');
 
   function renderNext() {
-      if (!items.length) return;
+      if (idx >= items.length) return;
       const { image_url, title, ad_link } = items[idx];
       const el = document.createElement('div');
       el.className = 'banner-item';
@@ -19,26 +23,54 @@ document.addEventListener('DOMContentLoaded', () => {
       `;
       container.appendChild(el);
 
-      idx = (idx + 1) % items.length;
+      idx += 1;
     }
 
+  // Следующая страница ленты по курсору
+  function loadMore() {
+    if (loading || !nextCursor) return Promise.resolve();
+    loading = true;
+    const url = `${window.bannerFeedUrl}?cursor=${encodeURIComponent(nextCursor)}`;
+    return fetch(url)
+      .then(resp => resp.json())
+      .then(data => {
+        items.push(...data.items);
+        nextCursor = data.next_cursor;
+      })
+      .then(() => {
+        const count = owed;
+        owed = 0;
+        if (count) renderMany(count);
+      })
+      .finally(() => { loading = false; });
+  }
 
-  // Предзагрузка первых 20 баннеров
-  for (let i = 0; i < 20; i++) {
-    renderNext();
+  function renderMany(count) {
+    for (let i = 0; i < count; i++) {
+      if (idx >= items.length) {
+        owed += count - i;
+        break;
+      }
+      renderNext();
+    }
+    // Подгружаем заранее, пока в запасе меньше страницы
+    if (items.length - idx < count) {
+      loadMore();
+    }
   }
 
+  // Предзагрузка первых 20 баннеров
+  renderMany(20);
+
   // Когда «якорь» прокручивается в область видимости, подгружаем ещё
   const observer = new IntersectionObserver(entries => {
     if (entries[0].isIntersecting) {
       // подгружаем по 10 штук
-      for (let i = 0; i < 10; i++) {
-        renderNext();
-      }
+      renderMany(10);
     }
   }, {
     rootMargin: '200px'
   });
 
   observer.observe(anchor);
-});
\ No newline at end of file
+});
@@ -0,0 +1,303 @@
+# banners/stats.py
+"""
+Почасовые и дневные агрегаты просмотров и кликов (``BannerStats``,
+``CreativeStats``) и запросы к ним.
+
+Конвейер счётчиков (``banners/counters.py``, а в режиме ``events`` —
+``banners/rollup.py``) копит «попадания» ``{(поле, час, баннер, заголовок,
+картинка): n}`` и отдаёт их в ``add_hits``. Тот пишет одним запросом на
+таблицу: ``INSERT … SELECT`` сам добирает разрезы (владелец баннера, язык
+заголовка) и прибавляет числа к строкам часа и дня через ``ON CONFLICT DO
+UPDATE SET views = views + excluded.views`` — без чтений перед записью и без
+гонок между воркерами.
+
+Отчёты и бандиты читают только эти таблицы, а не горячие поля
+``views``/``clicks`` баннеров и креативов. Все периоды — в UTC.
+"""
+from collections import defaultdict
+from datetime import timezone
+
+from django.db import connection
+from django.db.models import Sum
+
+from .models import Banner, BannerImage, BannerStats, BannerTitle, CreativeStats, Language
+
+PERIODS = ('hour', 'day')
+
+# SQLite ограничивает число SELECT-ов в одном UNION (500 по умолчанию)
+BATCH_SIZE = 200
+
+# Колонки-суммы и колонки, которые при конфликте просто перезаписываются
+SUM_FIELDS = ('views', 'clicks')
+BANNER_KEY = ('period', 'bucket', 'banner', 'language_code')
+CREATIVE_KEY = ('period', 'bucket', 'kind', 'creative_id', 'language_code')
+
+
+def bucket_start(moment, period):
+    """Начало часа или дня (UTC), в который попадает ``moment``."""
+    moment = moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if period == 'day' else moment
+
+
+def _on_conflict(model, key_fields, value_fields):
+    """``ON CONFLICT (ключ) DO UPDATE``: суммы прибавляются, остальное перезаписывается."""
+    qn = connection.ops.quote_name
+    meta = model._meta
+    table = qn(meta.db_table)
+    updates = []
+    for name in value_fields:
+        column = qn(meta.get_field(name).column)
+        if name in SUM_FIELDS:
+            updates.append(f'{column} = {table}.{column} + EXCLUDED.{column}')
+        else:
+            updates.append(f'{column} = EXCLUDED.{column}')
+    keys = ', '.join(qn(meta.get_field(name).column) for name in key_fields)
+    return f'ON CONFLICT ({keys}) DO UPDATE SET {", ".join(updates)}'
+
+
+def _upsert(model, rows, key_fields):
+    """
+    ``rows`` — ``{ключ: {поле: значение}}`` с уже известными разрезами. Суммы
+    из ``SUM_FIELDS`` прибавляются к существующей строке, остальные поля
+    перезаписываются.
+    """
+    if not rows:
+        return 0
+    meta = model._meta
+    value_fields = [name for name in next(iter(rows.values())) if name not in key_fields]
+    fields = [meta.get_field(name) for name in (*key_fields, *value_fields)]
+    qn = connection.ops.quote_name
+    table = qn(meta.db_table)
+    columns = ', '.join(qn(field.column) for field in fields)
+    on_conflict = _on_conflict(model, key_fields, value_fields)
+    row_sql = '(' + ', '.join(['%s'] * len(fields)) + ')'
+
+    items = sorted(rows.items(), key=_order)
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), BATCH_SIZE):
+            batch = items[start:start + BATCH_SIZE]
+            params = []
+            for key, values in batch:
+                raw = dict(zip(key_fields, key), **values)
+                params.extend(field.get_db_prep_save(raw[field.name], connection) for field in fields)
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) VALUES {", ".join([row_sql] * len(batch))} {on_conflict}',
+                params,
+            )
+    return len(items)
+
+
+def _tables():
+    qn = connection.ops.quote_name
+    return {model.__name__: qn(model._meta.db_table) for model in (Banner, BannerTitle, BannerImage, Language)}
+
+
+def _language_sql(tables):
+    """Код языка заголовка по его id (параметр); '' — нет заголовка или языка."""
+    return (f"COALESCE((SELECT l.code FROM {tables['BannerTitle']} t, {tables['Language']} l "
+            f"WHERE t.id = %s AND l.id = t.language_id), '')")
+
+
+def _insert_grouped(model, key_fields, value_fields, selects, params):
+    """
+    ``INSERT … SELECT`` из объединения ``selects`` с группировкой по ключу:
+    разрезы (владелец, язык) берутся из базы тем же запросом, удалённые
+    баннеры и креативы просто не дают строк.
+    """
+    qn = connection.ops.quote_name
+    meta = model._meta
+    table = qn(meta.db_table)
+    keys = [qn(meta.get_field(name).column) for name in key_fields]
+    values = [qn(meta.get_field(name).column) for name in value_fields]
+    aggregated = [f'SUM(h.{column})' if name in SUM_FIELDS else f'MAX(h.{column})'
+                  for name, column in zip(value_fields, values)]
+    on_conflict = _on_conflict(model, key_fields, value_fields)
+    written = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(selects), BATCH_SIZE):
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(keys + values)}) '
+                f'SELECT {", ".join(f"h.{column}" for column in keys)}, {", ".join(aggregated)} '
+                f'FROM ({" UNION ALL ".join(selects[start:start + BATCH_SIZE])}) h '
+                # WHERE нужен SQLite, чтобы ON CONFLICT не приняли за условие join-а
+                f'WHERE 1 = 1 GROUP BY {", ".join(f"h.{column}" for column in keys)} {on_conflict}',
+                [param for row in params[start:start + BATCH_SIZE] for param in row],
+            )
+            written += max(cursor.rowcount, 0)
+    return written
+
+
+def add_hits(hits):
+    """
+    Прибавляет попадания ``{(поле, момент, banner_id, title_id, image_id): n}``
+    к строкам часа и дня — по одному запросу на таблицу, без чтений.
+    Попадания удалённых баннеров пропадают, удалённых креативов — учитываются
+    только в строках баннера. Возвращает число записанных строк.
+    """
+    if not hits:
+        return 0
+    # Склеиваем попадания по будущему ключу, пока язык ещё представлен заголовком
+    banner_hits = defaultdict(lambda: [0, 0])
+    creative_hits = defaultdict(lambda: [0, 0])
+    for (field, moment, banner_id, title_id, image_id), n in hits.items():
+        column = 0 if field == 'views' else 1
+        for period in PERIODS:
+            bucket = bucket_start(moment, period)
+            banner_hits[(period, bucket, banner_id, title_id)][column] += n
+            if title_id:
+                creative_hits[(period, bucket, 'title', title_id, banner_id, title_id)][column] += n
+            if image_id:
+                creative_hits[(period, bucket, 'image', image_id, banner_id, title_id)][column] += n
+
+    tables = _tables()
+    language = _language_sql(tables)
+    bucket_field = BannerStats._meta.get_field('bucket')
+
+    def prep(moment):
+        return bucket_field.get_db_prep_save(moment, connection)
+
+    banner_select = (
+        f'SELECT %s AS period, %s AS bucket, b.id AS banner_id, {language} AS language_code, '
+        f'b.owner_id AS owner_id, %s AS views, %s AS clicks FROM {tables["Banner"]} b WHERE b.id = %s'
+    )
+    banner_params = [
+        (period, prep(bucket), title_id, views, clicks, banner_id)
+        for (period, bucket, banner_id, title_id), (views, clicks) in sorted(banner_hits.items(), key=_order)
+    ]
+    written = _insert_grouped(
+        BannerStats, BANNER_KEY, ('owner', 'views', 'clicks'),
+        [banner_select] * len(banner_params), banner_params,
+    )
+
+    creative_selects = []
+    creative_params = []
+    for (period, bucket, kind, creative_id, banner_id, title_id), (views, clicks) in sorted(
+            creative_hits.items(), key=_order):
+        creative_table = tables['BannerTitle' if kind == 'title' else 'BannerImage']
+        creative_selects.append(
+            f'SELECT %s AS period, %s AS bucket, %s AS kind, c.id AS creative_id, {language} AS language_code, '
+            f'b.id AS banner_id, b.owner_id AS owner_id, %s AS views, %s AS clicks '
+            f'FROM {creative_table} c, {tables["Banner"]} b WHERE c.id = %s AND b.id = c.banner_id AND b.id = %s'
+        )
+        creative_params.append((period, prep(bucket), kind, title_id, views, clicks, creative_id, banner_id))
+    written += _insert_grouped(
+        CreativeStats, CREATIVE_KEY, ('banner', 'owner', 'views', 'clicks'),
+        creative_selects, creative_params,
+    )
+    return written
+
+
+def _order(item):
+    # Один порядок ключей у всех воркеров — блокировки строк берутся без взаимоблокировок
+    return tuple(str(part) for part in item[0])
+
+
+def window(model, since=None, until=None, period=None):
+    """
+    Строки ``model`` за ``[since, until)``. Без явного ``period`` берутся дневные
+    строки, если обе границы — полночь UTC, иначе почасовые.
+    """
+    if period is None:
+        aligned = all(bound is None or bucket_start(bound, 'day') == bound for bound in (since, until))
+        period = 'day' if aligned else 'hour'
+    rows = model.objects.filter(period=period)
+    if since is not None:
+        rows = rows.filter(bucket__gte=bucket_start(since, period))
+    if until is not None:
+        rows = rows.filter(bucket__lt=until)
+    return rows
+
+
+def _with_ctr(rows):
+    for row in rows:
+        row['ctr'] = row['clicks'] / row['views'] if row['views'] > 0 else 0
+    return rows
+
+
+def banner_ctr(since=None, until=None, period=None, by=('banner',), **filters):
+    """
+    CTR за окно, сгруппированный по полям ``by`` (``banner``, ``owner``,
+    ``language_code``, ``bucket``). ``filters`` — обычные условия ORM,
+    например ``owner=user`` или ``banner__in=ids``. Возвращает список словарей
+    с ``views``, ``clicks`` и ``ctr``.
+    """
+    rows = (
+        window(BannerStats, since, until, period).filter(**filters)
+        .values(*by).annotate(views=Sum('views'), clicks=Sum('clicks')).order_by(*by)
+    )
+    return _with_ctr(list(rows))
+
+
+def creative_ctr(since=None, until=None, period=None, by=('kind', 'creative_id'), **filters):
+    """То же для заголовков и картинок."""
+    rows = (
+        window(CreativeStats, since, until, period).filter(**filters)
+        .values(*by).annotate(views=Sum('views'), clicks=Sum('clicks')).order_by(*by)
+    )
+    return _with_ctr(list(rows))
+
+
+def creative_totals(banner_ids, since=None):
+    """``{(kind, creative_id): (clicks, views)}`` креативов баннеров по дневным строкам."""
+    rows = CreativeStats.objects.filter(period='day', banner_id__in=banner_ids)
+    if since is not None:
+        rows = rows.filter(bucket__gte=bucket_start(since, 'day'))
+    rows = rows.values_list('kind', 'creative_id').annotate(clicks=Sum('clicks'), views=Sum('views')).order_by()
+    return {(kind, creative_id): (clicks, views) for kind, creative_id, clicks, views in rows}
+
+
+def backfill(banner_ids=None):
+    """
+    Переносит в дневные строки ту часть горячих счётчиков ``views``/``clicks``,
+    которой ещё нет в статистике (история до появления таблиц, правки в
+    админке). Даты у такой истории нет — она ложится в день создания баннера
+    или картинки. Повторный запуск ничего не добавляет. Возвращает число строк.
+    """
+    banners = Banner.objects.all()
+    if banner_ids is not None:
+        banners = banners.filter(id__in=banner_ids)
+    banners = {b.id: b for b in banners.only('id', 'owner_id', 'created_at', 'views', 'clicks')}
+    if not banners:
+        return 0
+
+    banner_seen = defaultdict(lambda: [0, 0])
+    for banner_id, views, clicks in (
+        BannerStats.objects.filter(period='day', banner_id__in=banners)
+        .values_list('banner_id').annotate(views=Sum('views'), clicks=Sum('clicks')).order_by()
+    ):
+        banner_seen[banner_id] = [views, clicks]
+    creative_seen = {
+        (kind, creative_id): (views, clicks)
+        for kind, creative_id, views, clicks in (
+            CreativeStats.objects.filter(period='day', banner_id__in=banners)
+            .values_list('kind', 'creative_id').annotate(views=Sum('views'), clicks=Sum('clicks')).order_by()
+        )
+    }
+
+    banner_rows = {}
+    for banner in banners.values():
+        seen_views, seen_clicks = banner_seen[banner.id]
+        _add_remainder(banner_rows, ('day', bucket_start(banner.created_at, 'day'), banner.id, ''),
+                       banner.views - seen_views, banner.clicks - seen_clicks, owner=banner.owner_id)
+
+    creative_rows = {}
+    for title in BannerTitle.objects.filter(banner_id__in=banners).select_related('language'):
+        banner = banners[title.banner_id]
+        seen_views, seen_clicks = creative_seen.get(('title', title.id), (0, 0))
+        key = ('day', bucket_start(banner.created_at, 'day'), 'title', title.id,
+               title.language.code if title.language else '')
+        _add_remainder(creative_rows, key, title.views - seen_views, title.clicks - seen_clicks,
+                       owner=banner.owner_id, banner=banner.id)
+    for image in BannerImage.objects.filter(banner_id__in=banners):
+        banner = banners[image.banner_id]
+        seen_views, seen_clicks = creative_seen.get(('image', image.id), (0, 0))
+        key = ('day', bucket_start(image.created_at, 'day'), 'image', image.id, '')
+        _add_remainder(creative_rows, key, image.views - seen_views, image.clicks - seen_clicks,
+                       owner=banner.owner_id, banner=banner.id)
+
+    return _upsert(BannerStats, banner_rows, BANNER_KEY) + _upsert(CreativeStats, creative_rows, CREATIVE_KEY)
+
+
+def _add_remainder(rows, key, views, clicks, **dimensions):
+    if views > 0 or clicks > 0:
+        rows[key] = dict(dimensions, views=max(views, 0), clicks=max(clicks, 0))
@@ -0,0 +1,166 @@
+# banners/synthetic.py
+"""
+Синтетический каталог для нагрузочных замеров (``manage.py generate_banner_catalog``).
+
+Всё создаётся ``bulk_create`` из ``random.Random(seed)``, поэтому один и тот
+же seed даёт один и тот же каталог. Объекты помечены префиксом в именах и
+slug-ах — их можно удалить ``clear_catalog(prefix)``, не трогая настоящие
+данные. ``bulk_create`` не шлёт сигналы, поэтому в конце кэши воркера
+сбрасываются явно.
+"""
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from . import invalidation, render_cache, serving, tag_index
+from .creatives import VERSION_NAME as CREATIVES_VERSION
+from .layout import compile_layout, slot_marker
+from .models import Article, Banner, BannerImage, BannerTitle, Language, Tag, Vertical, WrittenArticle
+
+BATCH_SIZE = 1000
+
+DEFAULTS = {
+    'owners': 5,
+    'tags': 50,
+    'verticals': 5,
+    'banners': 500,
+    'languages': ('ru', 'en'),
+    'titles_per_language': 3,
+    'images_per_banner': 3,
+    'tags_per_banner': 3,
+    'articles': 50,
+    'written_articles': 50,
+    'tags_per_article': 3,
+    'slots': 3,
+}
+
+
+def _sample(rng, population, k):
+    return rng.sample(population, min(k, len(population)))
+
+
+def _link(through, field_a, field_b, pairs):
+    through.objects.bulk_create(
+        [through(**{field_a: a, field_b: b}) for a, b in pairs],
+        batch_size=BATCH_SIZE, ignore_conflicts=True,
+    )
+
+
+def _written_content(rng, number, slots):
+    paragraphs = [f'<p>Абзац {number}.{i}: ' + 'текст ' * rng.randint(20, 80) + '</p>' for i in range(slots + 1)]
+    parts = [paragraphs[0]]
+    for slot in range(1, slots + 1):
+        parts.append(slot_marker(slot))
+        parts.append(paragraphs[slot])
+    return ''.join(parts)
+
+
+@transaction.atomic
+def generate_catalog(prefix='synthetic', seed=0, **sizes):
+    """Создаёт каталог и возвращает ``{модель: сколько создано}``."""
+    conf = dict(DEFAULTS, **sizes)
+    rng = random.Random(seed)
+    User = get_user_model()
+
+    languages = [Language.objects.get_or_create(code=code, defaults={'name': code})[0]
+                 for code in conf['languages']]
+
+    password = make_password(None)
+    owners = User.objects.bulk_create([
+        User(username=f'{prefix}-owner-{i}', password=password) for i in range(conf['owners'])
+    ])
+    tags = Tag.objects.bulk_create([
+        Tag(name=f'{prefix}-tag-{i}', owner=rng.choice(owners) if owners else None)
+        for i in range(conf['tags'])
+    ], batch_size=BATCH_SIZE)
+    verticals = Vertical.objects.bulk_create([
+        Vertical(name=f'{prefix}-vertical-{i}') for i in range(conf['verticals'])
+    ])
+    _link(Vertical.tags.through, 'vertical', 'tag', [
+        (vertical, tag) for vertical in verticals
+        for tag in _sample(rng, tags, max(1, len(tags) // max(1, len(verticals))))
+    ])
+
+    banners = Banner.objects.bulk_create([
+        Banner(
+            title=f'{prefix} banner {i}', description='', link_url=f'https://example.com/{prefix}/{i}/',
+            owner=rng.choice(owners) if owners else None,
+        )
+        for i in range(conf['banners'])
+    ], batch_size=BATCH_SIZE)
+    _link(Banner.tags.through, 'banner', 'tag', [
+        (banner, tag) for banner in banners for tag in _sample(rng, tags, conf['tags_per_banner'])
+    ])
+    titles = BannerTitle.objects.bulk_create([
+        BannerTitle(banner=banner, text=f'{banner.title} {language.code} {j}', language=language)
+        for banner in banners for language in languages for j in range(conf['titles_per_language'])
+    ], batch_size=BATCH_SIZE)
+    images = BannerImage.objects.bulk_create([
+        BannerImage(banner=banner, image=f'banner_images/{prefix}-{banner.id}-{j}.png')
+        for banner in banners for j in range(conf['images_per_banner'])
+    ], batch_size=BATCH_SIZE)
+
+    articles = Article.objects.bulk_create([
+        Article(
+            title=f'{prefix} article {i}', description='', content_url=f'https://example.com/{prefix}/a{i}/',
+            slug=f'{prefix}-article-{i}', random_tag_probability=rng.randint(0, 10),
+        )
+        for i in range(conf['articles'])
+    ], batch_size=BATCH_SIZE)
+    _link(Article.tags.through, 'article', 'tag', [
+        (article, tag) for article in articles for tag in _sample(rng, tags, conf['tags_per_article'])
+    ])
+
+    written = []
+    for i in range(conf['written_articles']):
+        content = _written_content(rng, i, conf['slots'])
+        written.append(WrittenArticle(
+            title=f'{prefix} written {i}', description='', slug=f'{prefix}-written-{i}',
+            content=content, content_layout=compile_layout(content)[0],
+            random_tag_probability=rng.randint(0, 10),
+            language=rng.choice(languages) if languages else None,
+            owner=rng.choice(owners) if owners else None,
+        ))
+    written = WrittenArticle.objects.bulk_create(written, batch_size=BATCH_SIZE)
+    _link(WrittenArticle.tags.through, 'writtenarticle', 'tag', [
+        (article, tag) for article in written for tag in _sample(rng, tags, conf['tags_per_article'])
+    ])
+
+    # bulk_create идёт мимо сигналов — строки выдачи пересчитываем разом
+    serving.rebuild()
+    _invalidate()
+    return {
+        'owners': len(owners),
+        'tags': len(tags),
+        'verticals': len(verticals),
+        'banners': len(banners),
+        'titles': len(titles),
+        'images': len(images),
+        'articles': len(articles),
+        'written_articles': len(written),
+    }
+
+
+@transaction.atomic
+def clear_catalog(prefix='synthetic'):
+    """Удаляет ранее сгенерированный каталог с этим префиксом. Возвращает число удалённых объектов."""
+    deleted = 0
+    for queryset in (
+        WrittenArticle.objects.filter(slug__startswith=f'{prefix}-written-'),
+        Article.objects.filter(slug__startswith=f'{prefix}-article-'),
+        Banner.objects.filter(title__startswith=f'{prefix} banner '),
+        Vertical.objects.filter(name__startswith=f'{prefix}-vertical-'),
+        Tag.objects.filter(name__startswith=f'{prefix}-tag-'),
+        get_user_model().objects.filter(username__startswith=f'{prefix}-owner-'),
+    ):
+        deleted += queryset.delete()[0]
+    _invalidate()
+    return deleted
+
+
+def _invalidate():
+    tag_index.invalidate()
+    render_cache.invalidate()
+    invalidation.bump_version(CREATIVES_VERSION)
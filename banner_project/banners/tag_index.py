@@ -0,0 +1,181 @@
+# banners/tag_index.py
+"""
+Битовый индекс тегов баннеров, который живёт в памяти воркера.
+
+Каждому тегу каталога присвоен номер бита, каждому баннеру — строка
+упакованных битов (``numpy.uint8``, 8 тегов на байт). Теги статьи
+превращаются в такую же маску, и подбор кандидатов по всему каталогу — одно
+векторное ``AND`` с последующим ``any`` по строкам: подходящие баннеры и пул
+для случайного добора получаются без циклов на Python и без обращения к базе.
+
+Сигналы (``banners/signals.py``) поднимают версию ``tag_index`` вместе со
+списком изменённых баннеров. Воркер, увидевший новую версию, перечитывает
+только эти баннеры; полная перестройка — если журнал изменений неполон,
+изменений слишком много или с последней полной перестройки прошло
+``REBUILD_INTERVAL`` секунд (страховка от потерянных записей журнала).
+Индекс, прочитанный внутри транзакции, мог увидеть незакоммиченные строки,
+поэтому дообновлять по журналу можно только индекс, построенный вне неё.
+"""
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from . import invalidation, metrics
+from .models import Banner
+
+VERSION_NAME = 'tag_index'
+
+DEFAULTS = {
+    'INCREMENTAL': True,
+    # Больше изменённых баннеров — дешевле перестроить целиком
+    'MAX_CHANGES': 5000,
+    'REBUILD_INTERVAL': 600.0,
+}
+
+
+def get_config():
+    conf = dict(DEFAULTS)
+    conf.update(getattr(settings, 'BANNER_TAG_INDEX', {}))
+    return conf
+
+
+def _width(columns):
+    return (len(columns) + 7) // 8
+
+
+def _set_bits(bits, rows, cols):
+    np.bitwise_or.at(bits, (rows, cols >> 3), np.left_shift(1, cols & 7).astype(np.uint8))
+
+
+def _encode(banner_ids, links, columns):
+    """Строки битов для ``banner_ids`` (отсортированы) по связям ``[(banner_id, tag_id), ...]``."""
+    bits = np.zeros((len(banner_ids), _width(columns)), dtype=np.uint8)
+    if links and len(banner_ids):
+        link_banners = np.fromiter((banner_id for banner_id, _ in links), dtype=np.int64, count=len(links))
+        cols = np.fromiter((columns[tag_id] for _, tag_id in links), dtype=np.int64, count=len(links))
+        rows = np.searchsorted(banner_ids, link_banners).clip(max=len(banner_ids) - 1)
+        # Связи баннеров, удалённых между запросами, пропускаем
+        known = banner_ids[rows] == link_banners
+        _set_bits(bits, rows[known], cols[known])
+    return bits
+
+
+def _load(banner_ids=None):
+    banners = Banner.objects.order_by('id')
+    links = Banner.tags.through.objects.all()
+    if banner_ids is not None:
+        banners = banners.filter(id__in=banner_ids)
+        links = links.filter(banner_id__in=banner_ids)
+    ids = np.fromiter(banners.values_list('id', flat=True), dtype=np.int64)
+    return ids, list(links.values_list('banner_id', 'tag_id'))
+
+
+class TagIndex:
+    def __init__(self, version, banner_ids, columns, bits, built_at=None):
+        self.version = version
+        self.clean = not connection.in_atomic_block
+        # Отсортированные id баннеров; i-я строка ``bits`` — теги баннера banner_ids[i]
+        self.banner_ids = banner_ids
+        self.columns = columns
+        self.bits = bits
+        self.built_at = time.monotonic() if built_at is None else built_at
+
+    def __len__(self):
+        return len(self.banner_ids)
+
+    @property
+    def nbytes(self):
+        return self.banner_ids.nbytes + self.bits.nbytes
+
+    def mask(self, tag_ids):
+        """Маска тегов статьи; теги, которых нет ни у одного баннера, не нужны."""
+        mask = np.zeros(self.bits.shape[1], dtype=np.uint8)
+        cols = np.array([self.columns[tag_id] for tag_id in tag_ids if tag_id in self.columns], dtype=np.int64)
+        np.bitwise_or.at(mask, cols >> 3, np.left_shift(1, cols & 7).astype(np.uint8))
+        return mask
+
+    def matched_rows(self, tag_ids):
+        return np.bitwise_and(self.bits, self.mask(tag_ids)).any(axis=1)
+
+    def split_ids(self, tag_ids):
+        """``(подходящие, остальные)`` — отсортированные кортежи id баннеров."""
+        rows = self.matched_rows(tag_ids)
+        return tuple(self.banner_ids[rows].tolist()), tuple(self.banner_ids[~rows].tolist())
+
+    def matching(self, tag_ids):
+        """id баннеров, у которых есть хотя бы один из ``tag_ids``."""
+        return set(self.banner_ids[self.matched_rows(tag_ids)].tolist())
+
+    def split(self, tag_ids):
+        """Делит каталог на подходящие по тегам баннеры и пул для случайного добора."""
+        matched, rest = self.split_ids(tag_ids)
+        return set(matched), set(rest)
+
+    @classmethod
+    def build(cls, version):
+        banner_ids, links = _load()
+        columns = {tag_id: col for col, tag_id in enumerate(sorted({tag_id for _, tag_id in links}))}
+        return cls(version, banner_ids, columns, _encode(banner_ids, links, columns))
+
+    def updated(self, version, changed_ids):
+        """Новый индекс, в котором строки ``changed_ids`` перечитаны из базы."""
+        changed = np.fromiter(changed_ids, dtype=np.int64, count=len(changed_ids))
+        fresh_ids, links = _load(changed_ids)
+
+        columns = dict(self.columns)
+        for _, tag_id in links:
+            columns.setdefault(tag_id, len(columns))
+        width = _width(columns)
+
+        keep = ~np.isin(self.banner_ids, changed)
+        kept = self.bits[keep]
+        if kept.shape[1] < width:
+            kept = np.pad(kept, ((0, 0), (0, width - kept.shape[1])))
+
+        banner_ids = np.concatenate([self.banner_ids[keep], fresh_ids])
+        bits = np.concatenate([kept, _encode(fresh_ids, links, columns)])
+        order = np.argsort(banner_ids, kind='stable')
+        # Время полной перестройки не сдвигаем — от него считается REBUILD_INTERVAL
+        return TagIndex(version, banner_ids[order], columns, bits[order], built_at=self.built_at)
+
+
+def _fresh(index, version, deadline):
+    return index is not None and index.version == version and index.built_at >= deadline
+
+
+def _refresh(index, version, deadline, conf):
+    if (index is None or not conf['INCREMENTAL'] or index.built_at < deadline
+            or not index.clean or connection.in_atomic_block):
+        return TagIndex.build(version)
+    changed = invalidation.changes_since(VERSION_NAME, index.version, version)
+    if changed is None or len(changed) > conf['MAX_CHANGES']:
+        return TagIndex.build(version)
+    return index.updated(version, changed)
+
+
+_index = None
+_lock = threading.Lock()
+
+metrics.registry.collector('banner_tag_index_bytes', 'Память под битовый индекс тегов в воркере',
+                           lambda: _index.nbytes if _index is not None else 0)
+
+
+def get_tag_index():
+    global _index
+    version = invalidation.get_version(VERSION_NAME)
+    conf = get_config()
+    deadline = time.monotonic() - conf['REBUILD_INTERVAL']
+    if _fresh(_index, version, deadline):
+        return _index
+    with _lock:
+        if not _fresh(_index, version, deadline):
+            _index = _refresh(_index, version, deadline, conf)
+        return _index
+
+
+def invalidate(banner_ids=None):
+    """Поднимает версию индекса; ``banner_ids`` — какие баннеры перечитать (``None`` — все)."""
+    invalidation.bump_version(VERSION_NAME, changes=banner_ids)
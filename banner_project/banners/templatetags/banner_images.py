@@ -0,0 +1,11 @@
+from django import template
+
+from banners.renditions import picture_html
+
+register = template.Library()
+
+
+@register.simple_tag
+def banner_picture(image, alt, sizes='100vw'):
+    """``<picture>`` картинки баннера с копиями из ``BannerImage.renditions`` (см. banners/renditions.py)."""
+    return picture_html(image, alt, sizes)
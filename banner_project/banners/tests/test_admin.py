@@ -2,8 +2,11 @@
 from django.test import TestCase, RequestFactory
 from django.contrib import admin
 from django.contrib.auth import get_user_model
-from django.contrib.auth.models import Group
-from banners.models import Banner, Tag, WrittenArticle, Language
+from django.contrib.auth.models import Group, Permission
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from banners.models import Banner, BannerTitle, Tag, WrittenArticle, Language
 from banners.admin import BannerAdmin, OwnedAdmin, UserAdmin, GroupAdmin
 
 User = get_user_model()
@@ -145,3 +148,67 @@ class TagAndWrittenArticleAdminTest(TestCase):
         self.assertListEqual(list(qs), [self.wa1])
         excl = self.wa_admin.get_exclude(req)
         self.assertIn('owner', excl)
+
+
+class AdminScaleTest(TestCase):
+    def setUp(self):
+        self.superuser = User.objects.create_superuser('su', 'su@x', 'pw')
+        self.staff = User.objects.create_user('st', 'st@x', 'pw', is_staff=True)
+        self.staff.user_permissions.add(*Permission.objects.filter(
+            content_type__app_label='banners', codename__in=['view_tag', 'view_banner', 'change_banner']))
+        self.lang = Language.objects.create(code='en', name='English')
+
+    def _banners(self, count, owner):
+        for i in range(count):
+            banner = Banner.objects.create(title=f'b{owner.pk}-{i}', description='', link_url='#', owner=owner)
+            banner.tags.add(Tag.objects.create(name=f't{owner.pk}-{i}', owner=owner))
+            BannerTitle.objects.create(banner=banner, text='T', language=self.lang)
+
+    def _changelist_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin:banners_banner_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_banner_changelist_query_count_is_constant(self):
+        self.client.force_login(self.superuser)
+        self._banners(2, self.superuser)
+        few = self._changelist_queries()
+        self._banners(10, self.staff)
+        self.assertEqual(self._changelist_queries(), few)
+
+    def test_tag_autocomplete_is_owner_scoped(self):
+        self._banners(1, self.staff)
+        self._banners(1, self.superuser)
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'banners', 'model_name': 'banner', 'field_name': 'tags', 'term': 't',
+        })
+        self.assertEqual([r['text'] for r in response.json()['results']], [f't{self.staff.pk}-0'])
+
+    def test_inline_rows_share_language_choices(self):
+        self.client.force_login(self.superuser)
+        self._banners(1, self.superuser)
+        banner = Banner.objects.get()
+        url = reverse('admin:banners_banner_change', args=[banner.pk])
+        self.client.get(url)  # прогрев кэша ContentType
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        one = len(ctx.captured_queries)
+        for _ in range(5):
+            BannerTitle.objects.create(banner=banner, text='T', language=self.lang)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        self.assertEqual(len(ctx.captured_queries), one)
+
+    def test_large_banner_links_to_creative_lists(self):
+        self.client.force_login(self.superuser)
+        self._banners(1, self.superuser)
+        banner = Banner.objects.get()
+        BannerTitle.objects.bulk_create([BannerTitle(banner=banner, text=str(i)) for i in range(BannerAdmin.inline_limit)])
+
+        response = self.client.get(reverse('admin:banners_banner_change', args=[banner.pk]))
+        self.assertNotContains(response, 'titles-TOTAL_FORMS')
+        link = f"{reverse('admin:banners_bannertitle_changelist')}?banner__id__exact={banner.pk}"
+        self.assertContains(response, link)
+        self.assertEqual(self.client.get(link).status_code, 200)
@@ -0,0 +1,89 @@
+# banners/tests/test_async_views.py
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.http import Http404
+from django.test import AsyncRequestFactory, TestCase, override_settings
+
+from banners import async_views, counters
+from banners.click_tokens import click_url
+from banners.models import Article, Banner, BannerImage, BannerTitle, Language, Tag, WrittenArticle
+
+User = get_user_model()
+
+# Фоновый поток не успеет сбросить буфер за время теста — проверяем сам буфер
+BUFFERED = {'MODE': 'buffered', 'FLUSH_INTERVAL': 3600, 'MAX_PENDING': 1000, 'STORE': 'counters'}
+
+
+@override_settings(BANNER_COUNTERS=BUFFERED)
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+        counters.get_buffer().drain()
+
+        owner = User.objects.create_user('u1', password='pw')
+        lang = Language.objects.create(code='ru', name='Russian')
+        tag = Tag.objects.create(name='tag1', owner=owner)
+
+        self.banner = Banner.objects.create(title='B1', description='', link_url='/ok1/', owner=owner)
+        self.banner.tags.add(tag)
+        self.title = BannerTitle.objects.create(banner=self.banner, text='T1', language=lang)
+        self.image = BannerImage.objects.create(banner=self.banner, image='i1.png')
+
+        self.article = Article.objects.create(title='A', description='', content_url='http://x', slug='art1')
+        self.article.tags.add(tag)
+        self.written = WrittenArticle.objects.create(
+            title='WA', description='', slug='wa1', content='<p>a[BANNER_SLOT_1]b</p>',
+            language=lang, owner=owner,
+        )
+        self.written.tags.add(tag)
+
+    def tearDown(self):
+        counters.get_buffer().drain()
+
+    def buffered(self, field):
+        pending, _, _ = counters.get_buffer().drain()
+        return {
+            (label, pk): delta for (label, pk, name), delta in pending.items() if name == field
+        }
+
+    async def test_article_page_records_impressions_in_memory(self):
+        resp = await async_views.article_with_banners(self.factory.get('/'), 'art1')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('T1', resp.content.decode())
+        self.assertEqual(self.buffered('views'), {
+            ('banners.Banner', self.banner.id): 1,
+            ('banners.BannerTitle', self.title.id): 1,
+            ('banners.BannerImage', self.image.id): 1,
+        })
+
+    async def test_missing_article_is_404(self):
+        with self.assertRaises(Http404):
+            await async_views.article_with_banners(self.factory.get('/'), 'nope')
+
+    async def test_written_article_sets_visitor_cookie(self):
+        resp = await async_views.written_article_with_banners(self.factory.get('/'), 'wa1')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('class="banner-slot-in-text"', resp.content.decode())
+        self.assertIn('banner_visitor', resp.cookies)
+
+    @override_settings(BANNER_TIMERS={'MODE': 'session'})
+    async def test_written_article_keeps_timers_in_session(self):
+        request = self.factory.get('/')
+        request.session = SessionStore()
+        await async_views.written_article_with_banners(request, 'wa1')
+        timers = await request.session.aget('banner_timers')
+        self.assertEqual(list(timers), [str(self.banner.id)])
+
+    async def test_token_redirect(self):
+        resp = await async_views.banner_redirect_token(
+            self.factory.get('/'), click_url(self.banner, self.title).split('/')[-2],
+        )
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(resp['Location'], '/ok1/')
+        self.assertEqual(self.buffered('clicks')[('banners.Banner', self.banner.id)], 1)
+
+    async def test_legacy_redirect_checks_objects(self):
+        resp = await async_views.banner_redirect(self.factory.get('/', {'banner_id': self.banner.id}))
+        self.assertEqual(resp['Location'], '/ok1/')
+        with self.assertRaises(Http404):
+            await async_views.banner_redirect(self.factory.get('/', {'banner_id': self.banner.id + 100}))
@@ -0,0 +1,84 @@
+# banners/tests/test_bandits.py
+import numpy as np
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from banners import counters, stats
+from banners.bandits import Groups, LegacyPolicy, ThompsonSampling, UCB1, get_policy
+from banners.creatives import get_arm_cache, resolve_creatives
+from banners.models import Banner, BannerImage, BannerTitle
+
+
+class PolicyTest(SimpleTestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(42)
+
+    def test_groups_argmax_first_on_ties(self):
+        groups = Groups([2, 3, 1])
+        scores = np.array([0.5, 0.5, 0.1, 0.9, 0.9, 0.0])
+        self.assertEqual(groups.argmax(scores).tolist(), [0, 1, 0])
+
+    def test_empty_groups_rejected(self):
+        with self.assertRaises(ValueError):
+            Groups([1, 0])
+
+    def test_legacy_exploits_best_ctr(self):
+        # у второй группы есть заголовок с >= 15 кликами — берём лучший ctr
+        clicks = [0, 1, 20, 5]
+        views = [0, 10, 40, 5]
+        picks = LegacyPolicy().choose(clicks, views, [2, 2], kind='title', rng=self.rng)
+        self.assertEqual(picks[1], 1)
+        self.assertIn(picks[0], (0, 1))
+
+        # картинки: как только есть просмотры — лучший ctr
+        picks = LegacyPolicy().choose([1, 3], [10, 10], [2], kind='image', rng=self.rng)
+        self.assertEqual(picks.tolist(), [1])
+
+    def test_thompson_prefers_clear_winner(self):
+        policy = ThompsonSampling()
+        wins = sum(
+            policy.choose([900, 100], [1000, 1000], [2], rng=self.rng)[0] == 0
+            for _ in range(50)
+        )
+        self.assertEqual(wins, 50)
+
+    def test_ucb1_tries_unshown_arm_first(self):
+        picks = UCB1().choose([500, 0], [1000, 0], [2], rng=self.rng)
+        self.assertEqual(picks.tolist(), [1])
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            get_policy('nope')
+
+
+class ResolveWithPoliciesTest(TestCase):
+    def setUp(self):
+        self.banner = Banner.objects.create(title='B', description='', link_url='#', selection_policy='ucb1')
+        self.shown = BannerTitle.objects.create(banner=self.banner, text='shown', clicks=50, views=100)
+        self.fresh = BannerTitle.objects.create(banner=self.banner, text='fresh')
+        self.image = BannerImage.objects.create(banner=self.banner, image='i.png')
+        # Бандиты учатся на CreativeStats, а не на горячих счётчиках
+        stats.backfill()
+
+    def test_banner_policy_overrides_default(self):
+        image, title = resolve_creatives([self.banner])[0]
+        # legacy взял бы лучший по ctr 'shown', а ucb1 сначала пробует непоказанный
+        self.assertEqual(title, self.fresh)
+        self.assertEqual(image, self.image)
+
+    @override_settings(BANNER_SELECTION={'DEFAULT_POLICY': 'legacy', 'OWNER_POLICIES': {}, 'STATS_TTL': 3600})
+    def test_cached_stats_updated_by_own_impressions(self):
+        self.banner.selection_policy = ''
+        resolve_creatives([self.banner])
+        with self.assertNumQueries(0):
+            resolve_creatives([self.banner])
+
+        counters.record_impression(self.banner.id, self.fresh.id, self.image.id)
+        arms = get_arm_cache().get_many([self.banner.id])[self.banner.id]
+        self.assertEqual(arms.title_stats.tolist(), [[50, 100], [0, 1]])
+        self.assertEqual(arms.image_stats.tolist(), [[0, 1]])
+
+    def test_cache_dropped_when_creatives_change(self):
+        resolve_creatives([self.banner])
+        BannerTitle.objects.create(banner=self.banner, text='new')
+        arms = get_arm_cache().get_many([self.banner.id])[self.banner.id]
+        self.assertEqual(len(arms.titles), 3)
@@ -0,0 +1,52 @@
+# banners/tests/test_benchmark.py
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from banners.models import Banner, BannerTitle, WrittenArticle
+from banners.synthetic import clear_catalog, generate_catalog
+
+SMALL = dict(owners=2, tags=6, verticals=2, banners=8, titles_per_language=2, images_per_banner=2,
+             articles=3, written_articles=3, slots=2)
+
+
+class SyntheticCatalogTest(TestCase):
+    def test_seeded_catalog_is_reproducible(self):
+        generate_catalog(prefix='a', seed=7, **SMALL)
+        generate_catalog(prefix='b', seed=7, **SMALL)
+        tags = [
+            sorted(name.split('-')[-1] for name in Banner.objects.get(title=f'{prefix} banner 3')
+                   .tags.values_list('name', flat=True))
+            for prefix in 'ab'
+        ]
+        self.assertEqual(tags[0], tags[1])
+
+    def test_counts_layout_and_clear(self):
+        created = generate_catalog(seed=1, languages=['ru', 'en'], **SMALL)
+        self.assertEqual(created['titles'], 8 * 2 * 2)
+        self.assertEqual(BannerTitle.objects.count(), 32)
+        article = WrittenArticle.objects.get(slug='synthetic-written-0')
+        self.assertEqual(article.get_layout(), article.content_layout)
+        self.assertEqual(sum(isinstance(s, int) for s in article.content_layout), 2)
+
+        clear_catalog()
+        self.assertFalse(Banner.objects.exists())
+
+
+class BenchmarkCommandTest(TestCase):
+    def test_reports_every_view(self):
+        generate_catalog(seed=1, **SMALL)
+        out = StringIO()
+        call_command('benchmark_banner_views', requests=3, warmup=1, prefix='synthetic', stdout=out)
+        report = json.loads(out.getvalue())
+
+        self.assertEqual(report['meta']['catalog']['banners'], 8)
+        for name, result in report['views'].items():
+            self.assertEqual(result['errors'], 0, name)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+        # клик по токену не читает базу, но пишет три счётчика и шесть строк статистики
+        # (баннер, заголовок и картинка — за час и за день)
+        token = report['views']['banner_redirect_token']
+        self.assertEqual(token['rows_written_per_request'] + token['deferred_rows_written'] / 3, 9)
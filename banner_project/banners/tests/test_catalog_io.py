@@ -0,0 +1,128 @@
+# banners/tests/test_catalog_io.py
+import io
+import json
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from banners import catalog_io
+from banners.models import Banner, BannerServingRow, BannerTitle, Language, Tag
+
+User = get_user_model()
+
+
+def _record(i, prefix='t', owner=None):
+    return {
+        'title': f'Banner {i}', 'description': 'd', 'link_url': f'https://example.com/{i}', 'owner': owner,
+        'selection_policy': '', 'weight': i % 3, 'tags': [f'{prefix}-{i % 3}', f'{prefix}-shared'],
+        'images': [f'banner_images/{i}.png'],
+        'titles': [{'text': f'Заголовок {i}', 'language': 'ru'}, {'text': f'Title {i}', 'language': None}],
+    }
+
+
+class CatalogImportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pw')
+
+    def test_jsonl_round_trip(self):
+        records = [_record(i, owner='owner') for i in range(5)]
+        lines = catalog_io.jsonl_lines(records)
+        self.assertEqual(catalog_io.import_catalog(catalog_io.read_jsonl(lines), chunk_size=2), 5)
+
+        self.assertEqual(Banner.objects.filter(owner=self.user).count(), 5)
+        self.assertEqual(Tag.objects.get(name='t-shared').owner, self.user)
+        self.assertEqual(Language.objects.get(code='ru').banner_titles.count(), 5)
+        # bulk_create идёт мимо сигналов, строки выдачи пересчитаны импортом
+        self.assertEqual(BannerServingRow.objects.count(), 5)
+        self.assertEqual(list(catalog_io.export_records(chunk_size=2)), records)
+
+    def test_csv_round_trip(self):
+        records = [_record(i) for i in range(3)]
+        for record in records:
+            # В CSV заголовки без языка идут первой колонкой
+            record['titles'].reverse()
+        catalog_io.import_catalog(iter(records))
+        text = ''.join(catalog_io.export_lines('csv'))
+        self.assertIn('titles:ru', text.splitlines()[0])
+
+        Banner.objects.all().delete()
+        catalog_io.import_catalog(catalog_io.read_csv(io.StringIO(text)))
+        self.assertEqual(list(catalog_io.export_records()), records)
+
+    def test_queries_per_chunk_do_not_depend_on_its_size(self):
+        def queries(count, prefix):
+            records = [dict(_record(i), tags=[f'{prefix}-{i}']) for i in range(count)]
+            with CaptureQueriesContext(connection) as ctx:
+                catalog_io.import_catalog(records, owner=self.user, chunk_size=count // 2)
+            return len(ctx.captured_queries)
+
+        queries(2, 'warm')  # языки и версии кэшей
+        self.assertEqual(queries(4, 'small'), queries(40, 'large'))
+
+    def test_bad_line_stops_import_after_committed_chunks(self):
+        lines = [json.dumps(_record(i)) for i in range(2)] + ['{"title": "no link"}']
+        with self.assertRaisesMessage(catalog_io.CatalogFormatError, 'строка 3'):
+            catalog_io.import_catalog(catalog_io.read_jsonl(lines), chunk_size=2)
+        self.assertEqual(Banner.objects.count(), 2)
+
+    def test_unknown_owner_is_rejected(self):
+        with self.assertRaisesMessage(ValueError, 'nobody'):
+            catalog_io.import_catalog([_record(0, owner='nobody')])
+        self.assertFalse(Banner.objects.exists())
+
+    def test_owner_import_uses_only_own_tags(self):
+        Tag.objects.create(name='t-0', owner=self.user)
+        other = User.objects.create_user('other', password='pw')
+        Tag.objects.create(name='t-shared', owner=other)
+
+        with self.assertRaisesMessage(ValueError, 'теги других владельцев: t-shared'):
+            catalog_io.import_catalog([_record(0)], owner=self.user)
+        self.assertFalse(Banner.objects.exists())
+
+        catalog_io.import_catalog([dict(_record(0), tags=['t-0', 't-new'])], owner=self.user)
+        self.assertEqual(sorted(Banner.objects.get().tags.values_list('name', 'owner')),
+                         [('t-0', self.user.id), ('t-new', self.user.id)])
+
+    def test_image_paths_stay_in_image_dir(self):
+        for path in ('../settings.py', '/etc/passwd', 'banner_images/../../x.png', 'other/a.png'):
+            with self.subTest(path=path), self.assertRaisesMessage(catalog_io.CatalogFormatError, 'строка 1'):
+                list(catalog_io.read_jsonl([json.dumps(dict(_record(0), images=[path]))]))
+
+    def test_commands(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, 'catalog.jsonl')
+            with open(source, 'w', encoding='utf-8') as f:
+                f.writelines(catalog_io.jsonl_lines([_record(i) for i in range(3)]))
+            call_command('import_banner_catalog', source, owner='owner', stdout=io.StringIO())
+            self.assertEqual(Banner.objects.filter(owner=self.user).count(), 3)
+
+            out = io.StringIO()
+            call_command('export_banner_catalog', format='csv', owner='owner', stdout=out)
+            self.assertEqual(len(out.getvalue().splitlines()), 4)
+
+
+class CatalogAdminTest(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('st', password='pw', is_staff=True, is_superuser=True)
+
+    def test_import_and_export(self):
+        self.client.force_login(self.staff)
+        upload = SimpleUploadedFile('c.jsonl', ''.join(catalog_io.jsonl_lines([_record(i) for i in range(2)])).encode())
+        response = self.client.post(reverse('admin:banners_banner_import'), {'file': upload, 'format': 'jsonl'})
+        self.assertRedirects(response, reverse('admin:banners_banner_changelist'))
+        self.assertEqual(BannerTitle.objects.count(), 4)
+
+        response = self.client.post(reverse('admin:banners_banner_changelist'), {
+            'action': 'export_catalog_jsonl',
+            '_selected_action': list(Banner.objects.values_list('pk', flat=True)),
+        })
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['title'] for line in lines], ['Banner 0', 'Banner 1'])
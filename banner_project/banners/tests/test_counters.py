@@ -0,0 +1,94 @@
+# banners/tests/test_counters.py
+import os
+import tempfile
+
+from django.conf import settings
+from django.db import connections
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from banners import counters
+from banners.models import Banner, BannerTitle, BannerImage
+
+
+class CounterBufferTest(TestCase):
+    def setUp(self):
+        self.banner = Banner.objects.create(title='B', description='', link_url='#')
+        self.title = BannerTitle.objects.create(banner=self.banner, text='T')
+        self.image = BannerImage.objects.create(banner=self.banner, image='i.png')
+        self.buffer = counters.CounterBuffer()
+
+    def test_sync_mode_writes_immediately(self):
+        with override_settings(BANNER_COUNTERS={'MODE': 'sync'}):
+            self.buffer.add(Banner, self.banner.pk, 'views')
+        self.banner.refresh_from_db()
+        self.assertEqual(self.banner.views, 1)
+        self.assertEqual(len(self.buffer), 0)
+
+    @override_settings(BANNER_COUNTERS={'MODE': 'buffered', 'FLUSH_INTERVAL': 0, 'MAX_PENDING': 100})
+    def test_buffered_mode_merges_and_flushes(self):
+        for _ in range(3):
+            self.buffer.add(Banner, self.banner.pk, 'views')
+            self.buffer.add(BannerTitle, self.title.pk, 'views')
+            self.buffer.add(BannerImage, self.image.pk, 'views')
+        self.buffer.add(Banner, self.banner.pk, 'clicks')
+
+        # до сброса в базе ничего не поменялось
+        self.banner.refresh_from_db()
+        self.assertEqual(self.banner.views, 0)
+        self.assertEqual(len(self.buffer), 4)
+
+        # 4 UPDATE внутри одной транзакции (+ SAVEPOINT/RELEASE в TestCase)
+        with self.assertNumQueries(6):
+            self.assertEqual(self.buffer.flush(), 4)
+
+        self.banner.refresh_from_db()
+        self.title.refresh_from_db()
+        self.image.refresh_from_db()
+        self.assertEqual((self.banner.views, self.banner.clicks), (3, 1))
+        self.assertEqual(self.title.views, 3)
+        self.assertEqual(self.image.views, 3)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    @override_settings(BANNER_COUNTERS={'MODE': 'buffered', 'FLUSH_INTERVAL': 0, 'MAX_PENDING': 2})
+    def test_size_threshold_triggers_flush(self):
+        self.buffer.add(Banner, self.banner.pk, 'views')
+        self.buffer.add(BannerTitle, self.title.pk, 'views')
+        self.assertEqual(len(self.buffer), 0)
+        self.banner.refresh_from_db()
+        self.assertEqual(self.banner.views, 1)
+
+    @override_settings(BANNER_COUNTERS={'MODE': 'buffered', 'FLUSH_INTERVAL': 0, 'MAX_PENDING': 100})
+    def test_same_delta_rows_share_one_update(self):
+        other = Banner.objects.create(title='B2', description='', link_url='#')
+        self.buffer.add(Banner, self.banner.pk, 'views')
+        self.buffer.add(Banner, other.pk, 'views')
+        with self.assertNumQueries(3):
+            self.buffer.flush()
+        self.assertEqual(
+            sorted(Banner.objects.values_list('views', flat=True)), [1, 1]
+        )
+
+    def test_record_impression_skips_missing_creatives(self):
+        counters.record_impression(self.banner.id, None, self.image.id)
+        self.banner.refresh_from_db()
+        self.image.refresh_from_db()
+        self.title.refresh_from_db()
+        self.assertEqual((self.banner.views, self.image.views, self.title.views), (1, 1, 0))
+
+
+class SqliteServingOptionsTest(SimpleTestCase):
+    def test_pragmas_are_applied_on_connect(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            params = {**connections['default'].settings_dict, 'NAME': os.path.join(tmp, 'serving.sqlite3'),
+                      'OPTIONS': settings.SQLITE_SERVING_OPTIONS}
+            wrapper = connections['default'].__class__(params, alias='serving')
+            try:
+                with wrapper.cursor() as cursor:
+                    values = {}
+                    for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'temp_store'):
+                        cursor.execute(f'PRAGMA {pragma}')
+                        values[pragma] = cursor.fetchone()[0]
+            finally:
+                wrapper.close()
+        # synchronous=NORMAL — 1, temp_store=MEMORY — 2
+        self.assertEqual(values, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000, 'temp_store': 2})
@@ -0,0 +1,57 @@
+# banners/tests/test_feed.py
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from banners.feed import Permutation, decode_cursor, feed_page, get_feed_index
+from banners.models import Banner, BannerImage, BannerTitle
+
+
+class PermutationTest(SimpleTestCase):
+    def test_is_a_permutation(self):
+        for n in (1, 2, 7, 12, 100):
+            perm = Permutation(n, seed=n * 31)
+            self.assertEqual(sorted(perm[i] for i in range(n)), list(range(n)))
+
+    def test_bad_cursor(self):
+        self.assertIsNone(decode_cursor('garbage'))
+        self.assertIsNone(decode_cursor(None))
+
+
+@override_settings(BANNER_FEED={'PAGE_SIZE': 4, 'REBUILD_INTERVAL': 300})
+class FeedTest(TestCase):
+    def setUp(self):
+        for b in range(3):
+            banner = Banner.objects.create(title=f'B{b}', description='', link_url='#')
+            for i in range(2):
+                BannerImage.objects.create(banner=banner, image=f'{b}_{i}.png')
+            for t in range(2):
+                BannerTitle.objects.create(banner=banner, text=f'T{b}_{t}')
+        # баннер без заголовков в ленту не попадает
+        lonely = Banner.objects.create(title='L', description='', link_url='#')
+        BannerImage.objects.create(banner=lonely, image='l.png')
+
+    def test_index_counts_combinations(self):
+        self.assertEqual(len(get_feed_index()), 3 * 2 * 2)
+
+    def test_pages_cover_every_combination_once(self):
+        seen = []
+        items, cursor = feed_page()
+        seen += items
+        for _ in range(2):
+            with self.assertNumQueries(0):
+                items, cursor = feed_page(cursor)
+            seen += items
+        links = [item['ad_link'] for item in seen]
+        self.assertEqual(len(links), 12)
+        self.assertEqual(len(set(links)), 12)
+
+    def test_feed_endpoint(self):
+        resp = self.client.get(reverse('home_page'))
+        cursor = resp.context['next_cursor']
+        self.assertEqual(len(resp.context['banner_items']), 4)
+
+        resp = self.client.get(reverse('homepage_feed'), {'cursor': cursor})
+        data = resp.json()
+        self.assertEqual(len(data['items']), 4)
+        self.assertTrue(data['next_cursor'])
+        self.assertEqual(set(data['items'][0]), {'image_url', 'title', 'ad_link'})
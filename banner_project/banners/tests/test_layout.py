@@ -0,0 +1,54 @@
+# banners/tests/test_layout.py
+from django.test import SimpleTestCase, TestCase
+
+from banners.layout import compile_layout, render_layout, slot_count
+from banners.models import WrittenArticle
+
+
+class CompileLayoutTest(SimpleTestCase):
+    def test_segments_and_render(self):
+        segments, problems = compile_layout('<p>a[BANNER_SLOT_1]b[BANNER_SLOT_2]</p>')
+        self.assertEqual(segments, ['<p>a', 1, 'b', 2, '</p>'])
+        self.assertEqual(problems, [])
+        self.assertEqual(slot_count(segments), 2)
+        self.assertEqual(render_layout(segments, {1: 'X', 2: 'Y'}), '<p>aXbY</p>')
+
+    def test_unfilled_slot_keeps_marker(self):
+        segments, _ = compile_layout('a[BANNER_SLOT_1]b[BANNER_SLOT_2]c')
+        self.assertEqual(render_layout(segments, {1: 'X'}), 'aXb[BANNER_SLOT_2]c')
+
+    def test_out_of_order_slots_still_fill_by_number(self):
+        segments, problems = compile_layout('[BANNER_SLOT_2]-[BANNER_SLOT_1]')
+        self.assertEqual(render_layout(segments, {1: 'one', 2: 'two'}), 'two-one')
+        self.assertEqual(len(problems), 1)
+        self.assertIn('не по порядку', problems[0])
+
+    def test_gap_and_duplicates_are_reported_and_left_as_text(self):
+        content = '[BANNER_SLOT_1][BANNER_SLOT_1][BANNER_SLOT_3]'
+        segments, problems = compile_layout(content)
+        self.assertEqual(segments, [1, '[BANNER_SLOT_1][BANNER_SLOT_3]'])
+        self.assertEqual(len(problems), 2)
+
+    def test_no_slots(self):
+        self.assertEqual(compile_layout('<p>x</p>'), (['<p>x</p>'], []))
+        self.assertEqual(compile_layout(''), ([], []))
+
+
+class WrittenArticleLayoutTest(TestCase):
+    def test_layout_compiled_on_save(self):
+        article = WrittenArticle.objects.create(
+            title='W', description='', slug='w', content='x[BANNER_SLOT_2]'
+        )
+        self.assertEqual(article.content_layout, ['x[BANNER_SLOT_2]'])
+        self.assertEqual(len(article.layout_problems), 1)
+
+        article.content = 'y[BANNER_SLOT_1]'
+        article.save(update_fields=['content'])
+        article.refresh_from_db()
+        self.assertEqual(article.content_layout, ['y', 1])
+
+    def test_layout_rebuilt_for_rows_updated_in_bulk(self):
+        article = WrittenArticle.objects.create(title='W', description='', slug='w', content='')
+        WrittenArticle.objects.filter(pk=article.pk).update(content='[BANNER_SLOT_1]z')
+        article.refresh_from_db()
+        self.assertEqual(article.get_layout(), [1, 'z'])
@@ -0,0 +1,102 @@
+# banners/tests/test_metrics.py
+import json
+import os
+import tempfile
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from banners import metrics
+from banners.models import Article, Banner, BannerImage, BannerTitle, Tag
+
+# pid, которого точно нет: больше максимального pid в Linux
+DEAD_PID = 2 ** 22 + 1
+
+
+class RegistryTest(SimpleTestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_render_counter_and_histogram(self):
+        requests = self.registry.counter('req_total', 'Запросы', ('view',))
+        latency = self.registry.histogram('lat_seconds', 'Время', ('view',), buckets=(0.1, 1.0))
+        requests.inc(view='a')
+        requests.inc(2, view='a')
+        latency.observe(0.05, view='a')
+        latency.observe(0.5, view='a')
+        latency.observe(3, view='a')
+
+        text = metrics.render(metrics.merge([self.registry.snapshot()]))
+        self.assertIn('# TYPE req_total counter\nreq_total{view="a"} 3\n', text)
+        self.assertIn('lat_seconds_bucket{view="a",le="0.1"} 1\n', text)
+        self.assertIn('lat_seconds_bucket{view="a",le="1.0"} 2\n', text)
+        self.assertIn('lat_seconds_bucket{view="a",le="+Inf"} 3\n', text)
+        self.assertIn('lat_seconds_sum{view="a"} 3.55\n', text)
+        self.assertIn('lat_seconds_count{view="a"} 3\n', text)
+
+    def test_merge_sums_counters_and_drops_gauges_of_dead_workers(self):
+        self.registry.counter('c_total', 'c').inc(5)
+        self.registry.collector('backlog', 'b', lambda: 7)
+        self.registry.collector('lag', 'l', lambda: 2.0, aggregate='max')
+        alive = self.registry.snapshot()
+        dead = dict(self.registry.snapshot(), pid=DEAD_PID)
+        other = self.registry.snapshot()
+        other['metrics']['lag']['samples'] = [[[], 9.0]]
+
+        merged = metrics.merge([alive, dead, other])
+        self.assertEqual(merged['c_total']['samples'][()], 15)
+        self.assertEqual(merged['backlog']['samples'][()], 14)
+        self.assertEqual(merged['lag']['samples'][()], 9.0)
+
+
+class MetricsEndpointTest(TestCase):
+    def setUp(self):
+        tag = Tag.objects.create(name='t')
+        banner = Banner.objects.create(title='B', description='', link_url='/ok/')
+        banner.tags.add(tag)
+        BannerTitle.objects.create(banner=banner, text='T')
+        BannerImage.objects.create(banner=banner, image='i.png')
+        article = Article.objects.create(title='A', description='', content_url='http://x', slug='a')
+        article.tags.add(tag)
+        self.url = reverse('banner_metrics')
+
+    def test_exposes_view_and_pipeline_metrics(self):
+        self.client.get(reverse('article_with_banners', args=['a']))
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = resp.content.decode()
+        self.assertIn('banner_http_requests_total{view="article_with_banners",status="200"}', text)
+        self.assertIn('banner_http_request_duration_seconds_bucket{view="article_with_banners",le="+Inf"}', text)
+        self.assertIn('banner_events_total{kind="views"}', text)
+        self.assertIn('banner_creative_selection_seconds_count', text)
+        self.assertIn('banner_render_cache_misses_total', text)
+        self.assertIn('banner_event_backlog{stream="impressions"} 0', text)
+        # сам эндпоинт в метрики страниц не попадает
+        self.assertNotIn('view="banner_metrics"', text)
+
+    def test_hidden_from_outside(self):
+        self.assertEqual(self.client.get(self.url, REMOTE_ADDR='10.1.2.3').status_code, 404)
+        with override_settings(BANNER_METRICS=dict(metrics.get_config(), TOKEN='s3cret')):
+            self.assertEqual(self.client.get(self.url).status_code, 404)
+            resp = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer s3cret')
+            self.assertEqual(resp.status_code, 200)
+
+    def test_file_mode_aggregates_worker_snapshots(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # снимок уже завершившегося воркера: его счётчик должен остаться в сумме
+            snapshot = {'pid': DEAD_PID, 'metrics': {'banner_events_total': {
+                'type': 'counter', 'help': 'x', 'labels': ['kind'], 'buckets': [],
+                'samples': [[['clicks'], 1000]],
+            }}}
+            with open(os.path.join(directory, f'metrics-{DEAD_PID}.json'), 'w') as f:
+                json.dump(snapshot, f)
+
+            conf = dict(metrics.get_config(), MODE='file', DIRECTORY=directory)
+            with override_settings(BANNER_METRICS=conf):
+                text = self.client.get(self.url).content.decode()
+                self.assertIn(f'metrics-{os.getpid()}.json', os.listdir(directory))
+
+        clicks = [line for line in text.splitlines() if line.startswith('banner_events_total{kind="clicks"}')]
+        self.assertEqual(len(clicks), 1)
+        self.assertGreaterEqual(int(clicks[0].split()[-1]), 1000)
@@ -7,6 +7,8 @@ from banners.models import (
     Banner, BannerTitle, BannerImage,
     WrittenArticle
 )
+from banners import stats
+from banners.creatives import resolve_creatives
 
 User = get_user_model()
 
@@ -112,3 +114,42 @@ class WrittenArticleModelTest(TestCase):
         )
         self.assertIsNone(wa2.owner)
         self.assertIsNone(wa2.language)
+
+
+class ResolveCreativesTest(TestCase):
+    def setUp(self):
+        self.lang_en = Language.objects.create(code='en', name='English')
+        self.lang_ru = Language.objects.create(code='ru', name='Russian')
+        self.banners = []
+        for i in range(5):
+            banner = Banner.objects.create(title=f'B{i}', description='', link_url='#')
+            BannerTitle.objects.create(banner=banner, text=f'en{i}', language=self.lang_en)
+            BannerTitle.objects.create(banner=banner, text=f'any{i}', language=None, clicks=20, views=20)
+            BannerImage.objects.create(banner=banner, image=f'{i}.png', clicks=1, views=2)
+            BannerImage.objects.create(banner=banner, image=f'{i}_b.png')
+            self.banners.append(banner)
+        stats.backfill()
+
+    def test_constant_queries_and_legacy_policy(self):
+        banners = list(Banner.objects.order_by('id'))
+        # заголовки, картинки и их статистика
+        with self.assertNumQueries(3):
+            pairs = resolve_creatives(banners)
+        self.assertEqual(len(pairs), 5)
+        for banner, (image, title) in zip(banners, pairs):
+            # как у get_best_or_random_*: лучший ctr
+            self.assertEqual(title.text, f'any{banner.title[1:]}')
+            self.assertEqual(image.clicks, 1)
+            self.assertEqual(title.banner_id, banner.id)
+
+    def test_language_with_fallback(self):
+        banners = list(Banner.objects.order_by('id'))
+        self.assertTrue(all(t.text.startswith('en') for _, t in resolve_creatives(banners, self.lang_en)))
+        # на русском заголовков нет — берём лучший из всех
+        self.assertTrue(all(t.text.startswith('any') for _, t in resolve_creatives(banners, self.lang_ru)))
+        # язык None, как и в get_title_for_language, означает заголовки без языка
+        self.assertTrue(all(t.text.startswith('any') for _, t in resolve_creatives(banners, None)))
+
+    def test_banner_without_creatives(self):
+        empty = Banner.objects.create(title='E', description='', link_url='#')
+        self.assertEqual(resolve_creatives([empty]), [(None, None)])
@@ -0,0 +1,73 @@
+# banners/tests/test_profiling.py
+import json
+
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from banners import async_views, profiling
+from banners.models import Article, Banner, BannerImage, BannerTitle, Tag
+
+PROFILING = {'ENABLED': True, 'SAMPLE_RATE': 0, 'SERVER_TIMING': True, 'PHASE_NAMES': {}}
+
+
+class PhaseTest(SimpleTestCase):
+    def test_phase_without_profile_is_noop(self):
+        with profiling.phase('anything'):
+            pass
+        self.assertIs(profiling.phase('a'), profiling.phase('b'))
+
+    def test_phases_accumulate_and_rename(self):
+        profile = profiling.RequestProfile()
+        for _ in range(2):
+            with profile.phase('creatives'):
+                pass
+        with profile.phase('render'):
+            pass
+        self.assertEqual(list(profile.report({})), ['creatives', 'render'])
+        self.assertEqual(list(profile.report({'creatives': 'bandit', 'render': ''})), ['bandit'])
+        header = profile.server_timing({'a b': 0.0015}, 0.01)
+        self.assertEqual(header, 'a_b;dur=1.50, sql;dur=0.00;desc="0 queries", total;dur=10.00')
+
+
+class ProfilingMiddlewareTest(TestCase):
+    def setUp(self):
+        tag = Tag.objects.create(name='t')
+        banner = Banner.objects.create(title='B', description='', link_url='/ok/')
+        banner.tags.add(tag)
+        BannerTitle.objects.create(banner=banner, text='T')
+        BannerImage.objects.create(banner=banner, image='i.png')
+        article = Article.objects.create(title='A', description='', content_url='http://x', slug='a')
+        article.tags.add(tag)
+        self.url = reverse('article_with_banners', args=['a'])
+
+    def test_disabled_by_default(self):
+        resp = self.client.get(self.url)
+        self.assertNotIn('Server-Timing', resp)
+
+    @override_settings(BANNER_PROFILING=PROFILING)
+    def test_server_timing_lists_phases_and_sql(self):
+        resp = self.client.get(self.url)
+        header = resp['Server-Timing']
+        names = [part.split(';')[0] for part in header.split(', ')]
+        self.assertEqual(names, ['shell', 'candidates', 'creatives', 'counters', 'render', 'sql', 'total'])
+        self.assertRegex(header, r'sql;dur=[\d.]+;desc="[1-9]\d* queries"')
+
+    @override_settings(BANNER_PROFILING=dict(PROFILING, SAMPLE_RATE=1, PHASE_NAMES={'render': 'template'}))
+    def test_sampled_log_record(self):
+        with self.assertLogs('banners.profiling', 'INFO') as logs:
+            self.client.get(self.url)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'article_with_banners')
+        self.assertEqual(record['status'], 200)
+        self.assertIn('template', record['phases_ms'])
+        self.assertGreater(record['phase_sql']['shell'], 0)
+
+    @override_settings(BANNER_PROFILING=PROFILING)
+    async def test_async_views_count_sql_from_orm_thread(self):
+        async def view(request):
+            return await async_views.article_with_banners(request, 'a')
+
+        # ORM асинхронной вьюхи работает не в потоке event loop
+        resp = await profiling.ProfilingMiddleware(view)(AsyncRequestFactory().get(self.url))
+        self.assertRegex(resp['Server-Timing'], r'sql;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertRegex(resp['Server-Timing'], r'shell;dur=')
@@ -0,0 +1,124 @@
+# banners/tests/test_query_budgets.py
+from asgiref.sync import sync_to_async
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import resolve, reverse
+
+from banners import async_views, counters, urls
+from banners.click_tokens import click_url
+from banners.models import Banner, Vertical
+from banners.query_budget import QueryBudget, QueryBudgetExceeded, assert_query_budget, get_budget
+from banners.synthetic import generate_catalog
+
+# Размеры каталога: бюджет не должен зависеть от числа баннеров
+CATALOG_SIZES = (20, 120)
+
+
+def budgeted_url_names():
+    return {pattern.name: get_budget(pattern.callback) for pattern in urls.urlpatterns
+            if get_budget(pattern.callback) is not None}
+
+
+def async_view(callback):
+    # urls.py подключает модуль вьюх при импорте — асинхронную берём по имени
+    return getattr(async_views, callback.__name__)
+
+
+BUDGET_SETTINGS = dict(
+    BANNER_COUNTERS={'MODE': 'buffered', 'FLUSH_INTERVAL': 0, 'MAX_PENDING': 10 ** 9, 'STORE': 'counters'},
+    BANNER_TIMERS={'MODE': 'cookie'},
+)
+
+
+@override_settings(**BUDGET_SETTINGS)
+class ViewQueryBudgetTest(TestCase):
+    def tearDown(self):
+        counters.get_buffer().drain()
+
+    def urls_for(self, prefix):
+        banner = Banner.objects.filter(title__startswith=f'{prefix} banner ').first()
+        title, image = banner.titles.first(), banner.images.first()
+        vertical = Vertical.objects.get(name=f'{prefix}-vertical-0')
+        return {
+            'home_page': reverse('home_page'),
+            'homepage_feed': reverse('homepage_feed'),
+            'article_with_banners': reverse('article_with_banners', args=[f'{prefix}-article-0']),
+            'written_article_with_banners': reverse('written_article_with_banners', args=[f'{prefix}-written-0']),
+            'banner_redirect_token': click_url(banner, title, image),
+            'banner_redirect': reverse('banner_redirect') + (
+                f'?banner_id={banner.id}&banner_title_id={title.id}&banner_image_id={image.id}'
+            ),
+            'get_tags_by_verticals': reverse('get_tags_by_verticals') + f'?verticals={vertical.id}',
+        }
+
+    def test_views_stay_within_budget_as_catalog_grows(self):
+        budgets = budgeted_url_names()
+        for size in CATALOG_SIZES:
+            prefix = f'size{size}'
+            generate_catalog(prefix=prefix, seed=size, banners=size, tags=size // 2, owners=2,
+                             articles=2, written_articles=2, slots=3)
+            page_urls = self.urls_for(prefix)
+            self.assertEqual(set(budgets) - set(page_urls), set(), 'нет URL для проверки бюджета')
+
+            for name, budget in budgets.items():
+                # первый запрос — холодный кэш воркера, второй — тёплый
+                for attempt in ('cold', 'warm'):
+                    with self.subTest(size=size, view=name, attempt=attempt):
+                        with assert_query_budget(budget, f'{name} [{size} баннеров, {attempt}]'):
+                            response = self.client.get(page_urls[name])
+                        self.assertLess(response.status_code, 400)
+
+
+@override_settings(**BUDGET_SETTINGS)
+class AsyncViewQueryBudgetTest(TestCase):
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+
+    def tearDown(self):
+        counters.get_buffer().drain()
+
+    urls_for = ViewQueryBudgetTest.urls_for
+
+    def test_async_views_declare_sync_budgets(self):
+        for pattern in urls.urlpatterns:
+            if get_budget(pattern.callback) is not None:
+                self.assertEqual(get_budget(async_view(pattern.callback)), get_budget(pattern.callback),
+                                 pattern.name)
+
+    async def test_views_stay_within_budget_as_catalog_grows(self):
+        budgets = budgeted_url_names()
+        for size in CATALOG_SIZES:
+            prefix = f'async{size}'
+            await sync_to_async(generate_catalog)(prefix=prefix, seed=size, banners=size, tags=size // 2,
+                                                  owners=2, articles=2, written_articles=2, slots=3)
+            page_urls = await sync_to_async(self.urls_for)(prefix)
+
+            for name, budget in budgets.items():
+                match = resolve(page_urls[name].split('?')[0])
+                view = async_view(match.func)
+                for attempt in ('cold', 'warm'):
+                    with self.subTest(size=size, view=name, attempt=attempt):
+                        with assert_query_budget(budget, f'async {name} [{size} баннеров, {attempt}]'):
+                            response = await view(self.factory.get(page_urls[name]), *match.args, **match.kwargs)
+                        self.assertLess(response.status_code, 400)
+
+
+class BudgetReportTest(TestCase):
+    def test_report_groups_queries_by_call_site(self):
+        for i in range(3):
+            Banner.objects.create(title=f'B{i}', description='', link_url='#')
+
+        with self.assertRaises(QueryBudgetExceeded) as ctx:
+            with assert_query_budget(QueryBudget(queries=1, writes=0), 'N+1'):
+                for banner in Banner.objects.all():
+                    list(banner.tags.all())
+
+        message = str(ctx.exception)
+        self.assertIn('запросов 4 при бюджете 1', message)
+        self.assertIn('test_query_budgets.py', message)
+        self.assertIn(' — 3', message)
+
+
+class BudgetDeclarationTest(SimpleTestCase):
+    def test_hot_views_declare_budgets(self):
+        self.assertIn('article_with_banners', budgeted_url_names())
+        self.assertEqual(budgeted_url_names()['banner_redirect_token'], QueryBudget(0, 0))
@@ -0,0 +1,93 @@
+# banners/tests/test_render_cache.py
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from banners.models import Banner, BannerImage, BannerTitle, Tag, WrittenArticle
+from banners.render_cache import LRUCache, get_render_cache
+
+User = get_user_model()
+
+
+class LRUCacheTest(SimpleTestCase):
+    def test_evicts_least_recently_used_by_size(self):
+        cache = LRUCache(max_bytes=300)
+        cache.set('a', 1, 'x' * 100)
+        cache.set('b', 1, 'y' * 100)
+        self.assertIsNotNone(cache.get('a', 1))
+        cache.set('c', 1, 'z' * 100)
+        # 'b' читали давнее всех — его и вытеснили
+        self.assertIsNone(cache.get('b', 1))
+        self.assertIsNotNone(cache.get('a', 1))
+        self.assertLessEqual(cache.size, 300)
+
+    def test_version_mismatch_is_a_miss(self):
+        cache = LRUCache(max_bytes=1000)
+        cache.set('a', 1, 'x')
+        self.assertIsNone(cache.get('a', 2))
+
+    def test_oversized_value_not_stored(self):
+        cache = LRUCache(max_bytes=10)
+        cache.set('a', 1, 'x' * 100)
+        self.assertEqual(len(cache), 0)
+
+
+class WrittenArticleRenderCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('u', password='pw')
+        self.tag = Tag.objects.create(name='t', owner=self.user)
+        self.banner = Banner.objects.create(title='B', description='', link_url='/b/', owner=self.user)
+        self.banner.tags.add(self.tag)
+        BannerTitle.objects.create(banner=self.banner, text='Title')
+        BannerImage.objects.create(banner=self.banner, image='b.png')
+        self.article = WrittenArticle.objects.create(
+            title='W', description='', slug='w', content='<p>[BANNER_SLOT_1]</p>', owner=self.user
+        )
+        self.article.tags.add(self.tag)
+        self.url = reverse('written_article_with_banners', args=['w'])
+
+    def _queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 200)
+        return [q['sql'] for q in ctx.captured_queries]
+
+    def test_second_request_skips_article_queries(self):
+        self._queries()
+        hits = get_render_cache().hits
+        queries = self._queries()
+        self.assertEqual(get_render_cache().hits, hits + 1)
+        self.assertFalse(any('banners_writtenarticle' in sql for sql in queries))
+
+    def test_invalidated_when_article_changes(self):
+        self.client.get(self.url)
+        self.article.title = 'Renamed'
+        self.article.save()
+        resp = self.client.get(self.url)
+        self.assertContains(resp, 'Renamed')
+
+    def test_invalidated_when_banner_tags_change(self):
+        other = Banner.objects.create(title='Other', description='', link_url='/o/', owner=self.user)
+        BannerTitle.objects.create(banner=other, text='OtherTitle')
+        self.article.random_tag_probability = 0
+        self.article.save()
+        resp = self.client.get(self.url)
+        self.assertNotContains(resp, 'OtherTitle')
+
+        other.tags.add(self.tag)
+        resp = self.client.get(self.url)
+        self.assertContains(resp, 'OtherTitle')
+
+    def test_invalidated_when_banner_images_change(self):
+        other = Banner.objects.create(title='Other', description='', link_url='/o/', owner=self.user)
+        other.tags.add(self.tag)
+        self.article.random_tag_probability = 0
+        self.article.save()
+        self.assertNotContains(self.client.get(self.url), 'other.png')
+
+        image = BannerImage.objects.create(banner=other, image='other.png')
+        self.assertContains(self.client.get(self.url), 'other.png')
+        image.delete()
+        self.assertNotContains(self.client.get(self.url), 'other.png')
@@ -0,0 +1,115 @@
+# banners/tests/test_renditions.py
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from banners import renditions, resize
+from banners.models import Banner, BannerImage, BannerTitle, Tag, WrittenArticle
+
+SYNC = {'WORKERS': 0, 'WIDTHS': (320, 640, 1280), 'FORMATS': ('webp', 'jpeg')}
+
+
+def _png(width=1000, height=500):
+    output = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 50, 50)).save(output, format='PNG')
+    return output.getvalue()
+
+
+class ResizeTest(TestCase):
+    def test_widths_never_upscale(self):
+        self.assertEqual(resize.target_widths(1000, (320, 640, 1280)), [320, 640, 1000])
+        self.assertEqual(resize.target_widths(3000, (320, 640, 1280)), [320, 640, 1280])
+        self.assertEqual(resize.target_widths(200, (320, 640)), [200])
+
+    def test_render(self):
+        results = resize.render(_png(), (320, 640, 1280), ('webp', 'jpeg'), {})
+        self.assertEqual([(fmt, w, h) for fmt, w, h, _ in results],
+                         [('webp', 320, 160), ('jpeg', 320, 160), ('webp', 640, 320), ('jpeg', 640, 320),
+                          ('webp', 1000, 500), ('jpeg', 1000, 500)])
+        with Image.open(io.BytesIO(results[0][3])) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (320, 160)))
+
+
+class RenditionsTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        media = override_settings(MEDIA_ROOT=self.media, BANNER_RENDITIONS=SYNC)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.banner = Banner.objects.create(title='B', description='', link_url='#')
+
+    def _image(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return BannerImage.objects.create(banner=self.banner,
+                                              image=SimpleUploadedFile('big.png', _png(), 'image/png'))
+
+    def test_upload_builds_renditions_after_commit(self):
+        image = self._image()
+        image.refresh_from_db()
+
+        self.assertEqual([mime for mime, _ in image.sources()], ['image/webp', 'image/jpeg'])
+        self.assertEqual(len(image.renditions['files']), 6)
+        self.assertTrue(all(default_storage.exists(name) for name in image.renditions['files']))
+        webp = dict(image.sources())['image/webp']
+        self.assertRegex(webp, r'^/media/banner_renditions/\d+/big-320w\.webp 320w, .* 640w, .* 1000w$')
+
+        html = renditions.picture_html(image, 'B & co', '150px')
+        self.assertIn('<source type="image/webp" srcset="', html)
+        self.assertIn(f'<img src="{image.image.url}" alt="B &amp; co">', html)
+
+    def test_replaced_file_falls_back_to_original(self):
+        image = self._image()
+        image.refresh_from_db()
+        old_files = image.renditions['files']
+
+        image.image = SimpleUploadedFile('other.png', _png(400, 400), 'image/png')
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            image.save()
+        # Пока копии строятся, выдаётся оригинал
+        self.assertEqual(image.sources(), [])
+        self.assertEqual(renditions.picture_html(image, 'B'), f'<img src="{image.image.url}" alt="B">')
+
+        for callback in callbacks:
+            callback()
+        image.refresh_from_db()
+        self.assertIn('/other-320w.webp', dict(image.sources())['image/webp'])
+        self.assertFalse(any(default_storage.exists(name) for name in old_files))
+
+    def test_page_view_never_builds_renditions(self):
+        image = BannerImage.objects.create(banner=self.banner, image='banner_images/missing.png')
+        BannerTitle.objects.create(banner=self.banner, text='T')
+        self.banner.tags.add(Tag.objects.create(name='t'))
+        article = WrittenArticle.objects.create(title='W', description='', slug='w', content='<p>x</p>')
+        article.tags.add(*Tag.objects.all())
+
+        response = self.client.get(reverse('written_article_with_banners', args=['w']))
+        self.assertContains(response, f'<img src="{image.image.url}"')
+        self.assertFalse(os.path.exists(os.path.join(self.media, 'banner_renditions')))
+
+    def test_generate_many_with_process_pool(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            image = BannerImage.objects.create(banner=self.banner,
+                                               image=SimpleUploadedFile('a.png', _png(), 'image/png'))
+        self.assertEqual(list(renditions.missing()), [image.id])
+
+        self.assertEqual(renditions.generate_many(renditions.missing(), workers=1), 1)
+        self.assertEqual(list(renditions.missing()), [])
+
+    def test_generate_many_bumps_creatives_once(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            for name in ('a.png', 'b.png', 'c.png'):
+                BannerImage.objects.create(banner=self.banner, image=SimpleUploadedFile(name, _png(), 'image/png'))
+
+        with mock.patch.object(renditions.invalidation, 'bump_version') as bump:
+            self.assertEqual(renditions.generate_many(renditions.missing()), 3)
+            self.assertEqual(renditions.generate_many(renditions.missing()), 0)
+        bump.assert_called_once_with(renditions.CREATIVES_VERSION)
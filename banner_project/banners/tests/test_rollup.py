@@ -0,0 +1,98 @@
+# banners/tests/test_rollup.py
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils.timezone import now
+
+from banners import counters
+from banners.models import (
+    Banner, BannerTitle, BannerImage,
+    ImpressionEvent, ClickEvent, BannerStats, CreativeStats
+)
+from banners.rollup import rollup_events
+
+
+@override_settings(BANNER_COUNTERS={'MODE': 'sync', 'STORE': 'events', 'SETTLE_SECONDS': 0})
+class EventRollupTest(TestCase):
+    def setUp(self):
+        self.banner = Banner.objects.create(title='B', description='', link_url='#')
+        self.title = BannerTitle.objects.create(banner=self.banner, text='T')
+        self.image = BannerImage.objects.create(banner=self.banner, image='i.png')
+
+    def test_events_store_does_not_touch_counters(self):
+        counters.record_impression(self.banner.id, self.title.id, self.image.id)
+        counters.record_click(self.banner.id, self.title.id, None)
+        self.banner.refresh_from_db()
+        self.assertEqual((self.banner.views, self.banner.clicks), (0, 0))
+        self.assertEqual(ImpressionEvent.objects.count(), 1)
+        self.assertEqual(ClickEvent.objects.count(), 1)
+
+    def test_rollup_updates_counters_and_daily_stats_once(self):
+        for _ in range(3):
+            counters.record_impression(self.banner.id, self.title.id, self.image.id)
+        counters.record_click(self.banner.id, self.title.id, self.image.id)
+
+        self.assertEqual(rollup_events(batch_size=2), {'impressions': 3, 'clicks': 1})
+        # повторный прогон ничего не добавляет
+        self.assertEqual(rollup_events(), {'impressions': 0, 'clicks': 0})
+
+        self.banner.refresh_from_db()
+        self.title.refresh_from_db()
+        self.image.refresh_from_db()
+        self.assertEqual((self.banner.views, self.banner.clicks), (3, 1))
+        self.assertEqual((self.title.views, self.title.clicks), (3, 1))
+        self.assertEqual((self.image.views, self.image.clicks), (3, 1))
+
+        for period in ('hour', 'day'):
+            stats = BannerStats.objects.get(period=period)
+            self.assertEqual((stats.views, stats.clicks), (3, 1))
+            self.assertEqual(
+                sorted(CreativeStats.objects.filter(period=period).values_list('kind', 'creative_id', 'views', 'clicks')),
+                [('image', self.image.id, 3, 1), ('title', self.title.id, 3, 1)],
+            )
+
+    def test_rollup_skips_deleted_banners(self):
+        other = Banner.objects.create(title='gone', description='', link_url='#')
+        counters.record_impression(other.id)
+        other.delete()
+        counters.record_impression(self.banner.id)
+
+        call_command('rollup_banner_events', stdout=StringIO())
+
+        self.banner.refresh_from_db()
+        self.assertEqual(self.banner.views, 1)
+        self.assertEqual(list(BannerStats.objects.values_list('banner_id', flat=True).distinct()), [self.banner.id])
+
+    @override_settings(BANNER_COUNTERS={'MODE': 'sync', 'STORE': 'events', 'SETTLE_SECONDS': 60})
+    def test_rollup_stops_at_first_unsettled_event(self):
+        old = now() - timedelta(minutes=5)
+        ImpressionEvent.objects.create(banner=self.banner, created_at=old)
+        fresh = ImpressionEvent.objects.create(banner=self.banner)
+        ImpressionEvent.objects.create(banner=self.banner, created_at=old)
+
+        # Курсор не перескакивает свежее событие, даже если за ним есть старые
+        self.assertEqual(rollup_events(), {'impressions': 1, 'clicks': 0})
+        ImpressionEvent.objects.filter(id=fresh.id).update(created_at=old)
+        self.assertEqual(rollup_events(), {'impressions': 2, 'clicks': 0})
+        self.banner.refresh_from_db()
+        self.assertEqual(self.banner.views, 3)
+
+    @override_settings(BANNER_COUNTERS={'MODE': 'buffered', 'FLUSH_INTERVAL': 0, 'MAX_PENDING': 1000,
+                                        'STORE': 'events', 'SETTLE_SECONDS': 60})
+    def test_requeued_events_settle_from_insert_time(self):
+        self.addCleanup(counters.get_buffer().drain)
+        with mock.patch('banners.counters.now', return_value=now() - timedelta(minutes=5)):
+            counters.record_impression(self.banner.id)
+        with mock.patch('banners.counters.apply_events', side_effect=DatabaseError), \
+                self.assertLogs('banners.counters', 'ERROR'):
+            counters.flush()
+        counters.flush()
+
+        # Просмотр был пять минут назад, но строка только что вставлена — ждём коммитов соседей
+        self.assertEqual(rollup_events(), {'impressions': 0, 'clicks': 0})
+        ImpressionEvent.objects.update(created_at=now() - timedelta(minutes=2))
+        self.assertEqual(rollup_events(), {'impressions': 1, 'clicks': 0})
@@ -0,0 +1,88 @@
+# banners/tests/test_sampling.py
+import random
+from collections import Counter
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from banners import sampling
+
+
+def _legacy_written_count(matched, pool_size, p, rng):
+    # Прежний цикл _mix_written_banners: сколько случайных он добирал
+    matched, taken = matched, 0
+    while matched or taken < pool_size:
+        if rng.random() < p and taken < pool_size:
+            taken += 1
+        elif matched:
+            matched -= 1
+        else:
+            break
+    return taken
+
+
+class DrawCountTest(SimpleTestCase):
+    def test_binomial_mean_and_bounds(self):
+        rng = np.random.default_rng(1)
+        self.assertEqual(sampling.binomial(50, 0.0, rng), 0)
+        self.assertEqual(sampling.binomial(50, 1.0, rng), 50)
+        draws = [sampling.binomial(200, 0.3, rng) for _ in range(2000)]
+        self.assertAlmostEqual(sum(draws) / len(draws), 60, delta=1.5)
+        self.assertTrue(all(0 <= value <= 200 for value in draws))
+
+    def test_negative_binomial_matches_legacy_loop(self):
+        rng, legacy_rng = np.random.default_rng(3), random.Random(3)
+        for matched, pool_size, p in ((3, 20, 0.3), (0, 5, 0.5), (4, 2, 0.9)):
+            legacy = [_legacy_written_count(matched, pool_size, p, legacy_rng) for _ in range(4000)]
+            new = [sampling.negative_binomial(matched + 1, p, pool_size, rng) for _ in range(4000)]
+            self.assertAlmostEqual(sum(new) / len(new), sum(legacy) / len(legacy), delta=0.15)
+            self.assertLessEqual(max(new), pool_size)
+
+
+class RandomPoolTest(SimpleTestCase):
+    def test_alias_table_follows_weights(self):
+        table = sampling.AliasTable([1, 2, 7])
+        rng = np.random.default_rng(4)
+        counts = Counter(table.draw(20000, rng).tolist())
+        self.assertAlmostEqual(counts[2] / 20000, 0.7, delta=0.02)
+        self.assertAlmostEqual(counts[0] / 20000, 0.1, delta=0.02)
+
+    def test_equal_weights_skip_alias_table(self):
+        pool = sampling.RandomPool('abcd', [2, 2, 0, 2])
+        self.assertIsNone(pool.table)
+        self.assertEqual(pool.items, ('a', 'b', 'd'))
+
+    def test_sample_is_distinct_even_with_skewed_weights(self):
+        # Почти все броски таблицы попадают в пять тяжёлых — остальное добирает резервуар
+        pool = sampling.RandomPool(range(300), [10_000] * 5 + [1] * 294 + [0])
+        for seed in range(50):
+            chosen = pool.sample(10, np.random.default_rng(seed))
+            self.assertEqual(len(set(chosen)), 10)
+            self.assertTrue({0, 1, 2, 3, 4} <= set(chosen))
+            self.assertNotIn(299, chosen)
+        self.assertEqual(sorted(pool.sample(500, np.random.default_rng(0))), list(range(299)))
+
+    def test_heavier_items_are_chosen_more_often(self):
+        for size, k in ((100, 2), (10, 4)):  # таблица псевдонимов и резервуар
+            pool = sampling.RandomPool(range(size), [5] + [1] * (size - 1))
+            rng = np.random.default_rng(5)
+            counts = Counter(item for _ in range(3000) for item in pool.sample(k, rng))
+            self.assertGreater(counts[0], 1.5 * max(counts[i] for i in range(1, size)))
+
+
+class SlateTest(SimpleTestCase):
+    def test_article_slate_keeps_matched_and_is_reproducible(self):
+        pool = sampling.RandomPool(range(100, 200))
+        first = sampling.article_slate([1, 2, 3], pool, 3, np.random.default_rng(6))
+        self.assertEqual(first, sampling.article_slate([1, 2, 3], pool, 3, np.random.default_rng(6)))
+        self.assertTrue({1, 2, 3} <= set(first))
+        self.assertEqual(len(first), len(set(first)))
+        self.assertEqual(sorted(sampling.article_slate([1], pool, 0, np.random.default_rng(6))), [1])
+        self.assertEqual(len(sampling.article_slate([1], pool, 10, np.random.default_rng(6))), 101)
+
+    def test_written_slate(self):
+        pool = sampling.RandomPool(range(100, 110))
+        slate = sampling.written_slate([1, 2], pool, 5, np.random.default_rng(7))
+        self.assertEqual(slate[:2], [1, 2])
+        self.assertTrue(set(slate[2:]) <= set(range(100, 110)))
+        self.assertEqual(sampling.written_slate([1, 2], pool, 0, np.random.default_rng(7)), [1, 2])
@@ -0,0 +1,79 @@
+# banners/tests/test_serving.py
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from banners import serving
+from banners.models import Banner, BannerServingRow, BannerTitle, Tag, WrittenArticle
+
+User = get_user_model()
+
+
+class ServingRowTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('u', password='pw')
+        self.t1 = Tag.objects.create(name='t1', owner=self.user)
+        self.t2 = Tag.objects.create(name='t2', owner=self.user)
+        self.banner = Banner.objects.create(title='b', description='', link_url='#', owner=self.user)
+
+    def row(self, banner=None):
+        return BannerServingRow.objects.get(banner=banner or self.banner)
+
+    def test_row_follows_tags(self):
+        self.assertEqual(self.row().tag_ids, [])
+        self.banner.tags.add(self.t2, self.t1)
+        self.assertEqual(self.row().tag_ids, sorted([self.t1.id, self.t2.id]))
+        self.banner.tags.remove(self.t1)
+        self.assertEqual(self.row().tag_ids, [self.t2.id])
+        self.banner.tags.clear()
+        self.assertEqual(self.row().tag_ids, [])
+
+    def test_row_follows_reverse_tag_links(self):
+        self.t1.banners.add(self.banner)
+        self.assertEqual(self.row().tag_ids, [self.t1.id])
+        self.t1.banners.clear()
+        self.assertEqual(self.row().tag_ids, [])
+
+        self.banner.tags.add(self.t1, self.t2)
+        self.t1.delete()
+        self.assertEqual(self.row().tag_ids, [self.t2.id])
+
+    def test_banner_without_creatives_is_a_candidate(self):
+        # Как и до таблицы выдачи: страница покажет такой баннер с его title
+        self.banner.tags.add(self.t1)
+        matched, _ = serving.written_candidates(self.user.id, [self.t1.id])
+        self.assertEqual(matched, [self.banner])
+
+        article = WrittenArticle.objects.create(title='W', description='', slug='w', owner=self.user,
+                                                content='<p>[BANNER_SLOT_1]</p>', random_tag_probability=0)
+        article.tags.add(self.t1)
+        response = self.client.get(reverse('written_article_with_banners', args=['w']))
+        self.assertContains(response, '<span class="banner-text-block_span">b</span>')
+
+    def test_banner_delete_removes_row(self):
+        BannerTitle.objects.create(banner=self.banner, text='x')
+        self.banner.delete()
+        self.assertFalse(BannerServingRow.objects.exists())
+
+    def test_candidates_in_one_query(self):
+        other = Banner.objects.create(title='o', description='', link_url='#', owner=self.user)
+        stranger = Banner.objects.create(title='s', description='', link_url='#')
+        for banner in (self.banner, other, stranger):
+            BannerTitle.objects.create(banner=banner, text=banner.title)
+        self.banner.tags.add(self.t1)
+
+        with self.assertNumQueries(1):
+            matched, rest = serving.written_candidates(self.user.id, [self.t1.id])
+            self.assertEqual([b.id for b in matched], [self.banner.id])
+            self.assertEqual([b.id for b in rest], [other.id])
+
+    def test_rebuild_restores_table(self):
+        BannerTitle.objects.create(banner=self.banner, text='x')
+        self.banner.tags.add(self.t1)
+        BannerServingRow.objects.all().delete()
+
+        call_command('rebuild_banner_serving_rows', batch_size=1, stdout=StringIO())
+        self.assertEqual(self.row().tag_ids, [self.t1.id])
@@ -0,0 +1,121 @@
+# banners/tests/test_stats.py
+from datetime import datetime, timedelta, timezone
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from banners import counters, stats
+from banners.creatives import get_arm_cache
+from banners.models import Banner, BannerImage, BannerStats, BannerTitle, CreativeStats, Language
+
+User = get_user_model()
+
+MONDAY = datetime(2024, 3, 4, 10, 30, tzinfo=timezone.utc)
+TUESDAY = MONDAY + timedelta(days=1)
+
+
+class StatsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('u', password='pw')
+        self.en = Language.objects.create(code='en', name='English')
+        self.banner = Banner.objects.create(title='B', description='', link_url='#', owner=self.user)
+        self.title = BannerTitle.objects.create(banner=self.banner, text='T', language=self.en)
+        self.plain = BannerTitle.objects.create(banner=self.banner, text='P')
+        self.image = BannerImage.objects.create(banner=self.banner, image='i.png')
+
+    def test_hits_add_up_per_hour_and_day(self):
+        with self.assertNumQueries(2):
+            stats.add_hits({('views', MONDAY, self.banner.id, self.title.id, self.image.id): 3})
+        stats.add_hits({
+            ('views', MONDAY, self.banner.id, self.title.id, self.image.id): 2,
+            ('clicks', MONDAY + timedelta(hours=2), self.banner.id, self.title.id, self.image.id): 1,
+            ('views', MONDAY, self.banner.id, self.plain.id, None): 4,
+        })
+
+        hour = BannerStats.objects.get(period='hour', bucket=MONDAY.replace(minute=0), language_code='en')
+        self.assertEqual((hour.views, hour.clicks, hour.owner_id), (5, 0, self.user.id))
+        day = BannerStats.objects.get(period='day', language_code='en')
+        self.assertEqual(day.bucket, datetime(2024, 3, 4, tzinfo=timezone.utc))
+        self.assertEqual((day.views, day.clicks), (5, 1))
+        self.assertEqual(BannerStats.objects.get(period='day', language_code='').views, 4)
+
+        image = CreativeStats.objects.get(period='day', kind='image')
+        self.assertEqual((image.creative_id, image.banner_id, image.views, image.clicks),
+                         (self.image.id, self.banner.id, 5, 1))
+        self.assertEqual(CreativeStats.objects.get(period='day', kind='title', creative_id=self.plain.id).views, 4)
+
+    def test_deleted_rows_are_skipped(self):
+        gone = Banner.objects.create(title='gone', description='', link_url='#')
+        gone_id = gone.id
+        gone.delete()
+        title_id = self.title.id
+        self.title.delete()
+
+        stats.add_hits({
+            ('views', MONDAY, gone_id, None, None): 1,
+            ('views', MONDAY, self.banner.id, title_id, None): 2,
+        })
+        self.assertEqual(list(BannerStats.objects.values_list('banner_id', 'language_code', 'views').distinct()),
+                         [(self.banner.id, '', 2)])
+        self.assertFalse(CreativeStats.objects.exists())
+
+    def test_windowed_ctr(self):
+        stats.add_hits({
+            ('views', MONDAY, self.banner.id, self.title.id, self.image.id): 10,
+            ('clicks', MONDAY, self.banner.id, self.title.id, self.image.id): 5,
+            ('views', TUESDAY, self.banner.id, self.title.id, self.image.id): 10,
+            ('clicks', TUESDAY, self.banner.id, self.title.id, self.image.id): 1,
+        })
+        midnight = stats.bucket_start(TUESDAY, 'day')
+
+        [row] = stats.banner_ctr(since=midnight)
+        self.assertEqual((row['banner'], row['views'], row['clicks'], row['ctr']), (self.banner.id, 10, 1, 0.1))
+        [row] = stats.banner_ctr(by=('owner',), owner=self.user)
+        self.assertEqual((row['owner'], row['views'], row['clicks']), (self.user.id, 20, 6))
+
+        # Граница не на полночь — считаем по часам
+        self.assertEqual([r['views'] for r in stats.banner_ctr(since=MONDAY, until=MONDAY + timedelta(hours=1))], [10])
+
+        titles = stats.creative_ctr(since=midnight, kind='title')
+        self.assertEqual([(r['creative_id'], r['ctr']) for r in titles], [(self.title.id, 0.1)])
+
+    @override_settings(BANNER_COUNTERS={'MODE': 'buffered', 'FLUSH_INTERVAL': 0, 'MAX_PENDING': 100,
+                                        'STORE': 'counters'})
+    def test_counter_flush_writes_stats(self):
+        counters.record_impression(self.banner.id, self.title.id, self.image.id)
+        counters.record_impression(self.banner.id, self.title.id, self.image.id)
+        counters.record_click(self.banner.id, self.title.id, None)
+
+        # 5 UPDATE счётчиков и по INSERT на таблицу статистики (+ SAVEPOINT/RELEASE в TestCase)
+        with self.assertNumQueries(9):
+            counters.flush()
+        day = BannerStats.objects.get(period='day')
+        self.assertEqual((day.views, day.clicks), (2, 1))
+        self.assertEqual(CreativeStats.objects.get(period='hour', kind='title').clicks, 1)
+
+    def test_backfill_moves_untracked_counters_once(self):
+        BannerTitle.objects.filter(id=self.title.id).update(clicks=3, views=30)
+        Banner.objects.filter(id=self.banner.id).update(clicks=3, views=30)
+        stats.add_hits({('views', MONDAY, self.banner.id, self.title.id, None): 10})
+
+        stats.backfill()
+        stats.backfill()
+        [title] = stats.creative_ctr(kind='title', creative_id=self.title.id, by=('creative_id',))
+        self.assertEqual((title['views'], title['clicks']), (30, 3))
+        [banner] = stats.banner_ctr()
+        self.assertEqual((banner['views'], banner['clicks']), (30, 3))
+
+    @override_settings(BANNER_SELECTION={'STATS_WINDOW_DAYS': 7})
+    def test_bandits_read_windowed_stats(self):
+        old = stats.bucket_start(self.banner.created_at - timedelta(days=30), 'day')
+        stats.add_hits({
+            ('clicks', old, self.banner.id, self.plain.id, None): 50,
+            ('views', old, self.banner.id, self.plain.id, None): 50,
+            ('views', self.banner.created_at, self.banner.id, self.title.id, None): 4,
+        })
+        # горячие счётчики бандиту не видны
+        BannerTitle.objects.filter(id=self.plain.id).update(clicks=1000, views=1000)
+
+        get_arm_cache().clear()
+        arms = get_arm_cache().get_many([self.banner.id])[self.banner.id]
+        self.assertEqual(arms.title_stats.tolist(), [[0, 4], [0, 0]])
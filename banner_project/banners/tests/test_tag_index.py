@@ -0,0 +1,132 @@
+# banners/tests/test_tag_index.py
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from banners import invalidation, tag_index
+from banners.models import Article, Banner, Tag
+from banners.tag_index import get_tag_index
+
+
+class TagIndexTest(TestCase):
+    def setUp(self):
+        self.t1 = Tag.objects.create(name='t1')
+        self.t2 = Tag.objects.create(name='t2')
+        self.b1 = Banner.objects.create(title='b1', description='', link_url='#')
+        self.b2 = Banner.objects.create(title='b2', description='', link_url='#')
+        self.b3 = Banner.objects.create(title='b3', description='', link_url='#')
+        self.b1.tags.add(self.t1)
+        self.b2.tags.add(self.t1, self.t2)
+
+    def test_split(self):
+        matched, rest = get_tag_index().split({self.t2.id})
+        self.assertEqual(matched, {self.b2.id})
+        self.assertEqual(rest, {self.b1.id, self.b3.id})
+
+        matched, rest = get_tag_index().split({self.t1.id, self.t2.id})
+        self.assertEqual(matched, {self.b1.id, self.b2.id})
+        self.assertEqual(rest, {self.b3.id})
+
+    def test_cached_until_invalidated(self):
+        index = get_tag_index()
+        with self.assertNumQueries(0):
+            self.assertIs(get_tag_index(), index)
+
+        self.b3.tags.add(self.t2)
+        rebuilt = get_tag_index()
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(rebuilt.matching({self.t2.id}), {self.b2.id, self.b3.id})
+
+    def test_invalidated_by_banner_and_tag_changes(self):
+        self.b1.delete()
+        self.assertNotIn(self.b1.id, get_tag_index().banner_ids)
+
+        self.t1.delete()
+        self.assertEqual(get_tag_index().matching({self.t1.id}), set())
+
+    def test_article_query_count_does_not_grow_with_catalog(self):
+        article = Article.objects.create(title='A', description='', content_url='http://x', slug='a')
+        article.tags.add(self.t1)
+        url = reverse('article_with_banners', args=[article.slug])
+
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+
+        for i in range(10):
+            Banner.objects.create(title=f'x{i}', description='', link_url='#')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(url)
+
+        self.assertEqual(len(small), len(large))
+
+    def test_bitset_matches_sets_across_bytes(self):
+        # Тегов больше восьми — маска занимает несколько байт
+        tags = [Tag.objects.create(name=f'many{i}') for i in range(20)]
+        banners = [Banner.objects.create(title=f'm{i}', description='', link_url='#') for i in range(10)]
+        expected = {}
+        for i, banner in enumerate(banners):
+            linked = tags[i::7] + tags[i:i + 2]
+            banner.tags.add(*linked)
+            for tag in linked:
+                expected.setdefault(tag.id, set()).add(banner.id)
+
+        index = get_tag_index()
+        self.assertGreater(index.bits.shape[1], 1)
+        for query in ([tags[0].id], [tags[9].id, tags[19].id], [tags[13].id, self.t1.id], [999999]):
+            wanted = set().union(*(expected.get(tag_id, set()) for tag_id in query))
+            if self.t1.id in query:
+                wanted |= {self.b1.id, self.b2.id}
+            self.assertEqual(index.matching(query), wanted)
+            matched, rest = index.split_ids(query)
+            self.assertEqual(list(matched), sorted(wanted))
+            self.assertEqual(set(matched) | set(rest), set(index.banner_ids.tolist()))
+
+
+class IncrementalTagIndexTest(TransactionTestCase):
+    """Вне транзакции теста индекс дообновляется по журналу изменений."""
+
+    def setUp(self):
+        self.t1 = Tag.objects.create(name='t1')
+        self.b1 = Banner.objects.create(title='b1', description='', link_url='#')
+        self.b2 = Banner.objects.create(title='b2', description='', link_url='#')
+        self.b1.tags.add(self.t1)
+        self.index = get_tag_index()
+        self.assertTrue(self.index.clean)
+
+    def tearDown(self):
+        # Таблицы очищены мимо сигналов — следующий тест перестраивает индекс с нуля
+        tag_index.invalidate()
+
+    def test_link_changes_reread_only_changed_banners(self):
+        t2 = Tag.objects.create(name='t2')
+        self.b2.tags.add(self.t1, t2)
+        with self.assertNumQueries(2):
+            index = get_tag_index()
+        self.assertEqual(index.built_at, self.index.built_at)
+        self.assertEqual(index.matching({self.t1.id}), {self.b1.id, self.b2.id})
+        self.assertEqual(index.matching({t2.id}), {self.b2.id})
+
+        self.t1.banners.clear()
+        self.assertEqual(get_tag_index().matching({self.t1.id}), set())
+
+    def test_new_and_deleted_banners(self):
+        b3 = Banner.objects.create(title='b3', description='', link_url='#')
+        b3.tags.add(self.t1)
+        self.b1.delete()
+        index = get_tag_index()
+        self.assertEqual(index.banner_ids.tolist(), [self.b2.id, b3.id])
+        self.assertEqual(index.matching({self.t1.id}), {b3.id})
+        self.assertEqual(index.built_at, self.index.built_at)
+
+    def test_tag_delete_clears_bits(self):
+        self.t1.delete()
+        self.assertEqual(get_tag_index().matching({self.t1.id}), set())
+
+    def test_full_rebuild_without_journal(self):
+        tag_index.invalidate()
+        self.assertIsNone(invalidation.changes_since(tag_index.VERSION_NAME, self.index.version,
+                                                     invalidation.get_version(tag_index.VERSION_NAME)))
+        self.assertGreater(get_tag_index().built_at, self.index.built_at)
@@ -0,0 +1,67 @@
+# banners/tests/test_timers.py
+import re
+
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from banners.models import Banner, BannerImage, BannerTitle, Tag, WrittenArticle
+from banners.timers import hashed_minutes
+
+User = get_user_model()
+
+TIMER_RE = re.compile(r'banner-slot_timer">(\d+) ')
+
+
+class HashedMinutesTest(SimpleTestCase):
+    def test_stable_and_in_range(self):
+        values = [hashed_minutes('visitor-a', banner_id) for banner_id in range(200)]
+        self.assertEqual(values, [hashed_minutes('visitor-a', banner_id) for banner_id in range(200)])
+        self.assertTrue(all(10 <= v <= 59 for v in values))
+        # разные посетители видят разные минуты
+        self.assertNotEqual(values, [hashed_minutes('visitor-b', banner_id) for banner_id in range(200)])
+
+
+class TimerModesTest(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('u1', password='pw')
+        tag = Tag.objects.create(name='tag1', owner=owner)
+        banner = Banner.objects.create(title='B1', description='', link_url='/ok1/', owner=owner)
+        banner.tags.add(tag)
+        BannerTitle.objects.create(banner=banner, text='T1')
+        BannerImage.objects.create(banner=banner, image='i1.png')
+        article = WrittenArticle.objects.create(
+            title='WA', description='', slug='wa1', content='<p>a[BANNER_SLOT_1]b</p>', owner=owner,
+        )
+        article.tags.add(tag)
+        self.url = reverse('written_article_with_banners', args=['wa1'])
+
+    def minutes(self, resp):
+        return TIMER_RE.findall(resp.content.decode())
+
+    @override_settings(BANNER_TIMERS={'MODE': 'cookie'})
+    def test_cookie_mode_is_stateless_and_stable(self):
+        first = self.client.get(self.url)
+        self.assertIn('banner_visitor', first.cookies)
+        self.assertNotIn('sessionid', first.cookies)
+        self.assertIn('Cookie', first['Vary'])
+
+        second = self.client.get(self.url)
+        self.assertNotIn('banner_visitor', second.cookies)
+        self.assertEqual(self.minutes(first), self.minutes(second))
+        self.assertEqual(Session.objects.count(), 0)
+
+    @override_settings(BANNER_TIMERS={'MODE': 'cookie'})
+    def test_cookie_mode_replaces_malformed_visitor(self):
+        self.client.cookies['banner_visitor'] = 'bad id'
+        resp = self.client.get(self.url)
+        self.assertNotEqual(resp.cookies['banner_visitor'].value, 'bad id')
+
+    @override_settings(BANNER_TIMERS={'MODE': 'session'})
+    def test_session_mode_keeps_timers_in_session(self):
+        first = self.client.get(self.url)
+        self.assertIn('sessionid', first.cookies)
+        second = self.client.get(self.url)
+        self.assertEqual(self.minutes(first), self.minutes(second))
+        self.assertEqual(len(self.client.session['banner_timers']), 1)
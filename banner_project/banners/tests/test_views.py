@@ -1,5 +1,7 @@
 # banners/tests/test_views.py
-from django.test import TestCase, Client
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.utils import timezone
@@ -8,6 +10,8 @@ from ..models import (
     Tag, Vertical, Article, WrittenArticle, Language
 )
 
+from ..click_tokens import click_url
+
 User = get_user_model()
 
 
@@ -115,3 +119,39 @@ class ViewsTest(TestCase):
         # ни один баннер не должен быть у u2.owner=u2,
         # а у статьи нет тегов у баннеров u2 → список пуст
         self.assertFalse(resp.context['remaining_banners'])
+
+    def test_banner_redirect_token_needs_no_reads(self):
+        title = self.banner1.titles.first()
+        url = click_url(self.banner1, title, None)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(resp['Location'], '/ok1/')
+        self.assertFalse(any(q['sql'].startswith('SELECT') for q in ctx.captured_queries))
+
+        self.banner1.refresh_from_db()
+        title.refresh_from_db()
+        self.assertEqual((self.banner1.clicks, title.clicks), (1, 1))
+
+    def test_banner_redirect_token_rejects_tampering(self):
+        url = click_url(self.banner1)
+        resp = self.client.get(url.replace('/go/', '/go/x'))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_expired_click_token_redirects_without_counting(self):
+        url = click_url(self.banner1)
+        with override_settings(BANNER_CLICK_TOKENS={'MAX_AGE': -1}):
+            resp = self.client.get(url)
+        self.assertEqual((resp.status_code, resp['Location']), (302, '/ok1/'))
+        self.banner1.refresh_from_db()
+        self.assertEqual(self.banner1.clicks, 0)
+
+        # Подпись адреса проверяется и у просроченного токена
+        with override_settings(BANNER_CLICK_TOKENS={'MAX_AGE': -1}):
+            resp = self.client.get(url.replace('/go/', '/go/x'))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_pages_link_through_click_tokens(self):
+        resp = self.client.get(reverse('written_article_with_banners', args=[self.written.slug]))
+        self.assertIn('href="/go/', resp.content.decode())
+        self.assertNotIn('/go/?banner_id', resp.content.decode())
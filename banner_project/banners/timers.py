@@ -0,0 +1,111 @@
+# banners/timers.py
+"""
+Подпись «N минут назад» у баннеров написанных статей.
+
+Режим ``session`` — как раньше: случайные минуты запоминаются в сессии, то
+есть запись в ``django_session`` на каждый просмотр. Режим ``cookie`` ничего
+не хранит на сервере: минуты — это HMAC от id посетителя (случайная строка в
+cookie) и id баннера, поэтому они стабильны между запросами, а анонимный
+трафик статей не трогает таблицу сессий. Cookie ставится только при первом
+визите.
+"""
+import hashlib
+import hmac
+import random
+import re
+import secrets
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.encoding import force_bytes
+
+SESSION_KEY = 'banner_timers'
+
+MIN_MINUTES = 10
+MAX_MINUTES = 59
+
+DEFAULTS = {
+    'MODE': 'cookie',
+    'COOKIE_NAME': 'banner_visitor',
+    'COOKIE_MAX_AGE': 365 * 24 * 3600,
+}
+
+VISITOR_RE = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+def get_config():
+    conf = dict(DEFAULTS)
+    conf.update(getattr(settings, 'BANNER_TIMERS', {}))
+    return conf
+
+
+def hashed_minutes(visitor_id, banner_id):
+    """Минуты для пары посетитель/баннер: одни и те же при каждом вызове."""
+    key = force_bytes(settings.SECRET_KEY + 'banners.timers')
+    digest = hmac.new(key, f'{visitor_id}:{banner_id}'.encode(), hashlib.sha256).digest()
+    return MIN_MINUTES + int.from_bytes(digest[:8], 'big') % (MAX_MINUTES - MIN_MINUTES + 1)
+
+
+def _session_minutes(banners, timers):
+    # Для каждого баннера берём minutes из сессии или генерим новый
+    minutes = {}
+    for banner in banners:
+        key = str(banner.id)
+        if key not in timers:
+            timers[key] = random.randint(MIN_MINUTES, MAX_MINUTES)
+        minutes[banner.id] = timers[key]
+    return minutes
+
+
+def _visitor_id(request, conf):
+    visitor_id = getattr(request, '_banner_visitor', None)
+    if visitor_id is None:
+        visitor_id = request.COOKIES.get(conf['COOKIE_NAME'], '')
+        if not VISITOR_RE.match(visitor_id):
+            visitor_id = secrets.token_urlsafe(16)
+            request._banner_visitor_is_new = True
+        request._banner_visitor = visitor_id
+    return visitor_id
+
+
+def _cookie_minutes(request, banners, conf):
+    visitor_id = _visitor_id(request, conf)
+    return {banner.id: hashed_minutes(visitor_id, banner.id) for banner in banners}
+
+
+def banner_minutes(request, banners):
+    """``{banner_id: минуты}`` для баннеров страницы."""
+    conf = get_config()
+    if conf['MODE'] == 'cookie':
+        return _cookie_minutes(request, banners, conf)
+
+    timers = request.session.get(SESSION_KEY, {})
+    minutes = _session_minutes(banners, timers)
+    request.session[SESSION_KEY] = timers
+    return minutes
+
+
+async def abanner_minutes(request, banners):
+    conf = get_config()
+    if conf['MODE'] == 'cookie':
+        return _cookie_minutes(request, banners, conf)
+
+    timers = await request.session.aget(SESSION_KEY, {})
+    minutes = _session_minutes(banners, timers)
+    await request.session.aset(SESSION_KEY, timers)
+    return minutes
+
+
+def remember_visitor(request, response):
+    """Ставит cookie нового посетителя; ответ зависит от cookie — добавляем Vary."""
+    conf = get_config()
+    if conf['MODE'] != 'cookie':
+        return response
+    patch_vary_headers(response, ('Cookie',))
+    if getattr(request, '_banner_visitor_is_new', False):
+        response.set_cookie(
+            conf['COOKIE_NAME'], request._banner_visitor,
+            max_age=conf['COOKIE_MAX_AGE'], httponly=True, samesite='Lax',
+            secure=settings.SESSION_COOKIE_SECURE,
+        )
+    return response
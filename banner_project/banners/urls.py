@@ -1,5 +1,13 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+
+from . import views as sync_views
+
+if settings.BANNER_ASYNC_VIEWS:
+    # Под ASGI горячие страницы обслуживают асинхронные версии
+    from . import async_views as views
+else:
+    views = sync_views
 
 
 urlpatterns = [
@@ -7,6 +15,9 @@ urlpatterns = [
     path('written-article/<slug:slug>/', views.written_article_with_banners, name='written_article_with_banners'),
     path('get_tags_by_verticals/', views.get_tags_by_verticals, name='get_tags_by_verticals'),
     path('go/', views.banner_redirect, name='banner_redirect'),
+    path('go/<str:token>/', views.banner_redirect_token, name='banner_redirect_token'),
+    path('feed/', views.homepage_feed, name='homepage_feed'),
     path('', views.homepage, name='home_page'),
+    path('internal/metrics/', views.banner_metrics, name='banner_metrics'),
 
 ]
\ No newline at end of file
@@ -1,41 +1,73 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.core import signing
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
 from .models import Article, Banner, BannerImage, BannerTitle, Vertical, Tag, WrittenArticle
 from django.shortcuts import redirect, get_object_or_404
 import random
 from django.utils.safestring import mark_safe
 
+from . import counters, metrics, profiling, render_cache, sampling, serving, timers
+from .query_budget import query_budget
+from .click_tokens import click_url, read_token
+from .creatives import resolve_creatives
+from .feed import feed_page
+from .layout import render_layout, slot_count
+from .renditions import picture_html
+from .tag_index import get_tag_index
 
+
+# Бюджеты запросов — на холодный кэш воркера при продовых настройках
+# счётчиков и таймеров (см. banners/query_budget.py)
+@query_budget(queries=3)
 def homepage(request):
-    items = []
-    for banner in Banner.objects.all():
-        for image in banner.images.all():
-            for title in banner.titles.all():
-                items.append({
-                    'image_url': image.image.url,
-                    'title': title.text,
-                    'ad_link': f"/go/?banner_id={banner.id}&banner_image_id={image.id}&banner_title_id={title.id}"
-                })
-    random.shuffle(items)
-    return render(request, 'banners/homepage.html', {'banner_items': items})
+    items, next_cursor = feed_page()
+    return render(request, 'banners/homepage.html', {
+        'banner_items': items,
+        'next_cursor': next_cursor,
+    })
+
 
+@query_budget(queries=3)
+def homepage_feed(request):
+    # Следующая страница ленты главной по курсору
+    items, next_cursor = feed_page(request.GET.get('cursor'))
+    return JsonResponse({'items': items, 'next_cursor': next_cursor})
 
+
+@query_budget(queries=3)
 def banner_redirect(request):
-    banner_id = request.GET.get('banner_id')
+    # Совместимость со старыми ссылками /go/?banner_id=…: проверяем объекты в базе
     title_id = request.GET.get('banner_title_id')
     image_id = request.GET.get('banner_image_id')
 
-    if banner_id:
-        get_object_or_404(Banner, id=banner_id).increment_clicks()
-    if title_id:
-        get_object_or_404(BannerTitle, id=title_id).increment_clicks()
-    if image_id:
-        get_object_or_404(BannerImage, id=image_id).increment_clicks()
+    banner = get_object_or_404(Banner, id=request.GET.get('banner_id'))
+    title = get_object_or_404(BannerTitle, id=title_id) if title_id else None
+    image = get_object_or_404(BannerImage, id=image_id) if image_id else None
 
-    banner = get_object_or_404(Banner, id=banner_id)
+    counters.record_click(banner.id, title.id if title else None, image.id if image else None)
     return redirect(banner.link_url)
 
 
+@query_budget(queries=0)
+def banner_redirect_token(request, token):
+    # Всё нужное лежит в подписанном токене — в базу не ходим
+    try:
+        banner_id, title_id, image_id, destination = read_token(token)
+    except signing.BadSignature:
+        raise Http404('Некорректная ссылка')
+    if banner_id:
+        counters.record_click(banner_id, title_id, image_id)
+    return HttpResponseRedirect(destination)
+
+
+def banner_metrics(request):
+    # Внутренний адрес для Prometheus: снаружи выглядит как несуществующая страница
+    if not metrics.allowed(request):
+        raise Http404
+    return HttpResponse(metrics.collect(), content_type=metrics.CONTENT_TYPE)
+
+
+@query_budget(queries=1)
 def get_tags_by_verticals(request):
     # Получаем список выбранных вертикалей
     vertical_ids = request.GET.getlist('verticals')
@@ -48,186 +80,205 @@ def get_tags_by_verticals(request):
     return JsonResponse({'selected_tags': selected_tags})
 
 
-def article_with_banners(request, slug):
-    article = get_object_or_404(Article, slug=slug)
-    article_tags = set(article.tags.all())
+def _article_pool(article, article_tag_ids):
+    # Делим каталог битовой маской тегов статьи — без запроса на каждый баннер
+    matched_ids, random_ids = get_tag_index().split_ids(article_tag_ids)
 
-    # Группируем баннеры
-    matched_banners = []
-    random_banners = []
+    # Случайный добор возможен только при ненулевой вероятности
+    pool_ids = matched_ids + random_ids if article.random_tag_probability > 0 else matched_ids
+    return matched_ids, random_ids, pool_ids
 
-    for banner in Banner.objects.all():
-        banner_tags = set(banner.tags.all())
-        if banner_tags & article_tags:
-            matched_banners.append(banner)
-        else:
-            random_banners.append(banner)
 
-    # Контроль рандомности
-    randomness_ratio = article.random_tag_probability / 10
+def _article_shell(article, matched_ids, random_ids, banners):
+    return {
+        'article': article,
+        'matched_banners': [banners[banner_id] for banner_id in matched_ids if banner_id in banners],
+        # Пул добора с таблицей весов строится один раз на оболочку
+        'random_pool': sampling.banner_pool(banners[banner_id] for banner_id in random_ids if banner_id in banners),
+    }
 
-    final_banners = list(matched_banners)
 
-    # Добавляем случайные баннеры по вероятности
-    for banner in random_banners:
-        if random.random() < randomness_ratio:
-            final_banners.append(banner)
+def _build_article_shell(slug):
+    article = get_object_or_404(Article, slug=slug)
+    article_tag_ids = set(article.tags.values_list('id', flat=True))
+    matched_ids, random_ids, pool_ids = _article_pool(article, article_tag_ids)
+    return _article_shell(article, matched_ids, random_ids, Banner.objects.in_bulk(pool_ids))
 
-    # Убираем дубли (если вдруг)
-    final_banners = list(set(final_banners))
 
-    # Перемешиваем порядок
-    random.shuffle(final_banners)
+def _pick_article_banners(shell):
+    # Все подходящие плюс случайные по вероятности, перемешанные — за O(k)
+    return sampling.article_slate(shell['matched_banners'], shell['random_pool'],
+                                  shell['article'].random_tag_probability)
 
-    # Готовим к отображению
-    banners_with_variants = []
-    for banner in final_banners:
-        image = banner.get_best_or_random_image()
-        title = banner.get_best_or_random_title()
-
-        banner.increment_views()
-        if image:
-            image.increment_views()
-        if title:
-            title.increment_views()
 
+def _article_items(final_banners, creatives):
+    """Готовит баннеры к отображению. Возвращает ``(items, impressions)``."""
+    banners_with_variants = []
+    impressions = []
+    for banner, (image, title) in zip(final_banners, creatives):
+        impressions.append((banner.id, title.id if title else None, image.id if image else None))
         banners_with_variants.append({
             'banner': banner,
             'image': image,
             'title': title,
-            'ad_link': f"/go/?banner_id={banner.id}&banner_title_id={title.id if title else ''}&banner_image_id={image.id if image else ''}"
+            'ad_link': click_url(banner, title, image),
         })
+    return banners_with_variants, impressions
 
-    if request.GET.get('banner_title_id'):
-        title = get_object_or_404(BannerTitle, id=request.GET['banner_title_id'])
-        title.increment_clicks()
 
-    if request.GET.get('banner_image_id'):
-        image = get_object_or_404(BannerImage, id=request.GET['banner_image_id'])
-        image.increment_clicks()
-
-    if request.GET.get('banner_id'):
-        banner = get_object_or_404(Banner, id=request.GET['banner_id'])
-        banner.increment_clicks()
+@query_budget(queries=8)
+def article_with_banners(request, slug):
+    with profiling.phase('shell'):
+        shell = render_cache.get_or_build('article', slug, _build_article_shell)
+    with profiling.phase('candidates'):
+        final_banners = _pick_article_banners(shell)
+    with profiling.phase('creatives'):
+        banners_with_variants, impressions = _article_items(final_banners, resolve_creatives(final_banners))
+    with profiling.phase('counters'):
+        for impression in impressions:
+            counters.record_impression(*impression)
+
+    # Старые ссылки с кликом прямо на страницу статьи
+    click_banner_id = request.GET.get('banner_id')
+    click_title_id = request.GET.get('banner_title_id')
+    click_image_id = request.GET.get('banner_image_id')
+    if click_banner_id or click_title_id or click_image_id:
+        title = get_object_or_404(BannerTitle, id=click_title_id) if click_title_id else None
+        image = get_object_or_404(BannerImage, id=click_image_id) if click_image_id else None
+        if click_banner_id:
+            click_banner_id = get_object_or_404(Banner, id=click_banner_id).id
+        else:
+            click_banner_id = (title or image).banner_id
+        counters.record_click(click_banner_id, title.id if title else None, image.id if image else None)
 
-    print(matched_banners, random_banners)
-    print(final_banners)
-    return render(request, 'banners/article_with_banners.html', {
-        'article': article,
-        'banners': banners_with_variants,
-    })
+    with profiling.phase('render'):
+        return render(request, 'banners/article_with_banners.html', {
+            'article': shell['article'],
+            'banners': banners_with_variants,
+        })
 
 
-def written_article_with_banners(request, slug):
-    article = get_object_or_404(WrittenArticle, slug=slug)
-    article_tags = set(article.tags.all())
+def _written_shell(article, matched_banners, random_banners):
     time_phrases = {
         'ru': 'минут назад',
         'en': 'minutes ago',
     }
     lang_code = article.language.code if article.language else 'en'
-    label = time_phrases.get(lang_code, 'minutes ago')
 
     related_phrases = {
         'ru': 'Читайте также',
         'en': 'Read more',
     }
-    related_label = related_phrases.get(lang_code, 'Read more')
-
-    user_banners = Banner.objects.filter(owner=article.owner)
 
-    # Собираем баннеры
-    matched_banners = list(user_banners.filter(tags__in=article_tags).distinct())
-    random_banners = list(user_banners.exclude(tags__in=article_tags))
-
-    randomness_ratio = article.random_tag_probability / 10
+    return {
+        'article': article,
+        'label': time_phrases.get(lang_code, 'minutes ago'),
+        'related_label': related_phrases.get(lang_code, 'Read more'),
+        # Разметка слотов уже посчитана при сохранении статьи
+        'layout': article.get_layout(),
+        'matched_banners': matched_banners,
+        'random_pool': sampling.banner_pool(random_banners),
+    }
 
-    # Миксуем баннеры по вероятности
-    final_banners = []
 
-    while matched_banners or random_banners:
-        if random.random() < randomness_ratio and random_banners:
-            final_banners.append(random_banners.pop(0))
-        elif matched_banners:
-            final_banners.append(matched_banners.pop(0))
-        else:
-            break
+def _build_written_article_shell(slug):
+    article = get_object_or_404(WrittenArticle.objects.select_related('language'), slug=slug)
+    article_tag_ids = article.tags.values_list('id', flat=True)
+    # Кандидаты владельца — одним проходом по индексу таблицы выдачи
+    matched_banners, random_banners = serving.written_candidates(article.owner_id, article_tag_ids)
+    return _written_shell(article, matched_banners, random_banners)
 
-    # Разбираем контент
-    content = article.content
-    slot_counter = 1
-    banners_used = []
 
-    timers = request.session.get('banner_timers', {})
+def _mix_written_banners(shell):
+    # Все подходящие и случайные столько, сколько добрал бы прежний цикл
+    # «с вероятностью случайный, иначе подходящий»; новый список, кэш не трогаем
+    return sampling.written_slate(shell['matched_banners'], shell['random_pool'],
+                                  shell['article'].random_tag_probability)
 
-    # Для каждого баннера проставляем minutes из сессии или генерим новый
-    for banner in final_banners:
-        key = str(banner.id)
-        if key not in timers:
-            timers[key] = random.randint(10, 59)
-        banner.random_minutes = timers[key]
 
-    random.shuffle(final_banners)
+def _written_page(shell, final_banners, minutes, creatives):
+    """
+    Собирает текст со слотами и список баннеров под статьёй.
+    Возвращает ``(content, remaining_banners, impressions)``.
+    """
+    label = shell['label']
+    layout = shell['layout']
+    creatives = dict(zip((banner.id for banner in final_banners), creatives))
+    impressions = []
 
-    while f"[BANNER_SLOT_{slot_counter}]" in content and final_banners:
-        banner = final_banners.pop(0)
-        banners_used.append(banner)
+    slot_banners = final_banners[:slot_count(layout)]
+    final_banners = final_banners[len(slot_banners):]
 
-        image = banner.get_best_or_random_image()
-        title = banner.get_title_for_language(article.language)
+    fragments = {}
+    for slot_number, banner in enumerate(slot_banners, start=1):
+        image, title = creatives[banner.id]
+        impressions.append((banner.id, title.id if title else None, image.id if image else None))
 
-        banner.increment_views()
-        if image:
-            image.increment_views()
-        if title:
-            title.increment_views()
-
-        banner_html = f"""
+        fragments[slot_number] = f"""
             <div class="banner-slot-in-text">
-                <a class="banner-slot-in-text_a" href="/go/?banner_id={banner.id}&banner_title_id={title.id if title else ''}&banner_image_id={image.id if image else ''}">
+                <a class="banner-slot-in-text_a" href="{click_url(banner, title, image)}">
                     <div class="banner-slot-in-text_img_wrapper">
-                        <img src="{image.image.url if image else ''}" alt="{banner.title}">
+                        {picture_html(image, banner.title, '150px')}
                     </div>
                     <div class="banner-text-block">
                         <span class="banner-text-block_span">{title.text if title else banner.title}</span>
-                        <span class="banner-slot_timer">{banner.random_minutes} {time_phrases[lang_code]}</span>
+                        <span class="banner-slot_timer">{minutes[banner.id]} {label}</span>
                     </div>
                 </a>
             </div>
         """
-        content = content.replace(f"[BANNER_SLOT_{slot_counter}]", banner_html, 1)
-        slot_counter += 1
+
+    content = render_layout(layout, fragments)
 
     # Остаток баннеров — под статьёй
     remaining_banners = []
 
     for banner in final_banners:
-        image = banner.get_best_or_random_image()
-        title = banner.get_title_for_language(article.language)
-
-        banner.increment_views()
-        if image:
-            image.increment_views()
-        if title:
-            title.increment_views()
+        image, title = creatives[banner.id]
+        impressions.append((banner.id, title.id if title else None, image.id if image else None))
 
         remaining_banners.append({
             'banner': banner,
             'image': image,
             'title': title,
-            'ad_link': f"/go/?banner_id={banner.id}&banner_title_id={title.id if title else ''}&banner_image_id={image.id if image else ''}",
-            'minutes': banner.random_minutes,
-            'lang_code': lang_code,
-            'time_phrases': time_phrases
+            'ad_link': click_url(banner, title, image),
+            'minutes': minutes[banner.id],
         })
     random.shuffle(remaining_banners)
+    return content, remaining_banners, impressions
 
-    request.session['banner_timers'] = timers
 
-    return render(request, 'banners/written_article_with_banners.html', {
-        'article': article,
+def _written_context(shell, content, remaining_banners):
+    return {
+        'article': shell['article'],
         'content': mark_safe(content),
         'remaining_banners': remaining_banners,
-        'minutes_ago_label': label,
-        'related_label': related_label,
-    })
\ No newline at end of file
+        'minutes_ago_label': shell['label'],
+        'related_label': shell['related_label'],
+    }
+
+
+@query_budget(queries=6)
+def written_article_with_banners(request, slug):
+    with profiling.phase('shell'):
+        shell = render_cache.get_or_build('written_article', slug, _build_written_article_shell)
+    with profiling.phase('candidates'):
+        final_banners = _mix_written_banners(shell)
+    with profiling.phase('timers'):
+        minutes = timers.banner_minutes(request, final_banners)
+
+    random.shuffle(final_banners)
+
+    # Креативы для всех баннеров страницы — одним проходом
+    with profiling.phase('creatives'):
+        creatives = resolve_creatives(final_banners, shell['article'].language)
+    with profiling.phase('layout'):
+        content, remaining_banners, impressions = _written_page(shell, final_banners, minutes, creatives)
+    with profiling.phase('counters'):
+        for impression in impressions:
+            counters.record_impression(*impression)
+
+    with profiling.phase('render'):
+        response = render(request, 'banners/written_article_with_banners.html',
+                          _written_context(shell, content, remaining_banners))
+    return timers.remember_visitor(request, response)
@@ -0,0 +1,135 @@
+# banners/write_benchmark.py
+"""
+Замер записи счётчиков в SQLite несколькими процессами
+(``manage.py benchmark_sqlite_counters``).
+
+Для каждого профиля создаётся отдельная временная база (режим журнала
+хранится в файле, поэтому профили не должны делить базу), в неё
+накатываются миграции и один баннер с заголовком и картинкой. Затем
+``processes`` процессов, как воркеры gunicorn, одновременно ``seconds``
+секунд пишут просмотры через ``counters.record_impression``. Считаются
+записанные события в секунду, задержки вызова, ошибки «database is
+locked» и потерянные события (сумма ``Banner.views`` против числа успешных
+вызовов).
+
+Процессы запускаются через ``spawn`` и настраивают Django сами, поэтому
+модели здесь импортируются только внутри функций.
+"""
+import math
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+PROFILES = {
+    # Как было: журнал отката, запись на каждом просмотре из потока запроса
+    'default': {'sqlite_options': False, 'counters': {'MODE': 'sync'}},
+    # Только PRAGMA: запись по-прежнему на каждом просмотре
+    'wal': {'sqlite_options': True, 'counters': {'MODE': 'sync'}},
+    # Профиль prod.py: WAL и PRAGMA, один писатель счётчиков на процесс
+    'serving': {'sqlite_options': True, 'counters': {'MODE': 'buffered', 'FLUSH_INTERVAL': 0.5}},
+}
+
+
+def _setup(path, profile):
+    os.environ['BANNER_SQLITE_PATH'] = path
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.db import connections
+
+    conf = PROFILES[profile]
+    connections['default'].settings_dict['OPTIONS'] = (
+        dict(settings.SQLITE_SERVING_OPTIONS) if conf['sqlite_options'] else {}
+    )
+    settings.BANNER_COUNTERS = {**settings.BANNER_COUNTERS, 'STORE': 'counters', **conf['counters']}
+    # Картинка-заглушка без файла — копии для неё не нужны
+    settings.BANNER_RENDITIONS = {**settings.BANNER_RENDITIONS, 'ENABLED': False}
+
+
+def _prepare(path, profile, queue):
+    _setup(path, profile)
+    from django.core.management import call_command
+    from banners.models import Banner, BannerImage, BannerTitle
+
+    call_command('migrate', verbosity=0)
+    banner = Banner.objects.create(title='benchmark', description='', link_url='https://example.com/')
+    title = BannerTitle.objects.create(banner=banner, text='benchmark')
+    image = BannerImage.objects.create(banner=banner, image='banner_images/benchmark.png')
+    queue.put((banner.id, title.id, image.id))
+
+
+def _worker(path, profile, ids, start_at, seconds, queue):
+    _setup(path, profile)
+    from django.db import OperationalError
+    from banners import counters
+
+    ok = errors = 0
+    latencies = []
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = start_at + seconds
+    while time.time() < deadline:
+        started = time.perf_counter()
+        try:
+            counters.record_impression(*ids)
+            ok += 1
+        except OperationalError:
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+    # Остаток буфера — тем же путём, что и при остановке воркера
+    counters.get_buffer().stop()
+    queue.put({'ok': ok, 'errors': errors, 'latencies': latencies})
+
+
+def _percentile_ms(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[max(0, math.ceil(fraction * len(ordered)) - 1)] * 1000, 3)
+
+
+def _run_process(ctx, target, *args):
+    queue = ctx.Queue()
+    process = ctx.Process(target=target, args=(*args, queue))
+    process.start()
+    return process, queue
+
+
+def run_profile(profile, processes=4, seconds=5.0):
+    ctx = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'benchmark.sqlite3')
+        process, queue = _run_process(ctx, _prepare, path, profile)
+        ids = queue.get()
+        process.join()
+
+        # Запас на запуск Django в каждом процессе, чтобы все начали разом
+        start_at = time.time() + 3.0 + 0.5 * processes
+        workers = [_run_process(ctx, _worker, path, profile, ids, start_at, seconds) for _ in range(processes)]
+        results = [queue.get() for _, queue in workers]
+        for process, _ in workers:
+            process.join()
+
+        with sqlite3.connect(path) as db:
+            views = db.execute('SELECT views FROM banners_banner WHERE id = ?', (ids[0],)).fetchone()[0]
+            journal = db.execute('PRAGMA journal_mode').fetchone()[0]
+
+    ok = sum(r['ok'] for r in results)
+    latencies = [value for r in results for value in r['latencies']]
+    return {
+        'profile': profile,
+        'journal_mode': journal,
+        'processes': processes,
+        'seconds': seconds,
+        'events': ok,
+        'events_per_second': round(ok / seconds, 1),
+        'locked_errors': sum(r['errors'] for r in results),
+        'lost_events': ok - views,
+        'latency_ms': {'p50': _percentile_ms(latencies, 0.5), 'p99': _percentile_ms(latencies, 0.99),
+                       'max': _percentile_ms(latencies, 1.0)},
+    }
+
+
+def run_benchmark(profiles=tuple(PROFILES), processes=4, seconds=5.0):
+    return [run_profile(profile, processes, seconds) for profile in profiles]